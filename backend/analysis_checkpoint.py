@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Incremental Analysis Checkpoint
+Remembers what the batch analyzer has already scored: the newest saved_at/id
+watermark seen and a content hash per patient. Later runs score only new or
+changed patients and append them to a cumulative NDJSON results store, in
+which the last line for a patient id wins.
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+CHECKPOINT_VERSION = 1
+HASH_LENGTH = 16
+
+
+def content_hash(patient_data: Dict[str, Any]) -> str:
+    """Stable hash of the fields a patient is scored from (key order and spacing do not matter)"""
+    canonical = json.dumps(patient_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:HASH_LENGTH]
+
+
+def watermark_key(saved_at: Optional[str], patient_id: str) -> Tuple[str, str]:
+    # saved_at is ISO 8601, so string order is time order; the id breaks ties
+    return (saved_at or "", str(patient_id))
+
+
+class AnalysisCheckpoint:
+    """
+    Watermark and per-patient hashes for one results store, persisted as JSON
+    next to it (written atomically after the results are on disk)
+    """
+
+    def __init__(self, path: str, store_path: str):
+        self.path = path
+        self.store_path = store_path
+        self.watermark: Tuple[str, str] = ("", "")
+        self.hashes: Dict[str, str] = {}
+        self.stale_lines = 0
+        self.runs = 0
+        self.updated_at: Optional[str] = None
+
+    @classmethod
+    def load(cls, path: str, store_path: str) -> "AnalysisCheckpoint":
+        """Saved checkpoint, or an empty one (full run) when it is missing, unreadable or its store is gone"""
+        checkpoint = cls(path, store_path)
+        if not os.path.exists(path) or not os.path.exists(store_path):
+            return checkpoint
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading checkpoint, starting a full run: {e}")
+            return checkpoint
+        if data.get("version") != CHECKPOINT_VERSION:
+            return checkpoint
+        watermark = data.get("watermark") or {}
+        checkpoint.watermark = watermark_key(watermark.get("saved_at"), watermark.get("id", ""))
+        checkpoint.hashes = data.get("hashes", {})
+        checkpoint.stale_lines = data.get("stale_lines", 0)
+        checkpoint.runs = data.get("runs", 0)
+        checkpoint.updated_at = data.get("updated_at")
+        return checkpoint
+
+    def advance(self, saved_at: Optional[str], patient_id: str):
+        key = watermark_key(saved_at, patient_id)
+        if saved_at and key > self.watermark:
+            self.watermark = key
+
+    def needs_compaction(self) -> bool:
+        """More superseded lines than live ones in the store"""
+        return self.stale_lines > len(self.hashes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": CHECKPOINT_VERSION,
+            "store": os.path.basename(self.store_path),
+            "watermark": {"saved_at": self.watermark[0] or None, "id": self.watermark[1] or None},
+            "patients": len(self.hashes),
+            "stale_lines": self.stale_lines,
+            "runs": self.runs,
+            "updated_at": self.updated_at,
+            "hashes": self.hashes
+        }
+
+    def save(self):
+        self.runs += 1
+        self.updated_at = datetime.now().isoformat()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def compact_store(store_path: str, live_ids: Iterable[str]) -> int:
+    """
+    Rewrite the results store with only the latest line of each live patient
+    (two streaming passes, so only the ids are held in memory); returns the
+    number of lines kept
+    """
+    live = set(live_ids)
+    remaining = Counter()
+    with open(store_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                remaining[str(json.loads(line)["patient_id"])] += 1
+
+    kept = 0
+    tmp_path = store_path + ".tmp"
+    with open(store_path, "r", encoding="utf-8") as f, open(tmp_path, "w", encoding="utf-8") as out:
+        for line in f:
+            if not line.strip():
+                continue
+            patient_id = str(json.loads(line)["patient_id"])
+            remaining[patient_id] -= 1
+            if remaining[patient_id] == 0 and patient_id in live:
+                out.write(line)
+                kept += 1
+    os.replace(tmp_path, store_path)
+    return kept
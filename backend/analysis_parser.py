@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Analysis Output Parser
+Tolerant parsing of Gemini output and normalization of analysis records.
+Runs once when an analysis is written so readers never re-parse raw text.
+"""
+
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from instrumentation import timed
+
+SCHEMA_VERSION = 2
+
+PARSE_OK = "ok"
+PARSE_REPAIRED = "repaired"
+PARSE_FAILED = "failed"
+
+RISK_LEVELS = {"low": "Low", "moderate": "Moderate", "medium": "Moderate", "high": "High", "severe": "High"}
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+# Bare whole numbers in this range are read as 0-100 rather than 0-10
+PERCENT_SCALE = range(11, 101)
+
+
+def strip_code_fences(text: str) -> str:
+    """Return the content of the first fenced block, or the text unchanged"""
+    match = _FENCE_RE.search(text)
+    if match:
+        return match.group(1).strip()
+    # Unterminated fence (truncated response)
+    if text.lstrip().startswith("```"):
+        return re.sub(r"^\s*```(?:json|JSON)?", "", text).strip()
+    return text.strip()
+
+
+def _close_unbalanced(text: str) -> str:
+    """Close an unterminated string and any open brackets (truncated output)"""
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    repaired = text + ('"' if in_string else "")
+    # Drop a dangling key/separator before closing
+    repaired = re.sub(r'[,:]\s*$', "", repaired.rstrip())
+    return repaired + "".join(reversed(stack))
+
+
+@timed("json_parse")
+def parse_model_output(text: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Parse a model response into a dict.
+    Returns (parsed, status) where status is ok / repaired / failed.
+    """
+    if not text:
+        return {}, PARSE_FAILED
+
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, PARSE_OK
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    candidate = strip_code_fences(text)
+    start = candidate.find("{")
+    if start == -1:
+        return {}, PARSE_FAILED
+    candidate = candidate[start:]
+
+    try:
+        parsed, _ = json.JSONDecoder().raw_decode(candidate)
+        if isinstance(parsed, dict):
+            return parsed, PARSE_REPAIRED
+    except json.JSONDecodeError:
+        pass
+
+    for attempt in (_TRAILING_COMMA_RE.sub(r"\1", candidate),
+                    _TRAILING_COMMA_RE.sub(r"\1", _close_unbalanced(candidate))):
+        try:
+            parsed, _ = json.JSONDecoder().raw_decode(attempt)
+            if isinstance(parsed, dict):
+                return parsed, PARSE_REPAIRED
+        except json.JSONDecodeError:
+            continue
+
+    return {}, PARSE_FAILED
+
+
+def coerce_score(value: Any) -> Optional[float]:
+    """
+    Coerce a 0-10 risk score from the shapes the model produces:
+    6.5, "6.5", "6.5/10", "65/100", "65%", 65 (read as 0-100), "Score: 7 (High)".
+    Only an explicit "%", an "x/scale" or a bare whole number in 11-100 is
+    rescaled; anything else is clamped to [0, 10]:
+
+        10 -> 10.0    10.5 -> 10.0    11 -> 1.1    11.5 -> 10.0    100 -> 10.0    101 -> 10.0
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        score = float(value)
+    else:
+        text = str(value)
+        numbers = _NUMBER_RE.findall(text)
+        if not numbers:
+            return None
+        score = float(numbers[0])
+        if "/" in text and len(numbers) > 1:
+            scale = float(numbers[1])
+            if scale > 0:
+                return _clamp_score(score * 10.0 / scale)
+        if "%" in text:
+            return _clamp_score(score / 10.0)
+    if score.is_integer() and int(score) in PERCENT_SCALE:
+        # A 0-100 score without a unit; fractional overshoots (10.5, 11.5) are clamped instead
+        score /= 10.0
+    return _clamp_score(score)
+
+
+def _clamp_score(score: float) -> float:
+    return round(min(max(score, 0.0), 10.0), 2)
+
+
+def coerce_risk_level(value: Any, score: Optional[float] = None) -> str:
+    """Normalize a risk level to Low/Moderate/High, deriving it from the score if needed"""
+    if isinstance(value, str):
+        for word in re.findall(r"[a-zA-Z]+", value.lower()):
+            if word in RISK_LEVELS:
+                return RISK_LEVELS[word]
+    if score is not None:
+        if score <= 3.0:
+            return "Low"
+        if score <= 6.0:
+            return "Moderate"
+        return "High"
+    return "Unknown"
+
+
+def _coerce_int(value: Any, default: int = 0) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def count_interactions(drug_analysis: List[Dict[str, Any]]) -> int:
+    """Count distinct drug pairs with an interaction risk"""
+    pairs = set()
+    for drug in drug_analysis:
+        if not isinstance(drug, dict):
+            continue
+        for risk in drug.get("interaction_risks", []) or []:
+            if isinstance(risk, dict) and risk.get("drug"):
+                pairs.add(tuple(sorted((str(drug.get("name", "")).lower(), str(risk["drug"]).lower()))))
+    return len(pairs)
+
+
+def normalize_analysis_record(patient_name: str, analysis: Dict[str, Any], timestamp: Optional[str] = None,
+                              patient: Optional[Dict[str, Any]] = None, parse_status: str = PARSE_OK,
+                              extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Build the persisted analysis record with typed top-level summary fields"""
+    patient = patient or {}
+    risk_summary = analysis.get("risk_summary", {}) if isinstance(analysis.get("risk_summary"), dict) else {}
+    drug_analysis = analysis.get("drug_analysis", [])
+    if not isinstance(drug_analysis, list):
+        drug_analysis = []
+
+    score = coerce_score(risk_summary.get("overall_risk_score"))
+    age = _coerce_int(analysis.get("age", patient.get("age", 0)))
+    drug_count = len(patient.get("medications", [])) or len(drug_analysis)
+
+    record = {
+        "schema_version": SCHEMA_VERSION,
+        "patient_name": patient_name,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "risk_score": score,
+        "risk_level": coerce_risk_level(risk_summary.get("risk_level"), score),
+        "age": age,
+        "drug_count": drug_count,
+        "interaction_count": count_interactions(drug_analysis),
+        "parse_status": parse_status,
+        "analysis": analysis
+    }
+    if extra:
+        record.update(extra)
+    return record
+
+
+def normalize_legacy_record(raw_record: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize an analysis file written before schema_version 2"""
+    analysis = raw_record.get("analysis", {})
+    status = PARSE_OK
+    if isinstance(analysis, dict) and "raw_text" in analysis and "risk_summary" not in analysis:
+        analysis, status = parse_model_output(analysis["raw_text"])
+        if status == PARSE_FAILED:
+            analysis = raw_record.get("analysis", {})
+    extra = {k: v for k, v in raw_record.items() if k not in ("patient_name", "analysis", "timestamp")}
+    return normalize_analysis_record(
+        raw_record.get("patient_name", "Unknown"),
+        analysis if isinstance(analysis, dict) else {},
+        raw_record.get("timestamp"),
+        parse_status=status,
+        extra=extra
+    )
+
+
+def load_analysis_record(path: str) -> Dict[str, Any]:
+    """Load an analysis file; files from before schema_version 2 are normalized on the fly"""
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    if record.get("schema_version", 0) < SCHEMA_VERSION:
+        record = normalize_legacy_record(record)
+    return record
+
+
+def migrate_analysis_folder(folder: str = "patient_analysis_data") -> Dict[str, int]:
+    """Rewrite legacy analysis files in place with normalized records"""
+    counts = {"migrated": 0, "current": 0, "failed": 0}
+    if not os.path.exists(folder):
+        return counts
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            if not (filename.startswith("ai_analysis_") and filename.endswith(".json")):
+                continue
+            path = os.path.join(root, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                if record.get("schema_version", 0) >= SCHEMA_VERSION:
+                    counts["current"] += 1
+                    continue
+                record = normalize_legacy_record(record)
+                # Write then rename, so an interrupted migration never leaves a truncated file
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(record, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                counts["migrated"] += 1
+            except Exception as e:
+                print(f"Error migrating {path}: {e}")
+                counts["failed"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "patient_analysis_data"
+    result = migrate_analysis_folder(folder)
+    print(f"Migrated: {result['migrated']}, already current: {result['current']}, failed: {result['failed']}")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Analysis Store
+Writes analysis records into date-sharded folders and keeps an
+append-maintained SQLite manifest so listings never scan the directory
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from analysis_parser import load_analysis_record
+from instrumentation import timed
+
+ANALYSIS_FOLDER = "patient_analysis_data"
+MANIFEST_FILE = "manifest.sqlite3"
+
+SORT_COLUMNS = {
+    "created": "created_at",
+    "patient": "patient_name",
+    "size": "size",
+    "risk_score": "risk_score"
+}
+
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL UNIQUE,
+    rel_path TEXT NOT NULL,
+    patient_name TEXT,
+    created_at TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    risk_score REAL,
+    risk_level TEXT,
+    age INTEGER,
+    drug_count INTEGER,
+    interaction_count INTEGER,
+    user_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_patient ON analyses (patient_name, created_at);
+CREATE TABLE IF NOT EXISTS manifest_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Manifests whose schema this process has already created or migrated
+_initialized_manifests = set()
+_init_lock = threading.Lock()
+
+MANIFEST_COLUMNS = ["seq", "filename", "rel_path", "patient_name", "created_at", "size",
+                    "risk_score", "risk_level", "age", "drug_count", "interaction_count", "user_id"]
+
+
+def clean_patient_name(name: str) -> str:
+    """Make a patient name safe to use in a filename"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name or "Unknown").strip("._") or "Unknown"
+
+
+class AnalysisStore:
+    """Date-sharded analysis files plus a SQLite manifest of their summary fields"""
+
+    def __init__(self, folder: str = ANALYSIS_FOLDER):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_FILE)
+        self._manifest_key = os.path.abspath(self.manifest_path)
+
+    def _ensure_initialized(self):
+        if self._manifest_key not in _initialized_manifests or not os.path.exists(self.manifest_path):
+            self._initialize()
+
+    def _connect(self) -> sqlite3.Connection:
+        self._ensure_initialized()
+        conn = sqlite3.connect(self.manifest_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _initialize(self):
+        """Create and migrate the manifest once per process (again only if the file is removed)"""
+        with _init_lock:
+            if self._manifest_key in _initialized_manifests and os.path.exists(self.manifest_path):
+                return
+            os.makedirs(self.folder, exist_ok=True)
+            new_manifest = not os.path.exists(self.manifest_path)
+            with closing(sqlite3.connect(self.manifest_path, timeout=30)) as conn:
+                conn.row_factory = sqlite3.Row
+                conn.executescript(MANIFEST_SCHEMA)
+                self._migrate(conn)
+                if new_manifest:
+                    # Index files written before the manifest existed
+                    self._index_existing(conn)
+                conn.commit()
+            _initialized_manifests.add(self._manifest_key)
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Bring manifests created by older versions up to the current columns"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+        if "user_id" not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN user_id TEXT")
+        # Per-user partition: a user's entries are read through this index only
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_user ON analyses (user_id, seq)")
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    @timed("storage_save")
+    def write_analysis(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a normalized analysis record and append it to the manifest"""
+        created = _parse_timestamp(record.get("timestamp"))
+        shard = os.path.join(created.strftime("%Y"), created.strftime("%m"), created.strftime("%d"))
+        os.makedirs(os.path.join(self.folder, shard), exist_ok=True)
+        # Create the manifest first, so its initial indexing does not pick up this file too
+        self._ensure_initialized()
+
+        base = f"ai_analysis_{created.strftime('%Y%m%d_%H%M%S')}_{clean_patient_name(record.get('patient_name'))}"
+        rel_path = self._reserve_file(shard, base)
+        filename = os.path.basename(rel_path)
+        file_path = os.path.join(self.folder, rel_path)
+        tmp_path = file_path + ".tmp"  # unique: the final name is already reserved
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            for path in (tmp_path, file_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        entry = self._manifest_entry(filename, rel_path, record, os.path.getsize(file_path))
+        try:
+            with closing(self._connect()) as conn, conn:
+                entry["seq"] = self._insert(conn, entry)
+        except sqlite3.IntegrityError:
+            # A cold rebuild may have indexed this (reserved, so unique) file first
+            existing = self.get_entry(filename)
+            if not existing or existing["rel_path"] != rel_path:
+                raise
+            entry["seq"] = existing["seq"]
+        return entry
+
+    def _reserve_file(self, shard: str, base: str) -> str:
+        """
+        Claim a free filename by creating it exclusively, so two saves in the
+        same second for the same patient get different files (base, base_2, ...)
+        """
+        suffix = 1
+        while True:
+            filename = f"{base}.json" if suffix == 1 else f"{base}_{suffix}.json"
+            rel_path = os.path.join(shard, filename)
+            try:
+                with open(os.path.join(self.folder, rel_path), "x", encoding="utf-8"):
+                    return rel_path
+            except FileExistsError:
+                suffix += 1
+
+    def _manifest_entry(self, filename: str, rel_path: str, record: Dict[str, Any], size: int) -> Dict[str, Any]:
+        return {
+            "filename": filename,
+            "rel_path": rel_path,
+            "patient_name": record.get("patient_name", "Unknown"),
+            "created_at": record.get("timestamp") or datetime.now().isoformat(),
+            "size": size,
+            "risk_score": record.get("risk_score"),
+            "risk_level": record.get("risk_level"),
+            "age": record.get("age"),
+            "drug_count": record.get("drug_count"),
+            "interaction_count": record.get("interaction_count"),
+            "user_id": record.get("user_id")
+        }
+
+    def _insert(self, conn: sqlite3.Connection, entry: Dict[str, Any], replace: bool = False) -> int:
+        """Add a manifest row; a duplicate filename raises unless replace (re-indexing files) is set"""
+        columns = [c for c in MANIFEST_COLUMNS if c != "seq"]
+        cursor = conn.execute(
+            f"INSERT {'OR REPLACE ' if replace else ''}INTO analyses ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [entry.get(c) for c in columns]
+        )
+        return cursor.lastrowid
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    @timed("storage_list")
+    def list_analyses(self, page: int = 1, page_size: int = 50, sort: str = "created",
+                      order: str = "desc", patient: Optional[str] = None,
+                      user_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of manifest entries and the total count"""
+        column = SORT_COLUMNS.get(sort, "created_at")
+        direction = "ASC" if order.lower() == "asc" else "DESC"
+        conditions, params = [], []
+        if patient:
+            conditions.append("patient_name = ?")
+            params.append(patient)
+        if user_id:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with closing(self._connect()) as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM analyses {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM analyses {where} ORDER BY {column} {direction}, seq {direction} LIMIT ? OFFSET ?",
+                params + [page_size, (max(page, 1) - 1) * page_size]
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def iter_entries(self):
+        """Yield every manifest entry in write order"""
+        with closing(self._connect()) as conn:
+            for row in conn.execute("SELECT * FROM analyses ORDER BY seq"):
+                yield dict(row)
+
+    def entries_since(self, seq: int, user_id: Optional[str] = None) -> Tuple[int, List[Dict[str, Any]]]:
+        """Return (manifest generation, entries with a sequence number above seq), optionally for one user"""
+        with closing(self._connect()) as conn:
+            generation = self._get_generation(conn)
+            if user_id:
+                rows = conn.execute("SELECT * FROM analyses WHERE user_id = ? AND seq > ? ORDER BY seq",
+                                    (user_id, seq)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM analyses WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+        return generation, [dict(row) for row in rows]
+
+    def _get_generation(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM manifest_meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def get_entry(self, filename: str) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM analyses WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    @timed("storage_load")
+    def load_analysis(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Load an analysis by filename; only files known to the manifest are served"""
+        entry = self.get_entry(filename)
+        if entry is None:
+            return None
+        return load_analysis_record(os.path.join(self.folder, entry["rel_path"]))
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def iter_analysis_files(self):
+        """Yield the path of every analysis file on disk (flat and sharded), in sorted order"""
+        for root, dirs, filenames in os.walk(self.folder):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if filename.startswith("ai_analysis_") and filename.endswith(".json"):
+                    yield os.path.join(root, filename)
+
+    def entry_for_file(self, path: str) -> Dict[str, Any]:
+        """Read an analysis file and build its manifest entry"""
+        record = load_analysis_record(path)
+        return self._manifest_entry(os.path.basename(path), os.path.relpath(path, self.folder),
+                                    record, os.path.getsize(path))
+
+    def _index_existing(self, conn: sqlite3.Connection, shard: bool = False) -> int:
+        count = 0
+        for path in list(self.iter_analysis_files()):
+            try:
+                record = load_analysis_record(path)
+            except Exception as e:
+                print(f"Skipping unreadable analysis file {path}: {e}")
+                continue
+
+            if shard and os.path.normpath(os.path.dirname(path)) == os.path.normpath(self.folder):
+                created = _parse_timestamp(record.get("timestamp"))
+                shard_dir = os.path.join(self.folder, created.strftime("%Y"),
+                                         created.strftime("%m"), created.strftime("%d"))
+                os.makedirs(shard_dir, exist_ok=True)
+                new_path = os.path.join(shard_dir, os.path.basename(path))
+                os.replace(path, new_path)
+                path = new_path
+
+            rel_path = os.path.relpath(path, self.folder)
+            self._insert(conn, self._manifest_entry(os.path.basename(path), rel_path, record,
+                                                    os.path.getsize(path)), replace=True)
+            count += 1
+        conn.commit()
+        return count
+
+    def _reset(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM analyses")
+        # Readers that track sequence numbers must start over
+        conn.execute(
+            "INSERT OR REPLACE INTO manifest_meta (key, value) VALUES ('generation', ?)",
+            (str(self._get_generation(conn) + 1),)
+        )
+
+    @timed("manifest_rebuild")
+    def rebuild_manifest(self, shard: bool = False) -> int:
+        """Recreate the manifest from the files on disk, optionally moving flat files into date shards"""
+        with closing(self._connect()) as conn, conn:
+            self._reset(conn)
+            return self._index_existing(conn, shard=shard)
+
+    @timed("manifest_rebuild")
+    def replace_manifest(self, entries: List[Dict[str, Any]], keep_since: Optional[int] = None) -> int:
+        """
+        Replace the whole manifest with prebuilt entries (bulk insert).
+        Sequence numbers are assigned in list order and written back to the
+        entries; returns the new manifest generation. With keep_since, rows
+        written after that sequence number (analyses saved while the entries
+        were being built) whose file is not among the entries are kept and
+        appended after them, in the same transaction.
+        """
+        columns = [c for c in MANIFEST_COLUMNS if c != "seq"]
+        with closing(self._connect()) as conn, conn:
+            # Take the write lock now so no save lands between reading the new rows and the reset
+            conn.execute("BEGIN IMMEDIATE")
+            kept = []
+            if keep_since is not None:
+                filenames = {entry["filename"] for entry in entries}
+                kept = [dict(row) for row in conn.execute("SELECT * FROM analyses WHERE seq > ? ORDER BY seq",
+                                                          (keep_since,))
+                        if row["filename"] not in filenames]
+            self._reset(conn)
+            first_seq = (conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'analyses'").fetchone()
+                         or [0])[0] + 1
+            rows = entries + kept
+            conn.executemany(
+                f"INSERT INTO analyses (seq, {', '.join(columns)}) "
+                f"VALUES (?, {', '.join('?' for _ in columns)})",
+                ([first_seq + i] + [entry.get(c) for c in columns] for i, entry in enumerate(rows))
+            )
+            for i, entry in enumerate(entries):
+                entry["seq"] = first_seq + i
+            return self._get_generation(conn)
+
+    def last_seq(self) -> int:
+        """Highest sequence number in the manifest (0 when empty)"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM analyses").fetchone()[0]
+
+
+def _parse_timestamp(timestamp: Optional[str]) -> datetime:
+    try:
+        return datetime.fromisoformat(timestamp) if timestamp else datetime.now()
+    except ValueError:
+        return datetime.now()
+
+
+if __name__ == "__main__":
+    # python analysis_store.py [folder] [--shard]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    store = AnalysisStore(args[0] if args else ANALYSIS_FOLDER)
+    indexed = store.rebuild_manifest(shard="--shard" in sys.argv)
+    print(f"Manifest rebuilt: {indexed} analyses indexed in {store.manifest_path}")
@@ -4,12 +4,19 @@ PolyRisk AI - Analytics API
 Provides live analytics data for the dashboard
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
 import json
 import os
 from accuracy_calculator import PolyRiskAccuracyCalculator
+from analytics_state import is_valid_user_id
+from change_watcher import ChangeWatcher, SnapshotCache, etag_matches
+from single_flight import SingleFlight
+from instrumentation import instrument_fastapi, cache_ratio, queue_depth, timed
+from profiling import instrument_profiling
+from rollups import GRANULARITIES, parse_day
 
 # ==========================================================
 # ⚙️ FastAPI Configuration
@@ -23,11 +30,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-PolyRisk-Profile-Id"],
 )
 
+# Prometheus metrics at /metrics (POLYRISK_METRICS=0 disables)
+instrument_fastapi(app, "analytics_api")
+# Server-Timing / cProfile for requests sent with X-PolyRisk-Profile (or sampled)
+instrument_profiling(app, "analytics_api")
+
 # Initialize accuracy calculator
 calculator = PolyRiskAccuracyCalculator()
 
+# Snapshots are recomputed only when the analysis data or patient data changes
+watcher = ChangeWatcher([
+    calculator.analysis_folder,
+    calculator.store.manifest_path,
+    calculator.patient_data_file,
+    calculator.evaluation_file,
+])
+snapshot_cache = SnapshotCache(watcher)
+# Concurrent requests for the same snapshot share one computation (off the event loop)
+single_flight = SingleFlight()
+
+cache_ratio("analytics_snapshot", lambda: (snapshot_cache.hits, snapshot_cache.misses))
+queue_depth("analytics_single_flight_waiting", lambda: single_flight.waiting)
+queue_depth("analytics_single_flight_in_flight", single_flight.in_flight)
+
+def check_user_id(user_id: str):
+    """400 for a malformed user_id (it selects a partition, it does not authorize the caller)"""
+    if not is_valid_user_id(user_id):
+        raise HTTPException(status_code=400, detail="user_id must be 1-64 letters, digits, '_' or '-'")
+
+async def conditional_response(request: Request, key: str, builder) -> Response:
+    """Serve a cached snapshot with an ETag, or 304 if the client already has it"""
+    # this_month depends on the calendar month, not only on the data
+    cache_key = f"{key}:{datetime.now().strftime('%Y-%m')}"
+    payload, etag = await single_flight.do(cache_key, snapshot_cache.get, cache_key, builder)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    with timed("serialize"):
+        return JSONResponse(payload, headers=headers)
+
 # ==========================================================
 # 📊 Analytics Endpoints
 # ==========================================================
@@ -40,46 +84,63 @@ async def root():
     }
 
 @app.get("/api/model-accuracy")
-async def get_model_accuracy():
+async def get_model_accuracy(request: Request):
     """Get model accuracy data"""
     try:
-        accuracy_data = calculator.calculate_model_accuracy()
-        return {
-            "success": True,
-            "data": accuracy_data,
-            "timestamp": datetime.now().isoformat()
-        }
+        def build():
+            return {
+                "success": True,
+                "data": calculator.calculate_model_accuracy(),
+                "timestamp": datetime.now().isoformat()
+            }
+        return await conditional_response(request, "model-accuracy", build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating model accuracy: {str(e)}")
 
 @app.get("/api/live-analytics")
-async def get_live_analytics(user_id: str = None):
-    """Get live analytics data for dashboard"""
+async def get_live_analytics(request: Request, user_id: str = None,
+                             start: str = Query(None, alias="from"),
+                             end: str = Query(None, alias="to"),
+                             granularity: str = "month"):
+    """Get live analytics data for dashboard, optionally with a from/to range (day|week|month buckets)"""
+    # Validated before they become part of the snapshot cache key
+    check_user_id(user_id)
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    for name, value in (("from", start), ("to", end)):
+        if value is not None and parse_day(value) is None:
+            raise HTTPException(status_code=400, detail=f"'{name}' must be an ISO date (YYYY-MM-DD)")
+    start = parse_day(start).isoformat() if start else None
+    end = parse_day(end).isoformat() if end else None
     try:
-        analytics_data = calculator.get_live_analytics(user_id)
-        return {
-            "success": True,
-            "data": analytics_data,
-            "timestamp": datetime.now().isoformat()
-        }
+        def build():
+            return {
+                "success": True,
+                "data": calculator.get_live_analytics(user_id, start, end, granularity),
+                "timestamp": datetime.now().isoformat()
+            }
+        key = f"live-analytics:{user_id}:{start}:{end}:{granularity}"
+        return await conditional_response(request, key, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating analytics: {str(e)}")
 
 @app.get("/api/dashboard-metrics")
-async def get_dashboard_metrics(user_id: str = None):
+async def get_dashboard_metrics(request: Request, user_id: str = None):
     """Get comprehensive dashboard metrics"""
+    check_user_id(user_id)
     try:
-        analytics = calculator.get_live_analytics(user_id)
-        accuracy = calculator.calculate_model_accuracy()
-        
-        return {
-            "success": True,
-            "data": {
+        def build():
+            # One snapshot; it already carries the model accuracy
+            analytics = calculator.get_live_analytics(user_id)
+            accuracy = analytics["model_accuracy"]
+
+            data = {
                 "model_accuracy": accuracy,
                 "live_metrics": {
                     "total_analyses": analytics["total_analyses"],
                     "high_risk_patients": analytics["high_risk_patients"],
                     "avg_risk_score": analytics["avg_risk_score"],
+                    "risk_percentiles": analytics.get("risk_percentiles", {}),
                     "this_month": analytics["this_month"]
                 },
                 "charts": {
@@ -88,15 +149,38 @@ async def get_dashboard_metrics(user_id: str = None):
                     "monthly_trends": analytics["monthly_trends"]
                 },
                 "recent_reports": analytics["recent_reports"]
-            },
+            }
+            if "error" in analytics:
+                data["error"] = analytics["error"]  # keeps the fallback out of the snapshot cache
+            return {"success": True, "data": data, "timestamp": datetime.now().isoformat()}
+        return await conditional_response(request, f"dashboard-metrics:{user_id}", build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating dashboard metrics: {str(e)}")
+
+@app.post("/api/analytics/rebuild")
+async def rebuild_analytics():
+    """Recompute the materialized analytics from the full manifest (repair)"""
+    try:
+        # Off the event loop; concurrent rebuild requests share one run
+        result = await single_flight.do("analytics-rebuild", calculator.rebuild_analytics)
+        snapshot_cache.invalidate()
+        return {
+            "success": True,
+            "data": result,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating dashboard metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error rebuilding analytics: {str(e)}")
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "PolyRisk AI Analytics API", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "service": "PolyRisk AI Analytics API",
+        "snapshot_cache": {"hits": snapshot_cache.hits, "misses": snapshot_cache.misses},
+        "single_flight": single_flight.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
 
 # ==========================================================
 # 🚀 Run Server
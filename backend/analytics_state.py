@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Materialized Dashboard Analytics
+Keeps the dashboard aggregates up to date incrementally from the analysis
+manifest and persists them so restarts do not rescan the history
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from datetime import date, datetime
+from typing import Dict, Any, Optional
+
+from analysis_store import AnalysisStore, clean_patient_name
+from instrumentation import timed
+from rollups import RollupStore, GRANULARITIES, parse_day
+from streaming_stats import TopK, BucketCounter, QuantileSketch
+
+STATE_FILE = "analytics_state.json"
+USER_STATE_FOLDER = "analytics_users"
+# State lives next to (not inside) the analysis folder, so saving it does not
+# show up as a change to the watched analysis data
+STATE_FOLDER_SUFFIX = "_analytics"
+STATE_VERSION = 3
+RECENT_REPORTS_LIMIT = 10
+HIGH_RISK_THRESHOLD = 6.1
+# Same shape as chat session ids. A user_id scopes analytics to a partition;
+# it is not authenticated, so it must not be treated as access control
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def risk_bucket(score: float) -> str:
+    if score <= 3.0:
+        return "low"
+    if score <= 6.0:
+        return "moderate"
+    return "high"
+
+
+def age_bucket(age: int) -> Optional[str]:
+    if 60 <= age < 70:
+        return "60-70"
+    if 70 <= age < 80:
+        return "70-80"
+    if age >= 80:
+        return "80+"
+    return None
+
+
+class AnalyticsState:
+    """Mergeable dashboard aggregates built from manifest entries"""
+
+    def __init__(self):
+        self.last_seq = 0
+        self.generation = 0
+        self.total_analyses = 0
+        self.scored_analyses = 0
+        self.score_sum = 0.0
+        self.high_risk_patients = 0
+        self.risk_distribution = BucketCounter(["low", "moderate", "high"], risk_bucket)
+        self.age_groups = BucketCounter(["60-70", "70-80", "80+"], age_bucket)
+        self.score_sketch = QuantileSketch()
+        self.rollups = RollupStore()
+        self.recent_reports = TopK(RECENT_REPORTS_LIMIT, key=lambda report: report["date"])
+
+    def apply(self, entry: Dict[str, Any]):
+        """Fold one manifest entry into the aggregates"""
+        self.last_seq = max(self.last_seq, entry.get("seq") or 0)
+        self.total_analyses += 1
+
+        score = entry.get("risk_score")
+        timestamp = entry.get("created_at") or datetime.now().isoformat()
+        self.rollups.add(timestamp, score, risk_bucket(score) if score is not None else None)
+        if score is None:
+            return
+
+        self.scored_analyses += 1
+        self.score_sum += score
+        if score >= HIGH_RISK_THRESHOLD:
+            self.high_risk_patients += 1
+        self.risk_distribution.add(score)
+        self.score_sketch.add(score)
+
+        age = entry.get("age") or 0
+        self.age_groups.add(age)
+
+        self.recent_reports.push({
+            "patient": entry.get("patient_name", "Unknown"),
+            "age": age,
+            "risk_score": score,
+            "risk_level": entry.get("risk_level", "Unknown"),
+            "interactions": entry.get("interaction_count") or 0,
+            "medications": entry.get("drug_count") or 0,
+            "date": timestamp,
+            "status": "Completed"
+        })
+
+    def merge(self, other: "AnalyticsState"):
+        """Combine another partial state into this one"""
+        self.last_seq = max(self.last_seq, other.last_seq)
+        self.total_analyses += other.total_analyses
+        self.scored_analyses += other.scored_analyses
+        self.score_sum += other.score_sum
+        self.high_risk_patients += other.high_risk_patients
+        self.risk_distribution.merge(other.risk_distribution)
+        self.age_groups.merge(other.age_groups)
+        self.score_sketch.merge(other.score_sketch)
+        self.rollups.merge(other.rollups)
+        self.recent_reports.merge(other.recent_reports)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Dashboard view of the aggregates"""
+        avg_risk_score = self.score_sum / self.scored_analyses if self.scored_analyses else 0
+        return {
+            "total_analyses": self.total_analyses,
+            "high_risk_patients": self.high_risk_patients,
+            "avg_risk_score": round(avg_risk_score, 1),
+            "risk_percentiles": self.score_sketch.percentiles(),
+            "risk_distribution": self.risk_distribution.to_dict(),
+            "age_groups": self.age_groups.to_dict(),
+            "monthly_trends": [{"month": row["period"], "analyses": row["analyses"]}
+                               for row in self.rollups.series("month")],
+            "recent_reports": self.recent_reports.items(),
+            "this_month": self.rollups.count("month", datetime.now().strftime("%Y-%m"))
+        }
+
+    def range_query(self, start: Any, end: Any, granularity: str = "month") -> Dict[str, Any]:
+        """Totals and a per-bucket series for [start, end] answered from the rollups"""
+        start_day = parse_day(start) or parse_day(min(self.rollups.buckets["day"], default=None)) or date.today()
+        end_day = parse_day(end) or date.today()
+        granularity = granularity if granularity in GRANULARITIES else "month"
+        return {
+            "from": start_day.isoformat(),
+            "to": end_day.isoformat(),
+            "granularity": granularity,
+            "totals": self.rollups.totals(start_day, end_day),
+            "series": self.rollups.series(granularity, start_day, end_day)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"version": STATE_VERSION, **self.__dict__}
+        data.update({
+            "risk_distribution": self.risk_distribution.to_dict(),
+            "age_groups": self.age_groups.to_dict(),
+            "score_sketch": self.score_sketch.to_dict(),
+            "rollups": self.rollups.to_dict(),
+            "recent_reports": self.recent_reports.items()
+        })
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalyticsState":
+        state = cls()
+        if data.get("version") == STATE_VERSION:
+            for key in ("last_seq", "generation", "total_analyses", "scored_analyses",
+                        "score_sum", "high_risk_patients"):
+                if key in data:
+                    setattr(state, key, data[key])
+            state.risk_distribution.load(data.get("risk_distribution", {}))
+            state.age_groups.load(data.get("age_groups", {}))
+            state.score_sketch = QuantileSketch.from_dict(data.get("score_sketch", {}))
+            state.rollups = RollupStore.from_dict(data.get("rollups", {}))
+            state.recent_reports.extend(reversed(data.get("recent_reports", [])))
+        return state
+
+
+def state_folder(analysis_folder: str) -> str:
+    return os.getenv("POLYRISK_ANALYTICS_STATE_DIR") or os.path.normpath(analysis_folder) + STATE_FOLDER_SUFFIX
+
+
+def is_valid_user_id(user_id: Optional[str]) -> bool:
+    """True for no user_id (installation-wide) or a well-formed one"""
+    return not user_id or bool(USER_ID_PATTERN.match(user_id))
+
+
+def user_state_path(folder: str, user_id: str) -> str:
+    """Per-user state file; the hash keeps distinct ids distinct after cleaning"""
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(folder, USER_STATE_FOLDER, f"{clean_patient_name(user_id)}_{digest}.json")
+
+
+class MaterializedAnalytics:
+    """
+    AnalyticsState kept in sync with the manifest and persisted next to it.
+    With a user_id the state covers only that user's analyses (their own
+    partition of the manifest and their own state file).
+    """
+
+    def __init__(self, store: Optional[AnalysisStore] = None, user_id: Optional[str] = None):
+        self.store = store or AnalysisStore()
+        self.user_id = user_id
+        folder = state_folder(self.store.folder)
+        if user_id:
+            self.state_path = user_state_path(folder, user_id)
+            self._legacy_path = user_state_path(self.store.folder, user_id)
+        else:
+            self.state_path = os.path.join(folder, STATE_FILE)
+            self._legacy_path = os.path.join(self.store.folder, STATE_FILE)
+        self.state = self._load()
+        self._lock = threading.Lock()
+
+    @timed("state_load")
+    def _load(self) -> AnalyticsState:
+        if not os.path.exists(self.state_path) and os.path.exists(self._legacy_path):
+            # State saved inside the analysis folder by earlier versions
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            os.replace(self._legacy_path, self.state_path)
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    return AnalyticsState.from_dict(json.load(f))
+            except Exception as e:
+                print(f"Error loading analytics state, rebuilding: {e}")
+        return AnalyticsState()
+
+    @timed("state_save")
+    def _save(self):
+        folder = os.path.dirname(self.state_path)
+        os.makedirs(folder, exist_ok=True)
+        # Unique temp file: patient_api and analytics_api may save the same state at once
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.state_path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.state.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @timed("analytics_refresh")
+    def refresh(self) -> int:
+        """Apply manifest entries written since the last refresh; returns how many"""
+        with self._lock:
+            generation, rows = self.store.entries_since(self.state.last_seq, self.user_id)
+            if generation != self.state.generation:
+                # Manifest was rebuilt; sequence numbers are no longer comparable
+                self.state = AnalyticsState()
+                self.state.generation = generation
+                generation, rows = self.store.entries_since(0, self.user_id)
+            for row in rows:
+                self.state.apply(row)
+            if rows or (not os.path.exists(self.state_path) and self._should_persist()):
+                self._save()
+            return len(rows)
+
+    def _should_persist(self) -> bool:
+        # No state file for a user id that has no analyses (any caller can name one)
+        return self.user_id is None or self.state.total_analyses > 0
+
+    @timed("analytics_rebuild")
+    def rebuild(self) -> AnalyticsState:
+        """Recompute the state from the whole manifest (repair)"""
+        with self._lock:
+            generation = self.state.generation
+            self.state = AnalyticsState()
+            self.state.generation = generation
+        self.refresh()
+        with self._lock:
+            if self._should_persist():
+                self._save()
+        return self.state
+
+    def install(self, state: AnalyticsState):
+        """Replace the state with one computed elsewhere (e.g. a parallel rebuild) and persist it"""
+        with self._lock:
+            self.state = state
+            self._save()
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.refresh()
+        return self.state.snapshot()
+
+    def range_query(self, start: Any, end: Any, granularity: str = "month") -> Dict[str, Any]:
+        self.refresh()
+        return self.state.range_query(start, end, granularity)
+
+
+if __name__ == "__main__":
+    # python analytics_state.py [folder]  -> full rebuild of the persisted state
+    analytics = MaterializedAnalytics(AnalysisStore(sys.argv[1]) if len(sys.argv) > 1 else None)
+    state = analytics.rebuild()
+    print(f"Analytics state rebuilt from {state.total_analyses} analyses -> {analytics.state_path}")
@@ -2,12 +2,57 @@
 """
 PolyRisk AI - Patient Risk Analysis Script
 Analyzes patient data from patient_data.json using risk scoring criteria
+
+Usage:
+    python analyze_patients.py                                  # full report, JSON results
+    python analyze_patients.py patient_data.json --stream       # constant memory, NDJSON results
+    python analyze_patients.py patients.ndjson --output results.ndjson
+    python analyze_patients.py patients.ndjson --workers 8       # score chunks in 8 processes
+    python analyze_patients.py patients.ndjson --format parquet --quiet
+    python analyze_patients.py --incremental                    # only new / changed patients
 """
 
+import argparse
+import csv
+import io
 import json
 import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any
+from functools import partial
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from analysis_checkpoint import AnalysisCheckpoint, compact_store, content_hash
+from summary_stats import PatientSummary
+
+try:
+    import ijson
+except ImportError:  # optional; the built-in incremental parser is used instead
+    ijson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; only needed for --format parquet
+    pa = pq = None
+
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+STREAM_CHUNK_SIZE = 1 << 16
+NUMBER_CHARS = set("0123456789+-.eE")
+PROGRESS_EVERY = 10000
+CHUNK_SIZE = 2000
+WRITE_BUFFER_SIZE = 1 << 20
+INCREMENTAL_STORE = "patient_analysis_results.ndjson"
+
+OUTPUT_FORMATS = ("json", "ndjson", "csv", "parquet")
+FORMAT_EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+# Flat columns for csv / parquet: risk_analysis is spread into its own columns,
+# medications is kept as a JSON string
+RESULT_COLUMNS = ["patient_id", "patient_name", "age", "gender", "kidney_function", "liver_function",
+                  "medications", "age_risk", "kidney_risk", "liver_risk", "base_score", "risk_level",
+                  "total_medications", "polypharmacy_risk", "analysis_timestamp"]
 
 def load_patient_data(file_path: str = 'patient_data.json') -> List[Dict[str, Any]]:
     """Load patient data from JSON file"""
@@ -22,6 +67,107 @@ def load_patient_data(file_path: str = 'patient_data.json') -> List[Dict[str, An
         print(f"Error parsing JSON: {e}")
         return []
 
+class _IncrementalJsonReader:
+    """Decodes one JSON value at a time from a file, holding only a small window in memory"""
+
+    def __init__(self, f, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has been consumed so the window stays small
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character (not consumed); "" at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in JSON input")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off by the end of the window ("-1" of "-1.5e10") continues in the next chunk
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or (end < len(self.buffer) and not (is_number and self.buffer[end] in NUMBER_CHARS)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill() and self.pos >= len(self.buffer):
+                raise ValueError("Unexpected end of JSON input")
+
+    def iter_array_items(self, key: str) -> Iterator[Any]:
+        """Items of the array under a top-level key, decoded one by one"""
+        self.expect("{")
+        while self.peek() not in ("}", ""):
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            name = self.value()
+            self.expect(":")
+            if name != key:
+                # patient_data.json stores "patients" first, so nothing large is decoded here
+                self.value()
+                continue
+            self.expect("[")
+            while True:
+                char = self.peek()
+                if char == "]":
+                    return
+                if char == ",":
+                    self.pos += 1
+                    continue
+                if char == "":
+                    raise ValueError("Unexpected end of JSON input")
+                yield self.value()
+
+
+def iter_patient_records(file_path: str, raw: bool = False) -> Iterator[Any]:
+    """
+    Yield patient records one at a time from patient_data.json (parsed
+    incrementally, with ijson when installed) or from an NDJSON store.
+    raw=True leaves NDJSON lines undecoded so worker processes can parse them.
+    """
+    if file_path.endswith(NDJSON_EXTENSIONS):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line if raw else json.loads(line)
+        return
+
+    if ijson is not None:
+        with open(file_path, 'rb') as f:
+            yield from ijson.items(f, 'patients.item', use_float=True)
+        return
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        yield from _IncrementalJsonReader(f).iter_array_items('patients')
+
 def calculate_risk_score(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Calculate risk score based on age and organ function
@@ -74,145 +220,449 @@ def format_medication_list(medications: List[Dict[str, Any]]) -> str:
     
     return ", ".join([f"{med['name']} ({med['dose']} {med['frequency']})" for med in medications])
 
-def analyze_all_patients(file_path: str = 'patient_data.json') -> List[Dict[str, Any]]:
-    """Analyze all patients and generate comprehensive report"""
-    patients = load_patient_data(file_path)
+def split_record(patient_record: Dict[str, Any], position: int) -> Tuple[str, Dict[str, Any]]:
+    """(patient_id, patient_data) from a patient_data.json entry or a bare NDJSON patient"""
+    if 'data' in patient_record:
+        return patient_record.get('id', f'patient_{position}'), patient_record['data']['patient_data']
+    return patient_record.get('id', patient_record.get('patient_id', f'patient_{position}')), patient_record
+
+def analyze_record(patient_record: Dict[str, Any], position: int) -> Dict[str, Any]:
+    """Result entry for one patient record"""
+    patient_id, patient_data = split_record(patient_record, position)
+    return {
+        'patient_id': patient_id,
+        'patient_name': patient_data.get('patient_name', 'Unknown'),
+        'age': patient_data.get('age', 0),
+        'gender': patient_data.get('gender', 'Unknown'),
+        'kidney_function': patient_data.get('kidney_function', 'Unknown'),
+        'liver_function': patient_data.get('liver_function', 'Unknown'),
+        'medications': patient_data.get('medications', []),
+        'risk_analysis': calculate_risk_score(patient_data),
+        'analysis_timestamp': datetime.now().isoformat()
+    }
+
+def iter_chunks(records: Iterable[Any], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, List[Any]]]:
+    """(position of the first record, records) in input order"""
+    chunk: List[Any] = []
+    position = 1
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield position, chunk
+            position += len(chunk)
+            chunk = []
+    if chunk:
+        yield position, chunk
+
+def analyze_chunk(task: Tuple[int, List[Any]]) -> List[Dict[str, Any]]:
+    start, records = task
+    return [analyze_record(json.loads(record) if isinstance(record, str) else record, position)
+            for position, record in enumerate(records, start)]
+
+def flatten_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """One csv / parquet row (RESULT_COLUMNS) for a result entry"""
+    row = {key: result[key] for key in RESULT_COLUMNS[:6]}
+    row['patient_id'] = str(row['patient_id'])
+    row['medications'] = json.dumps(result['medications'], ensure_ascii=False)
+    row.update(result['risk_analysis'])
+    row['analysis_timestamp'] = result['analysis_timestamp']
+    return row
+
+def parquet_schema():
+    text, integer = pa.string(), pa.int64()
+    return pa.schema([('patient_id', text), ('patient_name', text), ('age', pa.float64()), ('gender', text),
+                      ('kidney_function', text), ('liver_function', text), ('medications', text),
+                      ('age_risk', integer), ('kidney_risk', integer), ('liver_risk', integer),
+                      ('base_score', integer), ('risk_level', text), ('total_medications', integer),
+                      ('polypharmacy_risk', pa.bool_()), ('analysis_timestamp', text)])
+
+def encode_chunk(results: List[Dict[str, Any]], fmt: str) -> Any:
+    """
+    Serialize a chunk of results for ResultWriter: text for json / ndjson /
+    csv, a pyarrow Table for parquet. Runs in the workers with --workers.
+    """
+    if fmt == 'ndjson':
+        return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+    if fmt == 'json':
+        # Same layout as json.dump(results, indent=2), one array item at a time
+        return ",\n".join("  " + json.dumps(result, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+                          for result in results)
+    rows = [flatten_result(result) for result in results]
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, RESULT_COLUMNS, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+    return pa.Table.from_pylist(rows, schema=parquet_schema())
+
+class ResultWriter:
+    """
+    Writes encoded chunks to the results file as they arrive (buffered), so
+    readers can consume NDJSON / CSV lines or parquet row groups incrementally
+    """
+
+    def __init__(self, path: str, fmt: str, append: bool = False):
+        if append and fmt != 'ndjson':
+            raise ValueError("Only NDJSON results can be appended to")
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+        self._parquet = None
+        self._file = None
+        if fmt == 'parquet':
+            if pq is None:
+                raise RuntimeError("--format parquet needs pyarrow (pip install pyarrow)")
+            return
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8', newline='', buffering=WRITE_BUFFER_SIZE)
+        if fmt == 'json':
+            self._file.write("[\n")
+        elif fmt == 'csv':
+            csv.writer(self._file, lineterminator="\n").writerow(RESULT_COLUMNS)
+
+    def write(self, payload: Any, count: int):
+        if not count:
+            return
+        if self.fmt == 'parquet':
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, parquet_schema())
+            self._parquet.write_table(payload)
+        else:
+            if self.fmt == 'json' and self.count:
+                self._file.write(",\n")
+            self._file.write(payload)
+        self.count += count
+
+    def close(self):
+        if self.fmt == 'parquet':
+            if self._parquet is None:
+                # Nothing written: still leave a valid, empty file behind
+                pq.write_table(parquet_schema().empty_table(), self.path)
+            else:
+                self._parquet.close()
+            return
+        if self.fmt == 'json':
+            self._file.write("\n]" if self.count else "]")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def output_format(output_file: Optional[str], fmt: Optional[str], default: str) -> str:
+    """--format if given, else from the output file extension, else default"""
+    if fmt:
+        return fmt
+    return FORMAT_EXTENSIONS.get(os.path.splitext(output_file or "")[1].lower(), default)
+
+def default_output_file(fmt: str) -> str:
+    return f"patient_analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+def score_chunk(task: Tuple[int, List[Any]], fmt: str = 'ndjson') -> Tuple[Any, int, PatientSummary]:
+    """Worker stage of the streaming pipeline: encoded results, count and summary for one chunk"""
+    summary = PatientSummary()
+    results = analyze_chunk(task)
+    for result in results:
+        summary.add_result(result)
+    return encode_chunk(results, fmt), len(results), summary
+
+def run_ordered(fn, tasks: Iterable[Any], workers: int = 1) -> Iterator[Any]:
+    """
+    fn over tasks in a process pool, yielding results in task order. At most
+    2 * workers chunks are in flight, so input is never read far ahead.
+    """
+    if workers <= 1:
+        yield from map(fn, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(fn, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def analyze_records(records: Iterable[Dict[str, Any]], workers: int = 1) -> Iterator[Dict[str, Any]]:
+    """Generator stage: patient records in, result entries out (in input order)"""
+    for results in run_ordered(analyze_chunk, iter_chunks(records), workers):
+        yield from results
+
+def throughput(count: int, elapsed: float, workers: int) -> str:
+    rate = count / elapsed if elapsed > 0 else 0.0
+    return f"{count} patients in {elapsed:.1f}s ({rate:,.0f} records/sec, {workers} worker{'s' if workers != 1 else ''})"
+
+def print_patient_report(position: int, total: int, result: Dict[str, Any], clinical_notes: str = ''):
+    print(f"{'-'*80}")
+    print(f"Patient {position}/{total} - {result['patient_name']}")
+    print(f"ID: {result['patient_id']}")
+    print(f"{'-'*80}")
     
-    if not patients:
-        print("No patient data found")
-        return []
+    # Basic patient info
+    print(f"Demographics:")
+    print(f"   - Age: {result['age']} years")
+    print(f"   - Gender: {result['gender']}")
+    print(f"   - Kidney Function: {result['kidney_function']}")
+    print(f"   - Liver Function: {result['liver_function']}")
     
-    print("\n" + "="*80)
-    print("POLYRISK AI - COMPREHENSIVE PATIENT RISK ANALYSIS")
-    print("="*80)
-    print(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Total Patients: {len(patients)}")
-    print("="*80 + "\n")
+    # Medications
+    medications = result['medications']
+    print(f"\nCurrent Medications ({len(medications)}):")
+    for j, med in enumerate(medications, 1):
+        print(f"   {j}. {med.get('name', 'Unknown')} - {med.get('dose', 'Unknown')} {med.get('frequency', 'Unknown')}")
+    
+    # Risk analysis
+    risk_analysis = result['risk_analysis']
+    print(f"\nRisk Score Analysis:")
+    print(f"   - Age Risk: {risk_analysis['age_risk']} points")
+    print(f"   - Kidney Risk: {risk_analysis['kidney_risk']} points")
+    print(f"   - Liver Risk: {risk_analysis['liver_risk']} points")
+    print(f"   - Base Score: {risk_analysis['base_score']}/10")
+    print(f"   - Risk Level: {risk_analysis['risk_level'].upper()}")
+    print(f"   - Polypharmacy Risk: {'Yes' if risk_analysis['polypharmacy_risk'] else 'No'}")
     
-    results = []
-    
-    for i, patient_record in enumerate(patients, 1):
-        patient_data = patient_record['data']['patient_data']
-        patient_id = patient_record.get('id', f'patient_{i}')
-        
-        print(f"{'-'*80}")
-        print(f"Patient {i}/{len(patients)} - {patient_data.get('patient_name', 'Unknown')}")
-        print(f"ID: {patient_id}")
-        print(f"{'-'*80}")
-        
-        # Basic patient info
-        print(f"Demographics:")
-        print(f"   - Age: {patient_data.get('age', 'Unknown')} years")
-        print(f"   - Gender: {patient_data.get('gender', 'Unknown')}")
-        print(f"   - Kidney Function: {patient_data.get('kidney_function', 'Unknown')}")
-        print(f"   - Liver Function: {patient_data.get('liver_function', 'Unknown')}")
-        
-        # Medications
-        medications = patient_data.get('medications', [])
-        print(f"\nCurrent Medications ({len(medications)}):")
-        for j, med in enumerate(medications, 1):
-            print(f"   {j}. {med.get('name', 'Unknown')} - {med.get('dose', 'Unknown')} {med.get('frequency', 'Unknown')}")
-        
-        # Risk analysis
-        risk_analysis = calculate_risk_score(patient_data)
-        
-        print(f"\nRisk Score Analysis:")
-        print(f"   - Age Risk: {risk_analysis['age_risk']} points")
-        print(f"   - Kidney Risk: {risk_analysis['kidney_risk']} points")
-        print(f"   - Liver Risk: {risk_analysis['liver_risk']} points")
-        print(f"   - Base Score: {risk_analysis['base_score']}/10")
-        print(f"   - Risk Level: {risk_analysis['risk_level'].upper()}")
-        print(f"   - Polypharmacy Risk: {'Yes' if risk_analysis['polypharmacy_risk'] else 'No'}")
-        
-        # Clinical notes
-        clinical_notes = patient_data.get('clinical_notes', '')
-        if clinical_notes:
-            print(f"\nClinical Notes:")
-            print(f"   {clinical_notes}")
-        
-        print()
-        
-        # Store results
-        results.append({
-            'patient_id': patient_id,
-            'patient_name': patient_data.get('patient_name', 'Unknown'),
-            'age': patient_data.get('age', 0),
-            'gender': patient_data.get('gender', 'Unknown'),
-            'kidney_function': patient_data.get('kidney_function', 'Unknown'),
-            'liver_function': patient_data.get('liver_function', 'Unknown'),
-            'medications': medications,
-            'risk_analysis': risk_analysis,
-            'analysis_timestamp': datetime.now().isoformat()
-        })
-    
-    # Summary statistics
+    # Clinical notes
+    if clinical_notes:
+        print(f"\nClinical Notes:")
+        print(f"   {clinical_notes}")
+    
+    print()
+
+def print_summary(summary: PatientSummary):
     print("="*80)
     print("ANALYSIS SUMMARY")
     print("="*80)
     
-    total_patients = len(results)
-    low_risk = sum(1 for r in results if r['risk_analysis']['risk_level'] == 'low')
-    moderate_risk = sum(1 for r in results if r['risk_analysis']['risk_level'] == 'moderate')
-    high_risk = sum(1 for r in results if r['risk_analysis']['risk_level'] == 'high')
-    polypharmacy_patients = sum(1 for r in results if r['risk_analysis']['polypharmacy_risk'])
+    if not summary.total:
+        print("No patients were analyzed")
+        print("="*80 + "\n")
+        return
+    risk_levels = summary.risk_levels.counts
+    low_risk, moderate_risk, high_risk = risk_levels['low'], risk_levels['moderate'], risk_levels['high']
     
-    print(f"Total Patients Analyzed: {total_patients}")
-    print(f"Low Risk (<=4 points): {low_risk} ({low_risk/total_patients*100:.1f}%)")
-    print(f"Moderate Risk (5-6 points): {moderate_risk} ({moderate_risk/total_patients*100:.1f}%)")
-    print(f"High Risk (>6 points): {high_risk} ({high_risk/total_patients*100:.1f}%)")
-    print(f"Polypharmacy Risk (5+ medications): {polypharmacy_patients} ({polypharmacy_patients/total_patients*100:.1f}%)")
+    print(f"Total Patients Analyzed: {summary.total}")
+    print(f"Low Risk (<=4 points): {low_risk} ({summary.percent(low_risk):.1f}%)")
+    print(f"Moderate Risk (5-6 points): {moderate_risk} ({summary.percent(moderate_risk):.1f}%)")
+    print(f"High Risk (>6 points): {high_risk} ({summary.percent(high_risk):.1f}%)")
+    print(f"Polypharmacy Risk (5+ medications): {summary.polypharmacy} ({summary.percent(summary.polypharmacy):.1f}%)")
     
     # Age distribution
-    age_groups = {
-        'Under 60': sum(1 for r in results if r['age'] < 60),
-        '60-69': sum(1 for r in results if 60 <= r['age'] < 70),
-        '70-79': sum(1 for r in results if 70 <= r['age'] < 80),
-        '80+': sum(1 for r in results if r['age'] >= 80)
-    }
-    
     print(f"\nAge Distribution:")
-    for group, count in age_groups.items():
+    for group, count in summary.age_groups.counts.items():
         print(f"   {group}: {count} patients")
     
     # Organ function distribution
-    kidney_impairment = sum(1 for r in results if r['kidney_function'].lower() != 'normal')
-    liver_impairment = sum(1 for r in results if r['liver_function'].lower() != 'normal')
-    
     print(f"\nOrgan Function Status:")
-    print(f"   Kidney Impairment: {kidney_impairment} patients ({kidney_impairment/total_patients*100:.1f}%)")
-    print(f"   Liver Impairment: {liver_impairment} patients ({liver_impairment/total_patients*100:.1f}%)")
+    print(f"   Kidney Impairment: {summary.kidney_impairment} patients ({summary.percent(summary.kidney_impairment):.1f}%)")
+    print(f"   Liver Impairment: {summary.liver_impairment} patients ({summary.percent(summary.liver_impairment):.1f}%)")
     
     print("="*80 + "\n")
+
+def analyze_all_patients(file_path: str = 'patient_data.json', output_file: Optional[str] = None,
+                         workers: int = 1, fmt: str = 'json', report: str = 'full') -> List[Dict[str, Any]]:
+    """
+    Analyze all patients and generate comprehensive report.
+    report: 'full' (per-patient reports and summary), 'summary' or 'none'.
+    """
+    patients = load_patient_data(file_path)
+    
+    if not patients:
+        print("No patient data found")
+        return []
+    
+    start = time.perf_counter()
+    results = list(analyze_records(patients, workers))
+    elapsed = time.perf_counter() - start
+    summary = PatientSummary()
+    for result in results:
+        summary.add_result(result)
+    
+    if report == 'full':
+        print_full_report(patients, results)
+    if report != 'none':
+        print_summary(summary)
+        print(f"Scored {throughput(len(results), elapsed, workers)}")
     
     # Save results to file
-    output_file = f"patient_analysis_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output_file = output_file or default_output_file(fmt)
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
-        print(f"Results saved to: {output_file}")
+        with ResultWriter(output_file, fmt) as writer:
+            for position in range(0, len(results), CHUNK_SIZE):
+                chunk = results[position:position + CHUNK_SIZE]
+                writer.write(encode_chunk(chunk, fmt), len(chunk))
+        if report != 'none':
+            print(f"Results saved to: {output_file}")
     except Exception as e:
         print(f"Error saving results: {e}")
     
     return results
 
+def print_full_report(patients: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+    print("\n" + "="*80)
+    print("POLYRISK AI - COMPREHENSIVE PATIENT RISK ANALYSIS")
+    print("="*80)
+    print(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Total Patients: {len(patients)}")
+    print("="*80 + "\n")
+    
+    for i, (patient_record, result) in enumerate(zip(patients, results), 1):
+        _, patient_data = split_record(patient_record, i)
+        print_patient_report(i, len(patients), result, patient_data.get('clinical_notes', ''))
+
+def analyze_patients_stream(file_path: str, output_file: Optional[str] = None,
+                            workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                            fmt: str = 'ndjson', report: str = 'summary') -> PatientSummary:
+    """
+    Constant-memory analysis: patients are read incrementally, scored in
+    chunks (in worker processes with workers > 1) and the results are written
+    in input order as each chunk completes. report='none' silences progress
+    and the summary.
+    """
+    output_file = output_file or default_output_file(fmt)
+    summary = PatientSummary()
+    start = time.perf_counter()
+    next_progress = PROGRESS_EVERY
+    
+    if report != 'none':
+        print(f"Streaming analysis: {file_path} -> {output_file}")
+    chunks = iter_chunks(iter_patient_records(file_path, raw=workers > 1), chunk_size)
+    with ResultWriter(output_file, fmt) as writer:
+        for payload, count, chunk_summary in run_ordered(partial(score_chunk, fmt=fmt), chunks, workers):
+            writer.write(payload, count)
+            summary.merge(chunk_summary)
+            if report != 'none' and summary.total >= next_progress:
+                rate = summary.total / (time.perf_counter() - start)
+                print(f"   {summary.total} patients analyzed ({rate:,.0f} records/sec)...")
+                next_progress += PROGRESS_EVERY
+    
+    elapsed = time.perf_counter() - start
+    if report != 'none':
+        print_summary(summary)
+        print(f"Results saved to: {output_file} ({throughput(summary.total, elapsed, workers)})")
+    return summary
+
+def select_changed(records: Iterable[Dict[str, Any]], checkpoint: AnalysisCheckpoint,
+                   counts: Dict[str, int], seen: set) -> Iterator[Dict[str, Any]]:
+    """
+    Generator stage for incremental runs: only patients that are new or whose
+    content hash changed since the checkpoint pass through. Advances the
+    watermark and records the new hashes as it goes.
+    """
+    for position, record in enumerate(records, 1):
+        patient_id, patient_data = split_record(record, position)
+        patient_id = str(patient_id)
+        digest = content_hash(patient_data)
+        seen.add(patient_id)
+        checkpoint.advance(record.get('saved_at'), patient_id)
+        previous = checkpoint.hashes.get(patient_id)
+        if previous == digest:
+            counts['unchanged'] += 1
+            continue
+        counts['new' if previous is None else 'changed'] += 1
+        checkpoint.hashes[patient_id] = digest
+        # Carry the resolved id so positional ids ("patient_<n>") survive the filtering
+        yield {'id': patient_id, 'data': {'patient_data': patient_data}}
+
+def analyze_patients_incremental(file_path: str, store_file: str = INCREMENTAL_STORE,
+                                 checkpoint_file: Optional[str] = None, workers: int = 1,
+                                 chunk_size: int = CHUNK_SIZE, report: str = 'summary') -> Dict[str, Any]:
+    """
+    Score only patients that are new or changed since the last run and append
+    them to a cumulative NDJSON store (the last line per patient_id wins).
+    The checkpoint is saved only after the results are written, so an
+    interrupted run is simply redone.
+    """
+    checkpoint_file = checkpoint_file or os.path.splitext(store_file)[0] + ".checkpoint.json"
+    checkpoint = AnalysisCheckpoint.load(checkpoint_file, store_file)
+    first_run = not checkpoint.hashes
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+    seen: set = set()
+    summary = PatientSummary()
+    start = time.perf_counter()
+    
+    if report != 'none':
+        print(f"Incremental analysis: {file_path} -> {store_file}" + (" (first run)" if first_run else ""))
+    changed = select_changed(iter_patient_records(file_path), checkpoint, counts, seen)
+    with ResultWriter(store_file, 'ndjson', append=not first_run) as writer:
+        for payload, count, chunk_summary in run_ordered(partial(score_chunk, fmt='ndjson'),
+                                                         iter_chunks(changed, chunk_size), workers):
+            writer.write(payload, count)
+            summary.merge(chunk_summary)
+    
+    removed = [patient_id for patient_id in checkpoint.hashes if patient_id not in seen]
+    for patient_id in removed:
+        del checkpoint.hashes[patient_id]
+    counts['removed'] = len(removed)
+    checkpoint.stale_lines += counts['changed']
+    if removed or checkpoint.needs_compaction():
+        compact_store(store_file, checkpoint.hashes)
+        checkpoint.stale_lines = 0
+    checkpoint.save()
+    
+    elapsed = time.perf_counter() - start
+    if report != 'none':
+        print(f"{counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged, "
+              f"{counts['removed']} removed")
+        if summary.total:
+            print_summary(summary)
+        print(f"Results store: {store_file} ({len(checkpoint.hashes)} patients, "
+              f"watermark {checkpoint.watermark[0] or 'n/a'}) - {len(seen)} patients checked in {elapsed:.1f}s")
+    return {**counts, 'summary': summary}
+
 def main():
     """Main function to run the analysis"""
-    print("Starting PolyRisk AI Patient Analysis...")
+    parser = argparse.ArgumentParser(description="PolyRisk AI patient risk analysis")
+    parser.add_argument("input", nargs="?", default="patient_data.json",
+                        help="patient_data.json or an NDJSON store of patient records")
+    parser.add_argument("--stream", action="store_true",
+                        help="constant-memory mode: incremental parsing, NDJSON results (implied for NDJSON input)")
+    parser.add_argument("--output", help="results file (default: patient_analysis_results_<timestamp>)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for scoring (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="patients per worker task")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS,
+                        help="results format (default: from --output, else json, or ndjson when streaming)")
+    parser.add_argument("--summary-only", action="store_true", help="skip the per-patient report, print the summary")
+    parser.add_argument("--quiet", action="store_true", help="no console output except errors")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"score only new / changed patients into a cumulative NDJSON store (default: {INCREMENTAL_STORE})")
+    parser.add_argument("--checkpoint", help="checkpoint file for --incremental (default: <store>.checkpoint.json)")
+    args = parser.parse_args()
+    
+    report = 'none' if args.quiet else 'summary' if args.summary_only else 'full'
+    stream = args.stream or args.input.endswith(NDJSON_EXTENSIONS)
+    fmt = output_format(args.output, args.format, 'ndjson' if stream or args.incremental else 'json')
+    stream = stream or fmt == 'ndjson'
     
-    # Check if patient_data.json exists
-    if not os.path.exists('patient_data.json'):
-        print("Error: patient_data.json not found in current directory")
+    if report != 'none':
+        print("Starting PolyRisk AI Patient Analysis...")
+    
+    # Check if the input file exists
+    if not os.path.exists(args.input):
+        print(f"Error: {args.input} not found in current directory")
         print("Please ensure the file exists and run the script from the backend directory")
         return
+    if args.incremental and fmt != 'ndjson':
+        print("Error: --incremental keeps an NDJSON results store (use --format ndjson / a .ndjson --output)")
+        return
+    if fmt == 'parquet' and pq is None:
+        print("Error: --format parquet needs pyarrow (pip install pyarrow)")
+        return
     
     try:
-        results = analyze_all_patients()
-        if results:
-            print(f"Analysis complete! Processed {len(results)} patients.")
+        if args.incremental:
+            counts = analyze_patients_incremental(args.input, args.output or INCREMENTAL_STORE, args.checkpoint,
+                                                  args.workers, args.chunk_size, 'none' if args.quiet else 'summary')
+            processed = counts['new'] + counts['changed']
+        elif stream:
+            summary = analyze_patients_stream(args.input, args.output, args.workers, args.chunk_size, fmt,
+                                              'none' if args.quiet else 'summary')
+            processed = summary.total
         else:
-            print("No patients were processed.")
+            processed = len(analyze_all_patients(args.input, args.output, args.workers, fmt, report))
+        if report != 'none':
+            print(f"Analysis complete! Processed {processed} patients." if processed else "No patients were processed.")
     except Exception as e:
         print(f"Error during analysis: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Chatbot Answer Cache
+LLM answers cached by normalized question, with near-duplicate lookup
+(MinHash signatures over token shingles, banded LSH) so reworded questions
+reuse an earlier answer. A near-duplicate must name exactly the same drugs,
+qualifiers and numbers; only the question's scaffolding may differ. Entries
+are evicted LRU and expire after a TTL.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+import numpy as np
+
+from retrieval_index import tokenize
+
+CACHE_SIZE = int(os.getenv("POLYRISK_ANSWER_CACHE_SIZE", "512"))
+CACHE_TTL = float(os.getenv("POLYRISK_ANSWER_CACHE_TTL", "3600"))
+SIMILARITY_THRESHOLD = float(os.getenv("POLYRISK_ANSWER_CACHE_SIMILARITY", "0.8"))
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 4 rows per band: pairs above ~0.5 Jaccard become candidates
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Wording that does not change what is being asked
+SYNONYMS = {"ok": "safe", "okay": "safe", "fine": "safe", "safely": "safe", "alright": "safe",
+            "medication": "drug", "medications": "drug", "medicine": "drug", "medicines": "drug",
+            "drugs": "drug", "combined": "together", "combine": "together", "mix": "together",
+            # Negation is kept, whichever way it is spelled ("isn't", "is not", "can't")
+            "isn": "not", "aren": "not", "don": "not", "doesn": "not", "shouldn": "not", "won": "not",
+            "wont": "not", "cannot": "not", "cant": "not", "never": "not"}
+FILLER = {"take", "taking", "use", "using", "together", "both", "at", "same", "time", "while", "am", "we", "us",
+          "t", "s"}
+# Question scaffolding that rewording changes freely. Every other token (drug
+# names, qualifiers such as "severe", "unsafe", "not", "hctz", numbers) must
+# match exactly for a near-duplicate hit
+SCAFFOLDING = {"there", "side", "effects", "effect", "interaction", "interactions", "interact", "drug",
+               "happens", "happen", "if", "will", "would", "get", "have", "has", "all", "some", "list",
+               "explain", "mean", "means", "why", "who", "where", "was", "were", "been", "by", "as", "so",
+               "just", "really", "between"}
+
+# Words that only make sense with the earlier conversation
+REFERRING_WORDS = {"it", "its", "this", "that", "these", "those", "they", "them", "their", "he", "she",
+                   "him", "her", "his", "one", "ones", "also", "instead", "else", "above", "previous",
+                   "again", "more"}
+MIN_STANDALONE_TOKENS = 3
+
+
+def normalize_question(question: str) -> List[str]:
+    tokens = [SYNONYMS.get(t, t) for t in tokenize(question)]
+    return [t for t in tokens if t not in FILLER]
+
+
+def shingles(tokens: List[str]) -> Set[str]:
+    """Whole tokens plus character trigrams, so word order and small typos barely matter"""
+    result = set(tokens)
+    for token in tokens:
+        padded = f"#{token}#"
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def key_terms(tokens: List[str]) -> Set[str]:
+    """Drugs, qualifiers, negation and numbers; questions differing in these are never near-duplicates"""
+    return {t for t in tokens if t not in SCAFFOLDING}
+
+
+def is_context_dependent(question: str, conversation_history: Optional[list]) -> bool:
+    """
+    With history in the prompt the answer may depend on it; treat the question
+    as standalone only if it names its subject and does not refer back
+    """
+    if not conversation_history:
+        return False
+    words = set(re.findall(r"[a-z']+", question.lower()))
+    if words & REFERRING_WORDS:
+        return True
+    return len(normalize_question(question)) < MIN_STANDALONE_TOKENS
+
+
+class MinHasher:
+    """MinHash signatures with a fixed universal hash family (a * x + b mod p)"""
+
+    def __init__(self, num_perm: int = NUM_PERMUTATIONS, seed: int = 7):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, items: Set[str]) -> np.ndarray:
+        if not items:
+            return np.full(len(self.a), MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) & MERSENNE_PRIME for item in items),
+                             dtype=np.uint64, count=len(items))
+        # Values stay below 2**62, so uint64 arithmetic cannot overflow
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+class CacheEntry:
+    def __init__(self, key: str, answer: Dict[str, Any], tokens: List[str], bands: List[Tuple]):
+        self.key = key
+        self.answer = answer
+        self.shingles = shingles(tokens)
+        self.key_terms = key_terms(tokens)
+        self.bands = bands
+        self.created = time.monotonic()
+
+
+class AnswerCache:
+    """
+    Exact lookup on the normalized question first, then LSH candidates whose
+    shingle Jaccard similarity reaches the threshold
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 threshold: float = SIMILARITY_THRESHOLD, bands: int = LSH_BANDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.rows = NUM_PERMUTATIONS // bands
+        self.num_bands = bands
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _bands(self, shingle_set: Set[str]) -> List[Tuple]:
+        signature = self.hasher.signature(shingle_set)
+        return [(band,) + tuple(signature[band * self.rows:(band + 1) * self.rows].tolist())
+                for band in range(self.num_bands)]
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.created > self.ttl
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def get(self, question: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """(answer, "exact" or "near") or None"""
+        tokens = normalize_question(question)
+        if not tokens:
+            return None
+        key = " ".join(tokens)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer, "exact"
+
+            shingle_set, terms = shingles(tokens), key_terms(tokens)
+            best, best_similarity = None, self.threshold
+            candidates = set()
+            for band in self._bands(shingle_set):
+                candidates.update(self._buckets.get(band, ()))
+            for candidate_key in candidates:
+                candidate = self._entries[candidate_key]
+                if self._expired(candidate):
+                    self._remove(candidate_key)
+                    continue
+                if candidate.key_terms != terms:
+                    continue
+                similarity = jaccard(shingle_set, candidate.shingles)
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is not None:
+                self._entries.move_to_end(best.key)
+                self.hits += 1
+                self.near_hits += 1
+                return best.answer, "near"
+            self.misses += 1
+            return None
+
+    def put(self, question: str, answer: Dict[str, Any]):
+        tokens = normalize_question(question)
+        if not tokens:
+            return
+        key = " ".join(tokens)
+        entry = CacheEntry(key, answer, tokens, self._bands(shingles(tokens)))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            for band in entry.bands:
+                self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -4,9 +4,12 @@ import os
 from datetime import datetime
 import json
 import random
+from instrumentation import instrument_flask
 
 app = Flask(__name__)
 CORS(app)
+# Prometheus metrics at /metrics (POLYRISK_METRICS=0 disables)
+instrument_flask(app, "flask_app")
 
 # Load or create mock models
 # Mock models for demo - no actual ML models needed for this demo
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Change Detection and Snapshot Cache
+Detects changes to the analysis data (inotify where available, otherwise
+cheap mtime polling) and caches computed snapshots until something changes
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # optional dependency, Linux only
+    INotify = None
+
+# Snapshots kept in memory, least recently used evicted (keys include query parameters)
+MAX_SNAPSHOTS = int(os.getenv("POLYRISK_MAX_SNAPSHOTS", "256"))
+
+
+class ChangeWatcher:
+    """Version token that changes whenever one of the watched paths changes"""
+
+    def __init__(self, paths: List[str], use_inotify: bool = True):
+        self.paths = paths
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._signature = None
+        self._inotify = None
+        if use_inotify and INotify is not None:
+            self._setup_inotify()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    def _setup_inotify(self):
+        # Watch directories so files that are replaced atomically are still seen
+        directories = {path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+                       for path in self.paths}
+        if not all(os.path.isdir(d) for d in directories):
+            # A watched directory does not exist yet; polling will pick it up
+            return
+        try:
+            inotify = INotify()
+            # No CLOSE_WRITE: SQLite opens the manifest read-write even for reads
+            mask = (inotify_flags.MODIFY | inotify_flags.CREATE | inotify_flags.DELETE |
+                    inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM)
+            for directory in directories:
+                inotify.add_watch(directory, mask)
+            self._inotify = inotify
+        except OSError as e:
+            print(f"inotify unavailable, falling back to polling: {e}")
+
+    def _stat_signature(self) -> Tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def version(self) -> int:
+        """Return a counter that is bumped whenever a change is detected"""
+        with self._lock:
+            if self._inotify is not None:
+                if self._inotify.read(timeout=0):
+                    self._counter += 1
+            else:
+                signature = self._stat_signature()
+                if signature != self._signature:
+                    self._signature = signature
+                    self._counter += 1
+            return self._counter
+
+
+class SnapshotCache:
+    """Computed responses cached per key until the watcher reports a change (LRU, at most max_entries)"""
+
+    def __init__(self, watcher: ChangeWatcher, max_entries: int = MAX_SNAPSHOTS):
+        self.watcher = watcher
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[int, Any, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, builder: Callable[[], Any]) -> Tuple[Any, str]:
+        """Return (payload, etag), rebuilding the payload only when the data changed"""
+        version = self.watcher.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1], entry[2]
+            self.misses += 1
+
+        payload = builder()
+        etag = make_etag(payload)
+        if is_cacheable(payload):
+            with self._lock:
+                self._entries[key] = (version, payload, etag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return payload, etag
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def is_cacheable(payload: Any) -> bool:
+    """Error fallbacks (an "error" key in the payload or its data) are served but never cached"""
+    if not isinstance(payload, dict):
+        return True
+    data = payload.get("data")
+    return "error" not in payload and not (isinstance(data, dict) and "error" in data)
+
+
+VOLATILE_KEYS = {"timestamp", "last_updated"}
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def make_etag(payload: Any) -> str:
+    """Strong ETag over the JSON body, ignoring generation timestamps"""
+    body = json.dumps(_strip_volatile(payload), sort_keys=True, default=str)
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Chat Sessions
+Server-side conversation state keyed by session id, so chat requests carry
+only the new message. Each session keeps the latest turns in a ring buffer;
+older turns are compacted into a short running summary, and the history
+rendered into the prompt stays within a per-session token budget.
+"""
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Optional
+
+from prompt_builder import CHARS_PER_TOKEN, estimate_tokens
+
+MAX_TURNS = int(os.getenv("POLYRISK_CHAT_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("POLYRISK_CHAT_HISTORY_TOKENS", "600"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("POLYRISK_CHAT_SUMMARY_TOKENS", "150"))
+SESSION_TTL = float(os.getenv("POLYRISK_CHAT_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.getenv("POLYRISK_CHAT_MAX_SESSIONS", "1000"))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+# session_id a client sends to open a server-side session (no session is created otherwise)
+NEW_SESSION = "new"
+SUMMARY_QUESTION_CHARS = 80
+SUMMARY_ANSWER_CHARS = 100
+
+
+def _clip(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", str(text)).strip()
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _first_sentence(text: str) -> str:
+    match = re.match(r"(.+?[.!?])(\s|$)", re.sub(r"\s+", " ", str(text)).strip())
+    return match.group(1) if match else str(text)
+
+
+def summarize_turn(turn: Dict[str, str]) -> str:
+    """One summary line per compacted turn: the question and the gist of the answer"""
+    return (f"User asked: {_clip(turn['user'], SUMMARY_QUESTION_CHARS)} - "
+            f"answered: {_clip(_first_sentence(turn['bot']), SUMMARY_ANSWER_CHARS)}")
+
+
+class ChatSession:
+    def __init__(self, session_id: str, max_turns: int = MAX_TURNS,
+                 token_budget: int = HISTORY_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET):
+        self.session_id = session_id
+        self.turns: deque = deque()
+        self.max_turns = max_turns
+        self.summary: deque = deque()
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.compacted_turns = 0
+        self.created = time.time()
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add_turn(self, user: str, bot: str):
+        with self._lock:
+            self.turns.append({"user": user, "bot": bot})
+            self.last_active = time.monotonic()
+            while len(self.turns) > self.max_turns:
+                self._compact_oldest()
+            # Keep the latest turn verbatim even when it alone is over budget
+            while len(self.turns) > 1 and self._history_tokens() > self.token_budget:
+                self._compact_oldest()
+
+    def _compact_oldest(self):
+        self.summary.append(summarize_turn(self.turns.popleft()))
+        self.compacted_turns += 1
+        while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > self.summary_budget:
+            self.summary.popleft()
+
+    def _render_turns(self) -> str:
+        return "\n".join(f"User: {turn['user']}\nAssistant: {turn['bot']}" for turn in self.turns)
+
+    def _history_tokens(self) -> int:
+        return estimate_tokens("\n".join(self.summary)) + estimate_tokens(self._render_turns())
+
+    def prompt_context(self) -> str:
+        """Conversation history for the prompt: summary of older turns, then recent turns"""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append("Summary of earlier conversation:\n" + "\n".join(self.summary))
+            if self.turns:
+                recent = self._render_turns()
+                max_chars = self.token_budget * CHARS_PER_TOKEN
+                if len(recent) > max_chars:
+                    recent = "..." + recent[-max_chars:]
+                parts.append(recent)
+            return "\n\n".join(parts)
+
+    def history(self) -> List[Dict[str, str]]:
+        """Turns in the shape clients used to send as conversation_history"""
+        return list(self.turns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "session_id": self.session_id,
+                "turns": list(self.turns),
+                "summary": list(self.summary),
+                "compacted_turns": self.compacted_turns,
+                "history_tokens": self._history_tokens(),
+                "token_budget": self.token_budget
+            }
+
+
+class SessionStore:
+    """In-memory sessions, expired after SESSION_TTL idle seconds and capped LRU at MAX_SESSIONS"""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expired(self, session: ChatSession) -> bool:
+        return time.monotonic() - session.last_active > self.ttl
+
+    def get(self, session_id: Optional[str]) -> Optional[ChatSession]:
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self._expired(session):
+                del self._sessions[session_id]
+                return None
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        """Existing session, or a new one (under the given id if it is well-formed, else a fresh id)"""
+        session = self.get(session_id)
+        if session is not None:
+            return session
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            session_id = uuid.uuid4().hex
+        session = ChatSession(session_id)
+        with self._lock:
+            self._sessions[session_id] = session
+            self._evict()
+        return session
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        expired = [sid for sid, session in self._sessions.items() if self._expired(session)]
+        for sid in expired:
+            del self._sessions[sid]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
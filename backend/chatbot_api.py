@@ -6,10 +6,22 @@ Separate from patient_api.py as requested
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
 import google.generativeai as genai
+import asyncio
 import json
+import os
+import threading
+from instrumentation import instrument_fastapi, cache_ratio, counter, gauge, timed
+from answer_cache import AnswerCache, is_context_dependent
+from chat_sessions import NEW_SESSION, ChatSession, SessionStore
+from drug_matcher import DrugMatcher, answer_drug_pairs
+from interaction_index import get_interaction_index
+from keyword_matcher import build_intent_matcher
+from retrieval_index import INDEX_FILE, load_index, answer_locally, snippet
 
 # ==========================================================
 # ⚙️ Configuration
@@ -28,12 +40,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics at /metrics (POLYRISK_METRICS=0 disables)
+instrument_fastapi(app, "chatbot_api")
+
 # ==========================================================
 # 📝 Data Models
 # ==========================================================
 class ChatMessage(BaseModel):
     message: str
+    # Legacy: full history resent by the client; ignored when session_id is given
     conversation_history: list = []
+    # "new" opens a server-side session; without it the request is stateless
+    session_id: Optional[str] = None
+    # Have Gemini phrase locally found drug-pair facts instead of the templated answer
+    rephrase: bool = False
 
 # ==========================================================
 # 💬 Predefined Responses for Common Questions
@@ -56,6 +76,200 @@ PREDEFINED_RESPONSES = {
     "monitoring": "Medication monitoring includes:\n• Regular lab tests (kidney, liver function)\n• Vital signs (blood pressure, heart rate)\n• Symptom tracking\n• Drug level monitoring when needed\n\nOur AI provides personalized monitoring recommendations based on your medication regimen.",
 }
 
+# Optional FAQ with more intents: [{"intent", "keywords", "response", "priority"}]
+FAQ_FILE = os.getenv("POLYRISK_FAQ_FILE", "chatbot_faq.json")
+
+# Built once at startup; matching cost does not grow with the number of intents
+INTENT_MATCHER = build_intent_matcher(PREDEFINED_RESPONSES, FAQ_FILE)
+
+# Drug names and synonyms for the drug-pair fast path, and the BM25 index over
+# local drug data and FAQ text (build offline: python retrieval_index.py).
+# Loaded at startup (or on first use), not at import
+DRUG_INDEX = None
+DRUG_MATCHER: Optional[DrugMatcher] = None
+RETRIEVAL_INDEX = None
+_local_data_lock = threading.Lock()
+
+def load_local_data():
+    """Interaction index, drug matcher and retrieval index, built once per process"""
+    global DRUG_INDEX, DRUG_MATCHER, RETRIEVAL_INDEX
+    with _local_data_lock:
+        if RETRIEVAL_INDEX is None:
+            DRUG_INDEX = get_interaction_index()
+            DRUG_MATCHER = DrugMatcher(DRUG_INDEX)
+            RETRIEVAL_INDEX = load_index(os.getenv("POLYRISK_RETRIEVAL_INDEX", INDEX_FILE),
+                                         INTENT_MATCHER.intents, DRUG_INDEX)
+
+@app.on_event("startup")
+async def warm_local_data():
+    """Load the local drug data before the first chat request"""
+    load_local_data()
+
+# Gemini answers reused for the same or reworded standalone questions
+ANSWER_CACHE = AnswerCache()
+cache_ratio("chatbot_answers", lambda: (ANSWER_CACHE.hits, ANSWER_CACHE.misses))
+
+# Server-side conversation state for clients that opt in (session_id "new", then the returned id)
+SESSIONS = SessionStore()
+gauge("polyrisk_chat_sessions", "Active chatbot sessions").set_function(lambda: len(SESSIONS))
+
+# ==========================================================
+# 🧠 Answer Pipeline
+# ==========================================================
+GEMINI_MODEL = "gemini-2.5-flash"
+
+FALLBACK_RESPONSE = "I'm here to help! I can answer questions about drug interactions, polypharmacy risks, and how to use our platform. What would you like to know?"
+
+def resolve_session(chat_message: ChatMessage) -> Optional[ChatSession]:
+    """
+    The caller's session, or None when the client did not opt in (no
+    session_id): those requests are stateless, using conversation_history if
+    sent, so clients that never send an id do not fill the session store
+    """
+    if not chat_message.session_id:
+        return None
+    if chat_message.session_id == NEW_SESSION:
+        return SESSIONS.get_or_create()
+    return SESSIONS.get_or_create(chat_message.session_id)
+
+def answer_without_llm(chat_message: ChatMessage,
+                       session: Optional[ChatSession]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], bool]:
+    """
+    Drug-pair, predefined, retrieval and cached answers, cheapest first.
+    Returns (response or None, retrieval result, context_dependent)
+    """
+    load_local_data()
+    user_message = chat_message.message.lower().strip()
+    
+    # Two or more known drugs: answer from the local interaction data, even
+    # when the wording also hits a keyword intent ("drug interactions", "hello")
+    with timed("drug_pair_lookup"):
+        drug_pairs = answer_drug_pairs(DRUG_INDEX, DRUG_MATCHER, chat_message.message)
+    if drug_pairs and not chat_message.rephrase:
+        return {
+            "status": "success",
+            "type": "drug_pair",
+            **drug_pairs,
+            "timestamp": datetime.now().isoformat()
+        }, {"answer": None, "matches": []}, False
+    
+    # Keyword intents only as the fallback for non drug-pair questions
+    match = INTENT_MATCHER.match(user_message) if not drug_pairs else None
+    if match:
+        return {
+            "status": "success",
+            "response": match.intent.response,
+            "type": "predefined",
+            "intent": match.intent.name,
+            "timestamp": datetime.now().isoformat()
+        }, {"answer": None, "matches": []}, False
+    
+    # Answer from local drug data / FAQ text when the match is confident
+    if drug_pairs:
+        retrieval = {"answer": None, "matches": [], "facts": drug_pairs["response"]}
+    else:
+        with timed("retrieval_search"):
+            retrieval = answer_locally(RETRIEVAL_INDEX, chat_message.message)
+    if retrieval["answer"]:
+        best = retrieval["matches"][0]
+        return {
+            "status": "success",
+            "response": retrieval["answer"],
+            "type": "retrieval",
+            "source": best["document"]["title"],
+            "confidence": best["confidence"],
+            "timestamp": datetime.now().isoformat()
+        }, retrieval, False
+    
+    # Reuse an earlier Gemini answer unless the question leans on the conversation
+    history = session.history() if session is not None else chat_message.conversation_history
+    context_dependent = is_context_dependent(chat_message.message, history)
+    if context_dependent:
+        ANSWER_CACHE.record_bypass()
+    else:
+        with timed("answer_cache_lookup"):
+            cached = ANSWER_CACHE.get(chat_message.message)
+        if cached:
+            answer, cache_match = cached
+            return {
+                "status": "success",
+                "response": answer["response"],
+                "type": "ai",
+                "cached": True,
+                "cache_match": cache_match,
+                "timestamp": datetime.now().isoformat()
+            }, retrieval, False
+    return None, retrieval, context_dependent
+
+def build_prompt(chat_message: ChatMessage, retrieval: Dict[str, Any], session: Optional[ChatSession]) -> str:
+    """Gemini prompt grounded with the closest local snippets"""
+    context = """
+    You are PolyRisk AI Assistant, a helpful medical AI chatbot specializing in:
+    - Drug-drug interactions
+    - Polypharmacy risks in elderly patients
+    - Medication safety
+    - Clinical decision support
+    
+    Guidelines:
+    - Provide accurate, evidence-based information
+    - Be empathetic and professional
+    - Explain medical terms in simple language
+    - Always recommend consulting healthcare professionals for medical decisions
+    - If asked about specific drug combinations, provide general guidance but emphasize the need for professional consultation
+    - Keep responses concise (2-3 paragraphs max)
+    
+    User question: {user_message}
+    
+    Provide a helpful, informative response.
+    """
+    
+    # Build conversation context
+    if session is not None:
+        conversation_context = session.prompt_context()
+    else:
+        conversation_context = "\n".join([
+            f"User: {msg.get('user', '')}\nAssistant: {msg.get('bot', '')}"
+            for msg in chat_message.conversation_history[-3:]  # Last 3 exchanges
+        ])
+    
+    reference = "\n".join(f"- {snippet(match)}" for match in retrieval["matches"])
+    full_prompt = f"{context}\n\nConversation history:\n{conversation_context}"
+    if retrieval.get("facts"):
+        full_prompt += ("\n\nAnswer in plain language using only these facts from the PolyRisk "
+                        f"interaction database:\n{retrieval['facts']}")
+    elif reference:
+        full_prompt += f"\n\nReference information from the PolyRisk drug database (use if relevant):\n{reference}"
+    full_prompt += f"\n\nCurrent question: {chat_message.message}"
+    return full_prompt
+
+def ai_response(chat_message: ChatMessage, answer_text: str, context_dependent: bool) -> Dict[str, Any]:
+    if not context_dependent:
+        ANSWER_CACHE.put(chat_message.message, {"response": answer_text})
+    return {
+        "status": "success",
+        "response": answer_text,
+        "type": "ai",
+        "timestamp": datetime.now().isoformat()
+    }
+
+def record_turn(chat_message: ChatMessage, session: Optional[ChatSession],
+                response: Dict[str, Any]) -> Dict[str, Any]:
+    """Append the exchange to the session and tell the client which session it is in"""
+    if session is not None:
+        if response["type"] != "fallback":
+            session.add_turn(chat_message.message, response["response"])
+        response["session_id"] = session.session_id
+    return response
+
+def fallback_response(error: Exception) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "response": FALLBACK_RESPONSE,
+        "type": "fallback",
+        "error": str(error),
+        "timestamp": datetime.now().isoformat()
+    }
+
 # ==========================================================
 # 🤖 Chatbot Endpoints
 # ==========================================================
@@ -66,68 +280,107 @@ async def chat_with_bot(chat_message: ChatMessage):
     - Predefined responses for common questions
     - Gemini AI for complex queries
     """
+    session = resolve_session(chat_message)
     try:
-        user_message = chat_message.message.lower().strip()
-        
-        # Check for predefined responses first
-        for keyword, response in PREDEFINED_RESPONSES.items():
-            if keyword in user_message:
-                return {
-                    "status": "success",
-                    "response": response,
-                    "type": "predefined",
-                    "timestamp": datetime.now().isoformat()
-                }
-        
-        # If no predefined response, use Gemini AI
-        context = """
-        You are PolyRisk AI Assistant, a helpful medical AI chatbot specializing in:
-        - Drug-drug interactions
-        - Polypharmacy risks in elderly patients
-        - Medication safety
-        - Clinical decision support
-        
-        Guidelines:
-        - Provide accurate, evidence-based information
-        - Be empathetic and professional
-        - Explain medical terms in simple language
-        - Always recommend consulting healthcare professionals for medical decisions
-        - If asked about specific drug combinations, provide general guidance but emphasize the need for professional consultation
-        - Keep responses concise (2-3 paragraphs max)
-        
-        User question: {user_message}
-        
-        Provide a helpful, informative response.
-        """
-        
-        # Build conversation context
-        conversation_context = "\n".join([
-            f"User: {msg.get('user', '')}\nAssistant: {msg.get('bot', '')}"
-            for msg in chat_message.conversation_history[-3:]  # Last 3 exchanges
-        ])
-        
-        full_prompt = f"{context}\n\nConversation history:\n{conversation_context}\n\nCurrent question: {chat_message.message}"
+        local, retrieval, context_dependent = answer_without_llm(chat_message, session)
+        if local:
+            return record_turn(chat_message, session, local)
         
         # Call Gemini AI
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(full_prompt)
-        
-        return {
-            "status": "success",
-            "response": response.text.strip(),
-            "type": "ai",
-            "timestamp": datetime.now().isoformat()
-        }
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        with timed("llm_call"):
+            response = model.generate_content(build_prompt(chat_message, retrieval, session))
+        return record_turn(chat_message, session, ai_response(chat_message, response.text.strip(), context_dependent))
         
     except Exception as e:
         # Fallback response
-        return {
-            "status": "success",
-            "response": "I'm here to help! I can answer questions about drug interactions, polypharmacy risks, and how to use our platform. What would you like to know?",
-            "type": "fallback",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+        return record_turn(chat_message, session, fallback_response(e))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+STREAMS_CANCELLED = counter("polyrisk_chat_streams_cancelled_total",
+                            "Streaming chats whose Gemini call was aborted by a client disconnect")
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_gemini(chat_message: ChatMessage, session: Optional[ChatSession],
+                        retrieval: Dict[str, Any], context_dependent: bool):
+    """
+    token events as Gemini produces them, then one answer event. Gemini is
+    read in its own task so that closing this generator (client gone) can
+    cancel it, which aborts the upstream call.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def produce():
+        try:
+            model = genai.GenerativeModel(GEMINI_MODEL)
+            with timed("llm_stream"):
+                response = await model.generate_content_async(build_prompt(chat_message, retrieval, session),
+                                                            stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        await queue.put(("token", chunk.text))
+            await queue.put(("done", None))
+        except Exception as e:
+            await queue.put(("error", e))
+    
+    producer = asyncio.create_task(produce())
+    parts = []
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "token":
+                parts.append(value)
+                yield sse_event("token", {"text": value})
+            elif kind == "done":
+                answer = ai_response(chat_message, "".join(parts).strip(), context_dependent)
+                yield sse_event("answer", record_turn(chat_message, session, answer))
+                return
+            else:
+                yield sse_event("error", record_turn(chat_message, session, fallback_response(value)))
+                return
+    finally:
+        if not producer.done():
+            producer.cancel()
+            STREAMS_CANCELLED.inc()
+
+@app.post("/api/chat/stream")
+async def chat_stream(chat_message: ChatMessage):
+    """
+    Server-Sent Events variant of /api/chat: "token" events while Gemini
+    generates, then one "answer" event with the same body /api/chat returns.
+    Predefined, retrieval and cached answers arrive as a single "answer" event.
+    """
+    session = resolve_session(chat_message)
+    try:
+        local, retrieval, context_dependent = answer_without_llm(chat_message, session)
+    except Exception as e:
+        local = fallback_response(e)
+    
+    if local:
+        payload = record_turn(chat_message, session, local)
+        async def single_event():
+            yield sse_event("answer", payload)
+        return StreamingResponse(single_event(), media_type="text/event-stream", headers=SSE_HEADERS)
+    return StreamingResponse(stream_gemini(chat_message, session, retrieval, context_dependent),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/chat/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Stored turns, compacted summary and history token count of a session"""
+    session = SESSIONS.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success", "session": session.to_dict()}
+
+@app.delete("/api/chat/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a conversation (e.g. when the user clears the chat)"""
+    if not SESSIONS.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success", "message": "Session deleted"}
 
 @app.get("/api/chat/suggestions")
 async def get_suggestions():
@@ -152,6 +405,8 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "PolyRisk AI Chatbot API",
+        "answer_cache": ANSWER_CACHE.stats(),
+        "sessions": len(SESSIONS),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -163,5 +418,6 @@ if __name__ == "__main__":
     print("Starting PolyRisk AI Chatbot API...")
     print("Chatbot API: http://localhost:8002")
     print("Chat Endpoint: POST /api/chat")
+    print("Streaming Chat: POST /api/chat/stream")
     print("Suggestions: GET /api/chat/suggestions")
     uvicorn.run("chatbot_api:app", host="0.0.0.0", port=8002, reload=True)
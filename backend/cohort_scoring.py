@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Vectorized Cohort Risk Scoring
+Column-at-a-time version of analyze_patients.calculate_risk_score: every
+score component is computed with np.select / np.where over whole arrays,
+giving the same results as the scalar function.
+
+Usage:
+    python cohort_scoring.py [--input patient_profiles.csv] [--output scored.csv]
+    python cohort_scoring.py --benchmark 1000000
+"""
+
+import argparse
+import time
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from model_evaluation import PROFILE_COLUMNS, PROFILE_FILE, detect_columns, find_data_file
+
+CHUNK_SIZE = 100_000
+POLYPHARMACY_THRESHOLD = 5
+
+COHORT_COLUMNS = {
+    **PROFILE_COLUMNS,
+    "medications": ["total_medications", "medication_count", "num_medications", "num_drugs",
+                    "drug_count", "n_drugs", "medications"]
+}
+RISK_LEVELS = ["low", "moderate", "high"]
+SCORE_COLUMNS = ["age_risk", "kidney_risk", "liver_risk", "base_score", "risk_level",
+                 "total_medications", "polypharmacy_risk"]
+
+
+def _impaired(values: Optional[Any], length: int) -> np.ndarray:
+    """1 where the function is not exactly 'normal' after lower-casing; missing counts as normal"""
+    if values is None:
+        return np.zeros(length, dtype=np.int64)
+    # Only a handful of distinct labels: compare those once, then broadcast through the codes
+    codes, labels = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    impaired_label = np.array([str(label).lower() != "normal" for label in labels] + [False], dtype=np.int64)
+    return impaired_label[codes]
+
+
+def _medication_counts(values: Optional[Any], length: int) -> np.ndarray:
+    """Counts, or lists of medications (their lengths)"""
+    if values is None:
+        return np.zeros(length, dtype=np.int64)
+    series = pd.Series(values)
+    if series.dtype == object:
+        series = series.map(lambda v: len(v) if isinstance(v, (list, tuple)) else v)
+    return pd.to_numeric(series, errors="coerce").fillna(0).astype(np.int64).to_numpy()
+
+
+def score_cohort(age: Any, kidney_function: Optional[Any] = None, liver_function: Optional[Any] = None,
+                 medications: Optional[Any] = None) -> pd.DataFrame:
+    """
+    Score whole columns at once (arrays, lists or Series of equal length).
+    Same rubric as calculate_risk_score:
+    - Age 60-70: +1, Age 70-80: +2, Age 80+: +3
+    - Kidney impairment: +1, Liver impairment: +1
+    - base_score <= 4 low, <= 6 moderate, else high
+    - 5+ medications: polypharmacy risk
+    """
+    age = pd.to_numeric(pd.Series(age), errors="coerce").fillna(0).to_numpy()
+    length = len(age)
+
+    age_risk = np.select([age >= 80, age >= 70, age >= 60], [3, 2, 1], default=0)
+    kidney_risk = _impaired(kidney_function, length)
+    liver_risk = _impaired(liver_function, length)
+    base_score = age_risk + kidney_risk + liver_risk
+    risk_level = pd.Categorical.from_codes(np.select([base_score <= 4, base_score <= 6], [0, 1], default=2),
+                                           RISK_LEVELS)
+    total_medications = _medication_counts(medications, length)
+
+    return pd.DataFrame({
+        "age_risk": age_risk,
+        "kidney_risk": kidney_risk,
+        "liver_risk": liver_risk,
+        "base_score": base_score,
+        "risk_level": risk_level,
+        "total_medications": total_medications,
+        "polypharmacy_risk": total_medications >= POLYPHARMACY_THRESHOLD
+    })
+
+
+def score_frame(frame: pd.DataFrame, columns: Optional[Dict[str, Optional[str]]] = None) -> pd.DataFrame:
+    """Score a DataFrame whose columns are detected by name (see COHORT_COLUMNS)"""
+    columns = columns or detect_columns(frame.columns.tolist(), COHORT_COLUMNS)
+    if not columns["age"]:
+        raise ValueError(f"No age column in {frame.columns.tolist()}")
+    column = lambda name: frame[columns[name]] if columns[name] else None
+    scored = score_cohort(frame[columns["age"]], column("kidney"), column("liver"), column("medications"))
+    scored.index = frame.index
+    return scored
+
+
+def score_patients(patients: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Score patient_data dicts (as passed to calculate_risk_score) in one vectorized pass"""
+    return score_cohort([p.get("age", 0) for p in patients],
+                        [p.get("kidney_function", "normal") for p in patients],
+                        [p.get("liver_function", "normal") for p in patients],
+                        [len(p.get("medications", [])) for p in patients])
+
+
+def to_risk_analyses(scored: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows as the dicts calculate_risk_score returns (Python ints / bools)"""
+    return [{
+        "age_risk": int(row[0]),
+        "kidney_risk": int(row[1]),
+        "liver_risk": int(row[2]),
+        "base_score": int(row[3]),
+        "risk_level": str(row[4]),
+        "total_medications": int(row[5]),
+        "polypharmacy_risk": bool(row[6])
+    } for row in scored[SCORE_COLUMNS].itertuples(index=False, name=None)]
+
+
+# ==========================================================
+# Benchmark
+# ==========================================================
+def synthetic_patients(count: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    functions = np.array(["normal", "Normal", "mild", "moderate", "severe"])
+    return pd.DataFrame({
+        "age": rng.integers(18, 100, size=count),
+        "kidney_function": functions[rng.integers(0, len(functions), size=count)],
+        "liver_function": functions[rng.integers(0, len(functions), size=count)],
+        "total_medications": rng.integers(0, 12, size=count)
+    })
+
+
+def benchmark(count: int) -> Dict[str, Any]:
+    """Vectorized vs scalar scoring on the same synthetic cohort, checking every field matches"""
+    from analyze_patients import calculate_risk_score
+
+    frame = synthetic_patients(count)
+    start = time.perf_counter()
+    scored = score_frame(frame)
+    vectorized_seconds = time.perf_counter() - start
+
+    ages = frame["age"].tolist()
+    kidneys = frame["kidney_function"].tolist()
+    livers = frame["liver_function"].tolist()
+    medication_counts = frame["total_medications"].tolist()
+    start = time.perf_counter()
+    scalar = [calculate_risk_score({"age": age, "kidney_function": kidney, "liver_function": liver,
+                                    "medications": [None] * medications})
+              for age, kidney, liver, medications in zip(ages, kidneys, livers, medication_counts)]
+    scalar_seconds = time.perf_counter() - start
+
+    return {
+        "patients": count,
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "scalar_seconds": round(scalar_seconds, 3),
+        "speedup": round(scalar_seconds / vectorized_seconds, 1) if vectorized_seconds else None,
+        "identical": to_risk_analyses(scored) == scalar
+    }
+
+
+def score_file(path: str, output: Optional[str], chunk_size: int = CHUNK_SIZE) -> Dict[str, int]:
+    """Score a patient profile CSV chunk by chunk; returns the risk-level distribution"""
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    columns = detect_columns(header, COHORT_COLUMNS)
+    distribution = {level: 0 for level in RISK_LEVELS}
+    for i, chunk in enumerate(pd.read_csv(path, chunksize=chunk_size)):
+        scored = score_frame(chunk, columns)
+        for level, count in scored["risk_level"].value_counts().items():
+            distribution[level] += int(count)
+        if output:
+            chunk = chunk.drop(columns=[c for c in SCORE_COLUMNS if c in chunk.columns])
+            pd.concat([chunk, scored], axis=1).to_csv(output, mode="w" if i == 0 else "a",
+                                                      header=i == 0, index=False)
+    return distribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized PolyRisk cohort risk scoring")
+    parser.add_argument("--input", help=f"patient profile CSV (default: data/processed/{PROFILE_FILE})")
+    parser.add_argument("--output", help="write the input columns plus the score columns to this CSV")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--benchmark", type=int, metavar="N", help="benchmark against the scalar scorer with N synthetic patients")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark(args.benchmark)
+        print(f"{result['patients']:,} patients: vectorized {result['vectorized_seconds']}s, "
+              f"scalar {result['scalar_seconds']}s ({result['speedup']}x), identical: {result['identical']}")
+        return
+
+    path = args.input or find_data_file(PROFILE_FILE)
+    if not path:
+        print(f"{PROFILE_FILE} not found (run `git lfs pull` for data/processed/) - use --input")
+        return
+    start = time.perf_counter()
+    distribution = score_file(path, args.output, args.chunk_size)
+    total = sum(distribution.values())
+    print(f"Scored {total:,} patients in {time.perf_counter() - start:.1f}s: " +
+          ", ".join(f"{level} {count:,}" for level, count in distribution.items()))
+    if args.output:
+        print(f"Scores written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
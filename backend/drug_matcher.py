@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Drug Mention Matcher
+Finds known drug names and synonyms in free text with a word-level trie
+compiled once from the interaction index, and answers drug-pair questions
+from the local interaction and side-effect data.
+"""
+
+from itertools import combinations
+from typing import Dict, List, Any, Optional
+
+from interaction_index import DrugInteractionIndex, normalize_drug_name
+
+# DrugBank entries that are also everyday words in a question ("with water")
+COMMON_WORD_NAMES = {"water", "oxygen", "air", "salt", "sugar", "alcohol", "ice", "honey", "milk", "caffeine"}
+MIN_NAME_LENGTH = 3
+MAX_DRUGS = 8
+
+SEVERITY_WORDING = {
+    "severe": "a severe interaction",
+    "high": "a high-risk interaction",
+    "moderate": "a moderate interaction",
+    "low": "a minor interaction",
+}
+
+_END = ""
+
+
+class DrugMatcher:
+    """
+    Maximal-munch matching over whole words: "insulin glargine" wins over
+    "insulin", and names never match inside a longer word
+    """
+
+    def __init__(self, index: DrugInteractionIndex):
+        self.index = index
+        self._trie: Dict[str, Any] = {}
+        for name, drug_id in index.name_to_id.items():
+            if len(name) < MIN_NAME_LENGTH or name in COMMON_WORD_NAMES:
+                continue
+            node = self._trie
+            for word in name.split():
+                node = node.setdefault(word, {})
+            node[_END] = drug_id
+
+    def find(self, text: str) -> List[str]:
+        """DrugBank ids mentioned in text, in order of first mention"""
+        words = normalize_drug_name(text).split()
+        found: List[str] = []
+        position = 0
+        while position < len(words):
+            node, match_id, match_end = self._trie, None, position
+            for offset in range(position, len(words)):
+                node = node.get(words[offset])
+                if node is None:
+                    break
+                if _END in node:
+                    match_id, match_end = node[_END], offset + 1
+            if match_id:
+                if match_id not in found:
+                    found.append(match_id)
+                position = match_end
+            else:
+                position += 1
+        return found
+
+
+def _effect_names(index: DrugInteractionIndex, drug_id: str) -> List[str]:
+    return [se["effect"] for se in index.side_effects.get(drug_id, [])]
+
+
+def pair_details(index: DrugInteractionIndex, id_a: str, id_b: str) -> Dict[str, Any]:
+    name_a, name_b = index.id_to_name[id_a], index.id_to_name[id_b]
+    result = index.lookup_pair(name_a, name_b)
+    effects_b = {effect.lower() for effect in _effect_names(index, id_b)}
+    result["shared_side_effects"] = [e for e in _effect_names(index, id_a) if e.lower() in effects_b]
+    return result
+
+
+def describe_pair(pair: Dict[str, Any]) -> str:
+    title = f"**{pair['drug_a']} + {pair['drug_b']}**"
+    if pair["severity"] == "none":
+        lines = [f"{title}: no interaction is recorded in PolyRisk's local data "
+                 f"(this does not prove the combination is safe)."]
+    else:
+        lines = [f"{title}: {SEVERITY_WORDING.get(pair['severity'], pair['severity'] + ' interaction')} "
+                 f"is recorded (risk score {pair['risk_score']}/100)."]
+        if pair["side_effects"]:
+            lines.append("Reported with the combination: " + ", ".join(pair["side_effects"]) + ".")
+    if pair["shared_side_effects"]:
+        lines.append("Side effects both drugs can cause (may add up): "
+                     + ", ".join(pair["shared_side_effects"]) + ".")
+    return "\n".join(lines)
+
+
+def answer_drug_pairs(index: DrugInteractionIndex, matcher: DrugMatcher,
+                      question: str) -> Optional[Dict[str, Any]]:
+    """
+    Local answer when the question names two or more known drugs, else None.
+    Pairs are listed most severe first.
+    """
+    drug_ids = matcher.find(question)[:MAX_DRUGS]
+    if len(drug_ids) < 2:
+        return None
+    pairs = [pair_details(index, a, b) for a, b in combinations(drug_ids, 2)]
+    pairs.sort(key=lambda pair: pair["risk_score"], reverse=True)
+    text = "\n\n".join(describe_pair(pair) for pair in pairs)
+    text += ("\n\nThis comes from PolyRisk's local interaction database. Please confirm medication "
+             "decisions with a healthcare professional.")
+    return {
+        "drugs": [index.id_to_name[drug_id] for drug_id in drug_ids],
+        "interactions": pairs,
+        "response": text
+    }
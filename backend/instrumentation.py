@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Instrumentation
+Shared in-process metrics registry rendered in Prometheus text format at
+/metrics, with request middleware for FastAPI and Flask and a timed()
+helper for hot paths. Set POLYRISK_METRICS=0 to turn it all into no-ops.
+"""
+
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+ENABLED = os.getenv("POLYRISK_METRICS", "1") != "0"
+# Per-request phase breakdowns (profiling.py), opt-in; timers stay in place unless both are off
+PHASES_ENABLED = os.getenv("POLYRISK_PROFILING", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[Any, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or computed by a callback at scrape time (free between scrapes)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._functions: Dict[Tuple[Any, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                items[key] = fn()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, cls, name: str, help_text: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, tuple(labelnames), **kwargs)
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.get_or_create(Counter, name, help_text, labelnames)
+
+
+def gauge(name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.get_or_create(Gauge, name, help_text, labelnames)
+
+
+def histogram(name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+# ==========================================================
+# Shared metrics
+# ==========================================================
+REQUEST_SECONDS = histogram("polyrisk_http_request_duration_seconds", "HTTP request latency by route",
+                            ("service", "method", "route", "status"))
+REQUESTS_IN_FLIGHT = gauge("polyrisk_http_requests_in_flight", "HTTP requests currently being served",
+                           ("service",))
+OPERATION_SECONDS = histogram("polyrisk_operation_duration_seconds",
+                              "Hot-path timings (storage, parse, analytics, LLM, lookups)", ("operation",))
+OPERATION_ERRORS = counter("polyrisk_operation_errors_total", "Hot-path operations that raised", ("operation",))
+CACHE_HIT_RATIO = gauge("polyrisk_cache_hit_ratio", "Hit ratio of in-process caches", ("cache",))
+QUEUE_DEPTH = gauge("polyrisk_queue_depth", "Callers waiting on shared or queued work", ("queue",))
+
+
+# Server-Timing phase of each timed operation (first matching prefix; default "compute")
+OPERATION_PHASES = [
+    ("storage", ("storage_", "state_load", "state_save", "patient_data_", "manifest_")),
+    ("parse", ("json_parse",)),
+    ("llm", ("llm_",)),
+    ("serialize", ("serialize",)),
+]
+
+
+def phase_for(operation: str) -> str:
+    for phase, prefixes in OPERATION_PHASES:
+        if operation.startswith(prefixes):
+            return phase
+    return "compute"
+
+
+class PhaseTimer:
+    """Exclusive time per phase for one request (nested operations are not double counted)"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._children: List[float] = []
+        self._lock = threading.Lock()
+
+    def push(self):
+        with self._lock:
+            self._children.append(0.0)
+
+    def pop(self, operation: str, elapsed: float):
+        with self._lock:
+            children = self._children.pop() if self._children else 0.0
+            phase = phase_for(operation)
+            self.phases[phase] = self.phases.get(phase, 0.0) + max(elapsed - children, 0.0)
+            if self._children:
+                self._children[-1] += elapsed
+
+
+PHASE_TIMER: contextvars.ContextVar = contextvars.ContextVar("polyrisk_phase_timer", default=None)
+
+
+class timed:
+    """
+    Record how long an operation takes, as a context manager or decorator:
+
+        with timed("llm_call"):
+            ...
+
+        @timed("storage_save")
+        def write(...): ...
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._start: Optional[float] = None
+        self._phases: Optional[PhaseTimer] = None
+
+    def __enter__(self):
+        self._phases = PHASE_TIMER.get()
+        if ENABLED or self._phases is not None:
+            self._start = time.perf_counter()
+            if self._phases is not None:
+                self._phases.push()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is not None:
+            elapsed = time.perf_counter() - self._start
+            if ENABLED:
+                OPERATION_SECONDS.observe(elapsed, operation=self.operation)
+                if exc_type is not None:
+                    OPERATION_ERRORS.inc(operation=self.operation)
+            if self._phases is not None:
+                self._phases.pop(self.operation, elapsed)
+        return False
+
+    def __call__(self, fn: Callable) -> Callable:
+        if not ENABLED and not PHASES_ENABLED:
+            return fn
+        operation = self.operation
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def cache_ratio(cache: str, stats: Callable[[], Tuple[int, int]]):
+    """Export hits / (hits + misses) for a cache; stats() returns (hits, misses), read at scrape time"""
+    def ratio() -> float:
+        hits, misses = stats()
+        return hits / (hits + misses) if hits + misses else 0.0
+    if ENABLED:
+        CACHE_HIT_RATIO.set_function(ratio, cache=cache)
+
+
+def queue_depth(queue: str, depth: Callable[[], float]):
+    """Export a queue depth computed at scrape time"""
+    if ENABLED:
+        QUEUE_DEPTH.set_function(depth, queue=queue)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ==========================================================
+# Framework integration
+# ==========================================================
+def instrument_fastapi(app, service: str):
+    """Per-route latency and in-flight middleware plus GET /metrics"""
+    if not ENABLED:
+        return
+    from fastapi import Request
+    from fastapi.responses import Response
+
+    @app.middleware("http")
+    async def metrics_middleware(request: Request, call_next):
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(service=service)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec(service=service)
+            route = request.scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, service=service, method=request.method,
+                                    route=getattr(route, "path", "<unmatched>"), status=status)
+
+    async def metrics_endpoint():
+        return Response(render(), media_type=CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+def instrument_flask(app, service: str):
+    """Same request metrics for the Flask app"""
+    if not ENABLED:
+        return
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(service=service)
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            REQUESTS_IN_FLIGHT.dec(service=service)
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, service=service, method=request.method,
+                                    route=route, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _release_in_flight(exc):
+        # after_request is skipped when a view raises; keep the gauge balanced
+        if g.pop("_metrics_start", None) is not None:
+            REQUESTS_IN_FLIGHT.dec(service=service)
+
+    app.add_url_rule("/metrics", "metrics", lambda: Response(render(), mimetype=CONTENT_TYPE))
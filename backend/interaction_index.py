@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Local Drug Interaction Index
+Loads the processed DrugBank / SIDER / TWOSIDES data once and answers
+drug-pair and side-effect lookups in memory
+"""
+
+import csv
+import os
+import re
+from itertools import combinations
+from typing import Dict, List, Any, Optional, Tuple
+
+from instrumentation import timed
+
+# Data lives in the repository root; the backend is started from backend/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIRS = [
+    os.path.join(REPO_ROOT, "data", "processed"),
+    os.path.join(REPO_ROOT, "public", "data", "processed"),
+]
+
+# Same ordering/weights as calculateInteractionRiskScore in the frontend
+SEVERITY_RANK = {"low": 1, "moderate": 2, "high": 3, "severe": 4}
+
+# Interaction risk_score (0-100) used by the scoring rubric in /analyze_patient
+SEVERITY_RISK_SCORE = {"low": 20, "moderate": 50, "high": 70, "severe": 90}
+NO_KNOWN_INTERACTION = "No known interaction in local interaction data"
+
+# Side-effect keywords used to infer the organs a drug affects
+ORGAN_KEYWORDS = {
+    "Kidney": ["renal", "kidney", "nephr", "creatinine", "urinary retention"],
+    "Liver": ["hepat", "liver", "jaundice", "bilirubin", "transaminase", "cholesta"],
+    "Heart": ["cardiac", "heart", "arrhythm", "tachycard", "bradycard", "qt prolong", "myocard"],
+    "Blood": ["bleed", "haemorrh", "hemorrh", "anaemia", "anemia", "thrombocytopen", "neutropen"],
+    "Brain": ["dizz", "confusion", "somnolence", "seizure", "convulsion", "delirium", "sedation"],
+    "Stomach": ["gastro", "nausea", "vomit", "ulcer", "dyspepsia", "diarrh"],
+}
+
+MAX_SIDE_EFFECTS_PER_ENTRY = 8
+
+# Candidate column names for the processed CSVs (header names vary between exports)
+DRUG_ID_COLUMNS = ["DrugBank ID", "drugbank_id", "drug_id", "id"]
+DRUG_NAME_COLUMNS = ["Name", "name", "drug_name"]
+SIDE_EFFECT_COLUMNS = ["side_effect", "side_effect_name", "MedDRA_term", "effect"]
+FREQUENCY_COLUMNS = ["frequency", "freq"]
+SYNONYM_COLUMNS = ["Synonyms", "synonyms", "synonym"]
+
+# Everyday names that differ from the DrugBank name (alias -> DrugBank name)
+COMMON_DRUG_ALIASES = {
+    "aspirin": "Acetylsalicylic acid",
+    "asa": "Acetylsalicylic acid",
+    "paracetamol": "Acetaminophen",
+    "tylenol": "Acetaminophen",
+    "advil": "Ibuprofen",
+    "motrin": "Ibuprofen",
+    "aleve": "Naproxen",
+    "coumadin": "Warfarin",
+    "plavix": "Clopidogrel",
+    "eliquis": "Apixaban",
+    "xarelto": "Rivaroxaban",
+    "lipitor": "Atorvastatin",
+    "zocor": "Simvastatin",
+    "glucophage": "Metformin",
+    "lasix": "Furosemide",
+    "prilosec": "Omeprazole",
+    "zoloft": "Sertraline",
+    "prozac": "Fluoxetine",
+    "lanoxin": "Digoxin",
+    "norvasc": "Amlodipine",
+    "synthroid": "Levothyroxine",
+    "viagra": "Sildenafil",
+}
+
+
+def normalize_drug_name(name: str) -> str:
+    """Lower-case a drug name and collapse punctuation/whitespace"""
+    return re.sub(r"[^a-z0-9]+", " ", str(name).lower()).strip()
+
+
+def drugbank_to_stitch_id(drugbank_id: str) -> Optional[str]:
+    """Convert DB00001 to CID000000001 (same simplified mapping as the frontend)"""
+    if drugbank_id and drugbank_id.startswith("DB"):
+        return "CID" + drugbank_id[2:].zfill(9)
+    return None
+
+
+def _find_data_file(filename: str) -> Optional[str]:
+    for data_dir in DATA_DIRS:
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path) and not _is_lfs_pointer(path):
+            return path
+    return None
+
+
+def _is_lfs_pointer(path: str) -> bool:
+    """Git LFS placeholders are tiny text files instead of the real CSV"""
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.readline().startswith("version https://git-lfs")
+    except OSError:
+        return True
+
+
+def _pick_column(fieldnames: List[str], candidates: List[str]) -> Optional[str]:
+    for candidate in candidates:
+        if candidate in fieldnames:
+            return candidate
+    return None
+
+
+def infer_organs(side_effects: List[str]) -> List[Dict[str, str]]:
+    """Infer affected organs from side-effect names using keyword matching"""
+    organs = []
+    for organ, keywords in ORGAN_KEYWORDS.items():
+        hits = [se for se in side_effects if any(k in se.lower() for k in keywords)]
+        if hits:
+            organs.append({"organ": organ, "effect": ", ".join(hits[:3]), "severity": "Moderate"})
+    return organs
+
+
+class DrugInteractionIndex:
+    """In-memory index over the local drug, side-effect and interaction data"""
+
+    def __init__(self):
+        self.name_to_id: Dict[str, str] = {}
+        self.id_to_name: Dict[str, str] = {}
+        self.side_effects: Dict[str, List[Dict[str, str]]] = {}
+        self.interactions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.loaded = False
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    @timed("interaction_index_load")
+    def load(self, include_interactions: bool = True) -> "DrugInteractionIndex":
+        """Load all available data files; missing files are skipped"""
+        drugs_file = _find_data_file("drugbank_filtered.csv")
+        if drugs_file:
+            self._load_drugs(drugs_file)
+
+        side_effects_file = _find_data_file("side_effects_mapping.csv")
+        if side_effects_file:
+            self._load_side_effects(side_effects_file)
+
+        interactions_file = _find_data_file("drug_interactions.csv") if include_interactions else None
+        if interactions_file:
+            self._load_interactions(interactions_file)
+
+        self._add_aliases(COMMON_DRUG_ALIASES)
+        self.loaded = True
+        print(f"Interaction index loaded: {len(self.id_to_name)} drugs, "
+              f"{len(self.side_effects)} with side effects, {len(self.interactions)} interacting pairs")
+        return self
+
+    def _load_drugs(self, path: str):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            id_name = _pick_column(header, DRUG_ID_COLUMNS)
+            drug_name = _pick_column(header, DRUG_NAME_COLUMNS)
+            synonyms_name = _pick_column(header, SYNONYM_COLUMNS)
+            # Fall back to the positional layout used by the frontend loader
+            id_col = header.index(id_name) if id_name else 0
+            name_col = header.index(drug_name) if drug_name else 1
+            synonyms_col = header.index(synonyms_name) if synonyms_name else None
+            synonyms = {}
+            for row in reader:
+                if len(row) <= max(id_col, name_col):
+                    continue
+                drug_id, name = row[id_col].strip(), row[name_col].strip()
+                if drug_id and name:
+                    self.name_to_id[normalize_drug_name(name)] = drug_id
+                    self.id_to_name[drug_id] = name
+                    if synonyms_col is not None and synonyms_col < len(row):
+                        for synonym in re.split(r"[|;]", row[synonyms_col]):
+                            synonyms.setdefault(normalize_drug_name(synonym), drug_id)
+        # Primary names win over another drug's synonym
+        for synonym, drug_id in synonyms.items():
+            if synonym:
+                self.name_to_id.setdefault(synonym, drug_id)
+
+    def _add_aliases(self, aliases: Dict[str, str]):
+        for alias, name in aliases.items():
+            drug_id = self.name_to_id.get(normalize_drug_name(name))
+            if drug_id:
+                self.name_to_id.setdefault(normalize_drug_name(alias), drug_id)
+
+    def _load_side_effects(self, path: str):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            id_col = _pick_column(fieldnames, DRUG_ID_COLUMNS)
+            effect_col = _pick_column(fieldnames, SIDE_EFFECT_COLUMNS)
+            freq_col = _pick_column(fieldnames, FREQUENCY_COLUMNS)
+            if not id_col or not effect_col:
+                print(f"Warning: unrecognised side effect columns in {path}: {fieldnames}")
+                return
+            for row in reader:
+                drug_id, effect = row.get(id_col), row.get(effect_col)
+                if not drug_id or not effect:
+                    continue
+                effects = self.side_effects.setdefault(drug_id, [])
+                if len(effects) < MAX_SIDE_EFFECTS_PER_ENTRY:
+                    effects.append({
+                        "effect": effect,
+                        "frequency": (row.get(freq_col) if freq_col else None) or "Unknown"
+                    })
+
+    def _load_interactions(self, path: str):
+        # Columns: drug1, drug2, side_effect, severity, interaction_type, severity_numeric, has_interaction
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 7 or row[6].strip() != "1":
+                    continue
+                key = tuple(sorted((row[0].strip(), row[1].strip())))
+                severity = row[3].strip().lower()
+                entry = self.interactions.get(key)
+                if entry is None:
+                    entry = self.interactions[key] = {
+                        "severity": severity,
+                        "interaction_type": row[4].strip(),
+                        "side_effects": []
+                    }
+                elif SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(entry["severity"], 0):
+                    entry["severity"] = severity
+                    entry["interaction_type"] = row[4].strip()
+                if len(entry["side_effects"]) < MAX_SIDE_EFFECTS_PER_ENTRY and row[2].strip():
+                    entry["side_effects"].append(row[2].strip())
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def resolve_drug(self, name: str) -> Optional[str]:
+        """Return the DrugBank ID for a drug name, or None if unknown"""
+        return self.name_to_id.get(normalize_drug_name(name))
+
+    def is_known(self, name: str) -> bool:
+        return self.resolve_drug(name) is not None
+
+    def get_side_effects(self, name: str) -> List[Dict[str, str]]:
+        drug_id = self.resolve_drug(name)
+        return list(self.side_effects.get(drug_id, [])) if drug_id else []
+
+    def lookup_pair(self, drug_a: str, drug_b: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a drug pair.
+        Returns None when either drug is unknown, otherwise the recorded
+        interaction (severity "none", risk_score 0 when both drugs are known
+        but no interaction is recorded for the pair).
+        """
+        id_a, id_b = self.resolve_drug(drug_a), self.resolve_drug(drug_b)
+        if not id_a or not id_b:
+            return None
+
+        key = tuple(sorted((drugbank_to_stitch_id(id_a), drugbank_to_stitch_id(id_b))))
+        entry = self.interactions.get(key)
+        if entry is None:
+            return {
+                "drug_a": drug_a,
+                "drug_b": drug_b,
+                "severity": "none",
+                "risk_score": 0,
+                "interaction": NO_KNOWN_INTERACTION,
+                "side_effects": []
+            }
+        return {
+            "drug_a": drug_a,
+            "drug_b": drug_b,
+            "severity": entry["severity"],
+            "risk_score": SEVERITY_RISK_SCORE.get(entry["severity"], 0),
+            "interaction": f"{entry['interaction_type'] or 'Recorded'} interaction ({entry['severity']})",
+            "side_effects": list(entry["side_effects"])
+        }
+
+    @timed("interaction_lookup")
+    def lookup_pairs(self, names: List[str]) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """
+        Split all pairs of the given drugs into (resolved, unresolved).
+        Pairs of two known drugs are resolved, as their recorded interaction
+        or as "no known interaction"; only pairs with an unknown drug remain.
+        """
+        resolved, unresolved = [], []
+        for drug_a, drug_b in combinations(names, 2):
+            result = self.lookup_pair(drug_a, drug_b)
+            if result is None:
+                unresolved.append((drug_a, drug_b))
+            else:
+                resolved.append(result)
+        return resolved, unresolved
+
+
+_index: Optional[DrugInteractionIndex] = None
+
+
+def get_interaction_index() -> DrugInteractionIndex:
+    """Return the process-wide index, loading it on first use"""
+    global _index
+    if _index is None:
+        _index = DrugInteractionIndex().load()
+    return _index
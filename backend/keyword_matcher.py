@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Keyword Intent Matcher
+Aho-Corasick automaton over every FAQ keyword, built once, so matching a
+message costs one pass over its characters however many intents exist
+"""
+
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Lower-case and collapse whitespace so keywords match regardless of spacing"""
+    return re.sub(r"\s+", " ", str(text).lower()).strip()
+
+
+class Intent:
+    """A predefined answer and the keywords that trigger it"""
+
+    def __init__(self, name: str, keywords: List[str], response: str, priority: int = 0):
+        self.name = name
+        self.keywords = [normalize_text(k) for k in keywords if normalize_text(k)]
+        self.response = response
+        self.priority = priority
+
+
+class IntentMatch:
+    def __init__(self, intent: Intent, keyword: str, start: int):
+        self.intent = intent
+        self.keyword = keyword
+        self.start = start
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.keyword)
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher (goto / failure / output tables)"""
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, index: int):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Inherit matches that end here via the failure state (suffix patterns)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """Yield (start, pattern_index) for every occurrence of every pattern"""
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._output[state]:
+                yield position - len(self.patterns[index]) + 1, index
+
+
+class IntentMatcher:
+    """
+    Picks one intent per message: highest priority first, then the longest
+    matched keyword, then the earliest match
+    """
+
+    def __init__(self, intents: List[Intent], whole_words: bool = True):
+        self.intents = intents
+        self.whole_words = whole_words
+        self._keywords: List[Tuple[str, Intent]] = [(k, intent) for intent in intents for k in intent.keywords]
+        self._automaton = AhoCorasick([keyword for keyword, _ in self._keywords])
+
+    def __len__(self) -> int:
+        return len(self.intents)
+
+    def _at_word_boundary(self, text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
+
+    def match_all(self, message: str) -> List[IntentMatch]:
+        text = normalize_text(message)
+        matches = []
+        for start, index in self._automaton.iter_matches(text):
+            keyword, intent = self._keywords[index]
+            if self.whole_words and not self._at_word_boundary(text, start, start + len(keyword)):
+                continue
+            matches.append(IntentMatch(intent, keyword, start))
+        return matches
+
+    def match(self, message: str) -> Optional[IntentMatch]:
+        best = None
+        for candidate in self.match_all(message):
+            if best is None or (
+                (candidate.intent.priority, len(candidate.keyword), -candidate.start) >
+                (best.intent.priority, len(best.keyword), -best.start)
+            ):
+                best = candidate
+        return best
+
+
+def load_faq_intents(path: str) -> List[Intent]:
+    """
+    Load intents from a FAQ JSON file:
+        [{"intent": "...", "keywords": ["..."], "response": "...", "priority": 0}, ...]
+    """
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading FAQ intents from {path}: {e}")
+        return []
+    if isinstance(entries, dict):
+        entries = entries.get("intents", [])
+
+    intents = []
+    for i, entry in enumerate(entries):
+        keywords = entry.get("keywords") or []
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if keywords and entry.get("response"):
+            intents.append(Intent(entry.get("intent") or f"faq_{i}", keywords, entry["response"],
+                                  int(entry.get("priority", 0))))
+    return intents
+
+
+def build_intent_matcher(predefined: Dict[str, str], faq_path: Optional[str] = None) -> IntentMatcher:
+    """Matcher over the built-in keyword -> response table plus an optional FAQ file"""
+    intents = [Intent(keyword, [keyword], response) for keyword, response in predefined.items()]
+    intents.extend(load_faq_intents(faq_path))
+    return IntentMatcher(intents)
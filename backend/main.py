@@ -6,6 +6,8 @@ import json
 from pathlib import Path
 from datetime import datetime
 import uvicorn
+from instrumentation import instrument_fastapi, timed
+from summary_stats import PatientSummary
 
 app = FastAPI(title="PolyRisk AI Patient Data API", version="1.0.0")
 
@@ -18,6 +20,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus metrics at /metrics (POLYRISK_METRICS=0 disables)
+instrument_fastapi(app, "main")
+
 # Path to JSON file
 FILE_PATH = Path("patient_data.json")
 BACKUP_PATH = Path("patient_data_backup.json")
@@ -61,6 +66,7 @@ class AnalysisResult(BaseModel):
     timestamp: str
 
 # Utility functions
+@timed("patient_data_load")
 def load_existing_data():
     """Load existing patient data from file"""
     if FILE_PATH.exists():
@@ -72,6 +78,7 @@ def load_existing_data():
             return {"patients": [], "analyses": []}
     return {"patients": [], "analyses": []}
 
+@timed("patient_data_save")
 def save_data(data):
     """Save data to file with backup"""
     try:
@@ -222,25 +229,21 @@ async def get_stats():
     try:
         all_data = load_existing_data()
         
-        # Calculate some basic stats
-        total_patients = len(all_data["patients"])
-        total_analyses = len(all_data["analyses"])
-        
-        # Count polypharmacy cases
-        polypharmacy_count = sum(1 for p in all_data["patients"] 
-                               if p["data"]["patient_data"]["polypharmacy_risk"])
-        
-        # Age distribution
-        ages = [p["data"]["patient_data"]["age"] for p in all_data["patients"]]
-        avg_age = sum(ages) / len(ages) if ages else 0
+        # All patient stats in one pass
+        summary = PatientSummary()
+        for p in all_data["patients"]:
+            summary.add_patient(p["data"]["patient_data"])
         
         return {
             "status": "success",
             "statistics": {
-                "total_patients": total_patients,
-                "total_analyses": total_analyses,
-                "polypharmacy_cases": polypharmacy_count,
-                "average_age": round(avg_age, 1),
+                "total_patients": summary.total,
+                "total_analyses": len(all_data["analyses"]),
+                "polypharmacy_cases": summary.polypharmacy,
+                "average_age": round(summary.average_age, 1),
+                "age_groups": summary.age_groups.to_dict(),
+                "kidney_impairment": summary.kidney_impairment,
+                "liver_impairment": summary.liver_impairment,
                 "file_size_kb": round(FILE_PATH.stat().st_size / 1024, 2) if FILE_PATH.exists() else 0
             }
         }
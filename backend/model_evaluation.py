@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Model Evaluation
+Streams the labeled processed datasets in chunks, runs the local risk
+scorers in vectorized batches and writes accuracy, per-severity
+precision/recall, AUC and calibration to an artifact served by
+/api/model-accuracy
+
+Usage:
+    python model_evaluation.py [--workers N] [--chunk-size 50000] [--output model_evaluation.json]
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from analyze_patients import run_ordered
+from interaction_index import (DATA_DIRS, SEVERITY_RANK, SEVERITY_RISK_SCORE, get_interaction_index,
+                               normalize_drug_name)
+
+EVALUATION_FILE = "model_evaluation.json"
+CHUNK_SIZE = 50_000
+SCORE_BINS = 101          # histogram resolution for AUC (scores are 0-1)
+BASE_SCORE_MAX = 5        # calculate_risk_score: age 3 + kidney 1 + liver 1
+CALIBRATION_BINS = 10
+
+PAIR_FILE = "drug_pairs_features.csv"
+# The pair labels come from the same processed interaction data the index is
+# built from, so the pair metric checks the index against its source data
+PAIR_METRIC_NOTE = ("consistency check: interaction-index lookups scored against labels from the same "
+                    "processed interaction data, not an independent measure of prediction quality")
+PROFILE_FILE = "patient_profiles.csv"
+PATIENT_DRUG_FILE = "patient_drug_features.csv"
+
+SEVERITY_LABELS = ["none", "low", "moderate", "high", "severe"]
+RISK_LEVEL_LABELS = ["Low", "Moderate", "High"]
+
+# Candidate column names (header names vary between exports)
+PAIR_COLUMNS = {
+    "drug1": ["drug1", "drug_1", "drug_a", "drug1_id", "stitch_id_1", "drug1_name"],
+    "drug2": ["drug2", "drug_2", "drug_b", "drug2_id", "stitch_id_2", "drug2_name"],
+    "severity": ["severity", "interaction_severity", "severity_label"],
+    "severity_numeric": ["severity_numeric", "severity_score", "severity_level"],
+    "has_interaction": ["has_interaction", "interaction", "is_interaction"]
+}
+PROFILE_COLUMNS = {
+    "patient_id": ["patient_id", "id", "patient"],
+    "age": ["age", "patient_age"],
+    "kidney": ["kidney_function", "renal_function", "kidney"],
+    "liver": ["liver_function", "hepatic_function", "liver"],
+    "label": ["risk_level", "risk_category", "risk_label", "label"]
+}
+PATIENT_DRUG_COLUMNS = {
+    "patient_id": ["patient_id", "id", "patient"],
+    "drug": ["drug_id", "drugbank_id", "stitch_id", "drug", "drug_name", "name"]
+}
+
+
+def find_data_file(filename: str) -> Optional[str]:
+    """First real (non git-LFS placeholder) copy of a processed data file"""
+    for data_dir in DATA_DIRS:
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                if not f.readline().startswith("version https://git-lfs"):
+                    return path
+    return None
+
+
+def detect_columns(header: List[str], candidates: Dict[str, List[str]]) -> Dict[str, Optional[str]]:
+    """Map logical names to actual columns, case-insensitively"""
+    lookup = {column.strip().lower(): column for column in header}
+    return {name: next((lookup[c.lower()] for c in options if c.lower() in lookup), None)
+            for name, options in candidates.items()}
+
+
+# ==========================================================
+# Mergeable metrics
+# ==========================================================
+class ClassificationMetrics:
+    """Confusion matrix plus score histograms; chunk results are merged by addition"""
+
+    def __init__(self, labels: List[str]):
+        self.labels = labels
+        self.confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        self.positive_hist = np.zeros(SCORE_BINS, dtype=np.int64)
+        self.negative_hist = np.zeros(SCORE_BINS, dtype=np.int64)
+        self.calibration_count = np.zeros(CALIBRATION_BINS, dtype=np.int64)
+        self.calibration_predicted = np.zeros(CALIBRATION_BINS)
+        self.calibration_positive = np.zeros(CALIBRATION_BINS, dtype=np.int64)
+
+    def update(self, true_labels: pd.Series, predicted: pd.Series, scores: np.ndarray, positive: np.ndarray):
+        """Add one batch; scores are probabilities in [0, 1], positive is a boolean mask"""
+        codes = {label: i for i, label in enumerate(self.labels)}
+        true_idx = true_labels.map(codes)
+        pred_idx = predicted.map(codes)
+        known = true_idx.notna() & pred_idx.notna()
+        n = len(self.labels)
+        flat = true_idx[known].astype(np.int64).to_numpy() * n + pred_idx[known].astype(np.int64).to_numpy()
+        self.confusion += np.bincount(flat, minlength=n * n).reshape(n, n)
+
+        scores = np.clip(np.asarray(scores, dtype=float), 0.0, 1.0)
+        positive = np.asarray(positive, dtype=bool)
+        score_bins = np.rint(scores * (SCORE_BINS - 1)).astype(np.int64)
+        self.positive_hist += np.bincount(score_bins[positive], minlength=SCORE_BINS)
+        self.negative_hist += np.bincount(score_bins[~positive], minlength=SCORE_BINS)
+
+        calibration_bins = np.minimum((scores * CALIBRATION_BINS).astype(np.int64), CALIBRATION_BINS - 1)
+        self.calibration_count += np.bincount(calibration_bins, minlength=CALIBRATION_BINS)
+        self.calibration_predicted += np.bincount(calibration_bins, weights=scores, minlength=CALIBRATION_BINS)
+        self.calibration_positive += np.bincount(calibration_bins[positive], minlength=CALIBRATION_BINS)
+
+    def merge(self, other: "ClassificationMetrics"):
+        for name in ("confusion", "positive_hist", "negative_hist", "calibration_count",
+                     "calibration_predicted", "calibration_positive"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def auc(self) -> Optional[float]:
+        """ROC AUC from the score histograms (ties count half)"""
+        positives, negatives = self.positive_hist.sum(), self.negative_hist.sum()
+        if positives == 0 or negatives == 0:
+            return None
+        negatives_below = np.concatenate(([0], np.cumsum(self.negative_hist)[:-1]))
+        wins = (self.positive_hist * negatives_below).sum() + 0.5 * (self.positive_hist * self.negative_hist).sum()
+        return float(wins / (positives * negatives))
+
+    def report(self) -> Dict[str, Any]:
+        total = int(self.confusion.sum())
+        correct = int(np.trace(self.confusion))
+        per_class = {}
+        for i, label in enumerate(self.labels):
+            predicted = self.confusion[:, i].sum()
+            actual = self.confusion[i, :].sum()
+            per_class[label] = {
+                "support": int(actual),
+                "precision": round(float(self.confusion[i, i] / predicted), 4) if predicted else None,
+                "recall": round(float(self.confusion[i, i] / actual), 4) if actual else None
+            }
+        calibration = []
+        for i in range(CALIBRATION_BINS):
+            count = int(self.calibration_count[i])
+            if count:
+                calibration.append({
+                    "bin": f"{i / CALIBRATION_BINS:.1f}-{(i + 1) / CALIBRATION_BINS:.1f}",
+                    "count": count,
+                    "mean_predicted": round(float(self.calibration_predicted[i] / count), 4),
+                    "observed_rate": round(float(self.calibration_positive[i] / count), 4)
+                })
+        auc = self.auc()
+        return {
+            "total": total,
+            "correct": correct,
+            "accuracy": round(correct / total, 4) if total else None,
+            "per_class": per_class,
+            "auc": round(auc, 4) if auc is not None else None,
+            "calibration": calibration,
+            "confusion_matrix": {"labels": self.labels, "matrix": self.confusion.tolist()}
+        }
+
+
+# ==========================================================
+# Vectorized scorers
+# ==========================================================
+_severity_lookup: Optional[Dict[str, str]] = None
+
+
+def _init_worker():
+    """Build the pair-key -> severity map once per process"""
+    global _severity_lookup
+    if _severity_lookup is None:
+        index = get_interaction_index()
+        _severity_lookup = {f"{a}|{b}": entry["severity"] for (a, b), entry in index.interactions.items()}
+
+
+def to_stitch_ids(values: pd.Series) -> pd.Series:
+    """DrugBank ids, STITCH ids or drug names -> STITCH CIDs (NaN when unknown)"""
+    values = values.astype(str).str.strip()
+    is_id = values.str.startswith(("CID", "DB"))
+    if not is_id.all():
+        name_to_id = get_interaction_index().name_to_id
+        values = values.where(is_id, values.map(lambda name: name_to_id.get(normalize_drug_name(name))))
+    is_drugbank = values.str.startswith("DB", na=False)
+    values = values.where(~is_drugbank, "CID" + values.str[2:].str.zfill(9))
+    return values.where(values.str.startswith("CID", na=False))
+
+
+def pair_keys(drug_a: pd.Series, drug_b: pd.Series) -> pd.Series:
+    a, b = to_stitch_ids(drug_a), to_stitch_ids(drug_b)
+    low = a.where(a <= b, b)
+    high = b.where(a <= b, a)
+    return (low + "|" + high).where(a.notna() & b.notna())
+
+
+def predict_pair_severity(keys: pd.Series) -> pd.Series:
+    _init_worker()
+    return keys.map(_severity_lookup).fillna("none")
+
+
+def true_pair_severity(frame: pd.DataFrame, columns: Dict[str, Optional[str]]) -> pd.Series:
+    if columns["severity"]:
+        severity = frame[columns["severity"]].astype(str).str.strip().str.lower()
+    elif columns["severity_numeric"]:
+        by_rank = {rank: label for label, rank in SEVERITY_RANK.items()}
+        severity = pd.to_numeric(frame[columns["severity_numeric"]], errors="coerce").round().map(by_rank)
+    else:
+        severity = pd.Series("low", index=frame.index)
+    if columns["has_interaction"]:
+        has_interaction = pd.to_numeric(frame[columns["has_interaction"]], errors="coerce").fillna(1) > 0
+        severity = severity.where(has_interaction, "none")
+    return severity.where(severity.isin(SEVERITY_LABELS), "none")
+
+
+def evaluate_pair_chunk(args) -> ClassificationMetrics:
+    """Worker: score one chunk of labeled drug pairs with the local interaction index"""
+    frame, columns = args
+    metrics = ClassificationMetrics(SEVERITY_LABELS)
+    predicted = predict_pair_severity(pair_keys(frame[columns["drug1"]], frame[columns["drug2"]]))
+    actual = true_pair_severity(frame, columns)
+    scores = predicted.map(SEVERITY_RISK_SCORE).fillna(0).to_numpy() / 100
+    # "Positive" = clinically significant interaction
+    metrics.update(actual, predicted, scores, actual.isin(["high", "severe"]).to_numpy())
+    return metrics
+
+
+def medication_counts_by_patient(path: str, chunk_size: int) -> pd.Series:
+    """Distinct drugs per patient, counted chunk by chunk (only one count per patient is kept)"""
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    columns = detect_columns(header, PATIENT_DRUG_COLUMNS)
+    if not columns["patient_id"] or not columns["drug"]:
+        return pd.Series(dtype=np.int64)
+    counts = pd.Series(dtype=np.int64)
+    for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=[columns["patient_id"], columns["drug"]]):
+        # Rows of one patient may span chunks, so duplicates are only removed within a chunk
+        chunk = chunk.drop_duplicates()
+        counts = counts.add(chunk[columns["patient_id"]].astype(str).value_counts(), fill_value=0)
+    return counts.astype(np.int64)
+
+
+def evaluate_patients(profile_path: str, drug_path: Optional[str], chunk_size: int) -> Dict[str, Any]:
+    """Score the labeled profiles with cohort_scoring.score_frame, the vectorized calculate_risk_score"""
+    from cohort_scoring import COHORT_COLUMNS, score_frame
+
+    header = pd.read_csv(profile_path, nrows=0).columns.tolist()
+    columns = detect_columns(header, COHORT_COLUMNS)
+    if not columns["age"]:
+        return {"status": "skipped", "reason": "no age column", "columns": header}
+
+    counts = pd.Series(dtype=np.int64)
+    if not columns["medications"] and columns["patient_id"] and drug_path:
+        counts = medication_counts_by_patient(drug_path, chunk_size)
+    metrics = ClassificationMetrics(RISK_LEVEL_LABELS)
+    predicted_counts = {label: 0 for label in RISK_LEVEL_LABELS}
+    polypharmacy = 0
+    for chunk in pd.read_csv(profile_path, chunksize=chunk_size):
+        if not counts.empty:
+            chunk["medications"] = chunk[columns["patient_id"]].astype(str).map(counts).fillna(0)
+            scored = score_frame(chunk, {**columns, "medications": "medications"})
+        else:
+            scored = score_frame(chunk, columns)
+        predicted = scored["risk_level"].astype(str).str.capitalize().reset_index(drop=True)
+        for label, count in predicted.value_counts().items():
+            predicted_counts[label] += int(count)
+        polypharmacy += int(scored["polypharmacy_risk"].sum())
+        if columns["label"]:
+            actual = chunk[columns["label"]].astype(str).str.strip().str.capitalize().reset_index(drop=True)
+            scores = scored["base_score"].to_numpy() / BASE_SCORE_MAX
+            metrics.update(actual, predicted, scores, (actual == "High").to_numpy())
+
+    result = {"status": "ok", "scorer": "cohort_scoring.score_frame", "labeled": bool(columns["label"]),
+              "predicted_distribution": predicted_counts, "polypharmacy": polypharmacy}
+    if columns["label"]:
+        result.update(metrics.report())
+    return result
+
+
+def evaluate_pairs(path: str, chunk_size: int, workers: int) -> Dict[str, Any]:
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    columns = detect_columns(header, PAIR_COLUMNS)
+    if not columns["drug1"] or not columns["drug2"]:
+        return {"status": "skipped", "reason": "no drug pair columns", "columns": header}
+
+    usecols = [c for c in columns.values() if c]
+    chunks = ((chunk, columns) for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=usecols))
+    metrics = ClassificationMetrics(SEVERITY_LABELS)
+    _init_worker()  # build once in the parent so forked workers inherit it
+    # At most 2 * workers chunks in flight, so the CSV is streamed rather than read ahead
+    for partial in run_ordered(evaluate_pair_chunk, chunks, workers):
+        metrics.merge(partial)
+    return {"status": "ok", "metric": "consistency_check", "note": PAIR_METRIC_NOTE, **metrics.report()}
+
+
+# ==========================================================
+# Artifact
+# ==========================================================
+def _file_signature(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def run_evaluation(chunk_size: int = CHUNK_SIZE, workers: int = os.cpu_count() or 1,
+                   output: str = EVALUATION_FILE) -> Dict[str, Any]:
+    """Evaluate every available labeled dataset and write the artifact"""
+    start = time.perf_counter()
+    pair_path = find_data_file(PAIR_FILE)
+    profile_path = find_data_file(PROFILE_FILE)
+    drug_path = find_data_file(PATIENT_DRUG_FILE)
+
+    missing = {"status": "unavailable", "reason": "data file missing or not pulled from git LFS"}
+    result = {
+        "generated_at": datetime.now().isoformat(),
+        "data_files": {name: _file_signature(path) for name, path in
+                       ((PAIR_FILE, pair_path), (PROFILE_FILE, profile_path), (PATIENT_DRUG_FILE, drug_path))},
+        "pair_model": evaluate_pairs(pair_path, chunk_size, workers) if pair_path else missing,
+        "patient_model": evaluate_patients(profile_path, drug_path, chunk_size) if profile_path else missing,
+        "workers": workers,
+        "chunk_size": chunk_size
+    }
+    result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    os.replace(tmp_path, output)
+    return result
+
+
+def load_evaluation(path: str = EVALUATION_FILE) -> Optional[Dict[str, Any]]:
+    """Cached evaluation artifact, or None when it has not been generated"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading model evaluation: {e}")
+        return None
+
+
+def accuracy_summary(evaluation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Map the artifact onto the /api/model-accuracy fields; None when the risk
+    level model was not measured. The headline accuracy and prediction counts
+    are the patient-level ones only; the pair metric is reported on its own as
+    a consistency check (see PAIR_METRIC_NOTE), never added into the totals.
+    """
+    pair = evaluation.get("pair_model", {})
+    patient = evaluation.get("patient_model", {})
+    if patient.get("accuracy") is None:
+        return None
+
+    pair_measured = pair.get("accuracy") is not None
+    return {
+        "model_accuracy": patient["accuracy"],
+        "risk_level_accuracy": patient["accuracy"],
+        "drug_interaction_accuracy": None,  # no independent interaction labels yet
+        "side_effect_accuracy": None,  # no labeled side-effect dataset yet
+        "risk_level_auc": patient.get("auc"),
+        "total_predictions": patient["total"],
+        "correct_predictions": patient["correct"],
+        "drug_interaction_consistency": {
+            "accuracy": pair.get("accuracy"),
+            "auc": pair.get("auc"),
+            "total": pair.get("total"),
+            "correct": pair.get("correct"),
+            "per_severity": pair.get("per_class"),
+            "note": PAIR_METRIC_NOTE
+        } if pair_measured else None,
+        "calibration": {"risk_level": patient.get("calibration", []),
+                        "drug_interaction_consistency": pair.get("calibration", [])},
+        "confidence_level": "High" if patient["total"] >= 1000 else "Moderate",
+        "source": "evaluation",
+        "evaluated_at": evaluation.get("generated_at")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the PolyRisk local scorers on labeled data")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for pair chunks")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--output", default=EVALUATION_FILE, help="artifact path")
+    args = parser.parse_args()
+
+    result = run_evaluation(args.chunk_size, args.workers, args.output)
+    for name in ("pair_model", "patient_model"):
+        section = result[name]
+        if section.get("accuracy") is not None:
+            label = "consistency" if section.get("metric") == "consistency_check" else "accuracy"
+            print(f"{name}: {label} {section['accuracy']:.3f} on {section['total']} rows, AUC {section['auc']}")
+            if section.get("note"):
+                print(f"  ({section['note']})")
+        else:
+            print(f"{name}: {section.get('status')} {section.get('reason', '')}".rstrip())
+    print(f"Evaluation written to {args.output} in {result['elapsed_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
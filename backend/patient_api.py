@@ -10,7 +10,15 @@ from datetime import datetime
 import google.generativeai as genai
 import json
 import os
+import time
 from dotenv import load_dotenv
+from prompt_builder import build_analysis_prompt, assemble_analysis
+from interaction_index import get_interaction_index
+from analysis_parser import parse_model_output, normalize_analysis_record, PARSE_FAILED
+from analysis_store import AnalysisStore
+from analytics_state import MaterializedAnalytics, is_valid_user_id
+from instrumentation import histogram, instrument_fastapi, timed
+from profiling import instrument_profiling
 # DOCX functionality removed as per user request
 
 # ==========================================================
@@ -32,13 +40,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-PolyRisk-Profile-Id"],
 )
 
+# Prometheus metrics at /metrics (POLYRISK_METRICS=0 disables)
+instrument_fastapi(app, "patient_api")
+# Server-Timing / cProfile for requests sent with X-PolyRisk-Profile (or sampled)
+instrument_profiling(app, "patient_api")
+
+# Token sizes per analysis (estimate_tokens); the legacy prompt is estimated, never sent
+PROMPT_TOKENS = histogram("polyrisk_analysis_prompt_tokens",
+                          "Estimated analysis prompt tokens: compact prompt sent vs legacy prompt estimate",
+                          ("prompt",), buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000))
+
+@app.on_event("startup")
+async def warm_interaction_index():
+    """Load the local interaction index before the first analysis request"""
+    get_interaction_index()
+
 # ==========================================================
 # 📂 Utility Function
 # ==========================================================
 DATA_FILE = "patient_data.json"
+analysis_store = AnalysisStore()
+analytics = MaterializedAnalytics(analysis_store)
 
+def check_user_id(user_id: str):
+    """400 for a malformed user_id (it tags and scopes analyses, it does not authorize the caller)"""
+    if not is_valid_user_id(user_id):
+        raise HTTPException(status_code=400, detail="user_id must be 1-64 letters, digits, '_' or '-'")
+
+@timed("patient_data_load")
 def load_patient_data() -> dict:
     """Load patient data from JSON file"""
     if not os.path.exists(DATA_FILE):
@@ -49,6 +81,7 @@ def load_patient_data() -> dict:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading patient data: {str(e)}")
 
+@timed("patient_data_save")
 def save_patient_to_file(new_patient: dict):
     """Append patient data to JSON file"""
     data = load_patient_data()
@@ -78,8 +111,10 @@ async def get_all_patients():
     }
 
 @app.post("/save-patient")
-async def save_patient_data(patient_data: dict):
-    """Save patient data to file"""
+async def save_patient_data(patient_data: dict, user_id: str = None):
+    """Save patient data to file, tagged with the owning user when known"""
+    user_id = user_id or patient_data.get("user_id")
+    check_user_id(user_id)
     try:
         patient_id = f"patient_{len(load_patient_data().get('patients', [])) + 1}_{int(datetime.now().timestamp())}"
         new_patient = {
@@ -87,6 +122,8 @@ async def save_patient_data(patient_data: dict):
             "saved_at": datetime.now().isoformat(),
             "data": patient_data
         }
+        if user_id:
+            new_patient["user_id"] = user_id
         save_patient_to_file(new_patient)
         return {"success": True, "message": "Patient data saved.", "patient_id": patient_id}
     except Exception as e:
@@ -96,8 +133,9 @@ async def save_patient_data(patient_data: dict):
 # 🧠 AI Analysis Endpoint (Gemini Integration)
 # ==========================================================
 @app.post("/analyze_patient")
-async def analyze_patient():
+async def analyze_patient(user_id: str = None):
     """Performs polypharmacy risk analysis using Gemini AI"""
+    check_user_id(user_id)
     try:
         data = load_patient_data()
         patients = data.get("patients", [])
@@ -107,165 +145,60 @@ async def analyze_patient():
         # Use latest patient
         latest_patient = patients[-1]
         patient = latest_patient["data"]["patient_data"]
-        meds = patient["medications"]
-        kidney = patient["kidney_function"].lower()
-        liver = patient["liver_function"].lower()
-
-        # === Calculate Base Risk Score ===
-        base_score = 0
-        
-        # Age-based scoring
-        if 60 <= patient['age'] < 70:
-            base_score += 0.5
-        elif 70 <= patient['age'] < 80:
-            base_score += 1.0
-        elif patient['age'] >= 80:
-            base_score += 1.5
-        
-        # Kidney function scoring
-        kidney_scores = {"normal": 0, "mild": 0.5, "moderate": 1.0, "severe": 1.5}
-        base_score += kidney_scores.get(kidney, 0)
-        
-        # Liver function scoring
-        liver_scores = {"normal": 0, "mild": 0.5, "moderate": 1.0, "severe": 1.5}
-        base_score += liver_scores.get(liver, 0)
-        
-        # === Build Gemini Prompt ===
-        prompt = f"""
-        You are a clinical pharmacology AI assistant with access to up-to-date medical literature.
-        Analyze this patient's data and medications for drug–drug interactions, organ toxicity, and risk.
-
-        Patient Details:
-        - Name: {patient['patient_name']}
-        - Age: {patient['age']}
-        - Gender: {patient['gender']}
-        - Kidney function: {kidney}
-        - Liver function: {liver}
-        - Medications: {json.dumps(meds, indent=2)}
+        user_id = user_id or latest_patient.get("user_id")
+        request_start = time.perf_counter()
 
-        BASE RISK SCORE CALCULATION:
-        - Age {patient['age']}: {base_score - kidney_scores.get(kidney, 0) - liver_scores.get(liver, 0):.1f} points
-        - Kidney function ({kidney}): +{kidney_scores.get(kidney, 0):.1f} points
-        - Liver function ({liver}): +{liver_scores.get(liver, 0):.1f} points
-        - BASE SCORE: {base_score:.1f}/10
+        # === Pre-resolve known drugs/pairs locally, build compact prompt ===
+        plan = build_analysis_prompt(patient)
+        local_ms = (time.perf_counter() - request_start) * 1000
 
-        For each medication, evaluate:
-        1. Drug-drug interaction risks with other medications
-        2. Side effects and their severity
-        3. Organs affected (kidney, liver, heart, etc.)
-        4. Individual risk contribution to overall score
-
-        ADDITIONAL SCORING RULES:
-        - For each drug that affects kidney function AND patient has kidney impairment: +1.0
-        - For each drug that affects liver function AND patient has liver impairment: +1.0
-        - For each drug-drug interaction with risk_score ≥60: +0.5
-        - For each drug-drug interaction with risk_score ≥80: +1.0
-        - For polypharmacy (≥5 medications): +1.0
-
-        Output a structured JSON report with:
-        {{
-          "patient_name": "{patient['patient_name']}",
-          "age": {patient['age']},
-          "base_risk_score": {base_score:.1f},
-          "risk_summary": {{
-            "overall_risk_score": "<calculated 0–10>",
-            "risk_level": "Low | Moderate | High",
-            "scoring_breakdown": {{
-              "age_contribution": "<age points>",
-              "kidney_contribution": "<kidney points>",
-              "liver_contribution": "<liver points>",
-              "drug_interactions": "<interaction points>",
-              "organ_effects": "<organ effect points>",
-              "polypharmacy": "<polypharmacy points>"
-            }},
-            "notes": "Detailed explanation of risk factors and scoring"
-          }},
-          "drug_analysis": [
-            {{
-              "name": "<Drug>",
-              "category": "<Drug category/class>",
-              "interaction_risks": [
-                {{
-                  "drug": "<Other drug>", 
-                  "interaction": "<Detailed interaction description>", 
-                  "risk_score": <0–100>,
-                  "clinical_impact": "<Severity and clinical implications>"
-                }}
-              ],
-              "side_effects": [
-                {{
-                  "effect": "<Side effect name>",
-                  "severity": "<Mild/Moderate/Severe>",
-                  "frequency": "<Common/Uncommon/Rare>"
-                }}
-              ],
-              "organs_affected": [
-                {{
-                  "organ": "<Organ name>",
-                  "effect": "<Type of effect>",
-                  "severity": "<Mild/Moderate/Severe>"
-                }}
-              ],
-              "individual_risk_score": "<calculated 0-10>",
-              "risk_contribution": "<How this drug contributes to overall risk>"
-            }}
-          ],
-          "drug_alternatives": [
-            {{
-              "original_drug": "<Drug>",
-              "alternatives": [
-                {{
-                  "alternative_name": "<Drug>",
-                  "advantages": ["Benefits"],
-                  "disadvantages": ["Drawbacks"],
-                  "dosing_recommendation": "<Suggested dose>",
-                  "monitoring_parameters": ["Labs to monitor"],
-                  "risk_reduction": "<How much this reduces overall risk>"
-                }}
-              ]
-            }}
-          ],
-          "clinical_recommendations": [
-            "List of key recommendations for safer prescribing and monitoring."
-          ]
-        }}
-
-        FINAL SCORING GUIDELINES:
-        - 0–3.0 = Low Risk
-        - 3.1–6.0 = Moderate Risk  
-        - 6.1–10.0 = High Risk
-        - Provide detailed breakdown of how each factor contributes to the final score
-        """
-
-        # === Call Gemini 2.5 Flash ===
+        # === Call Gemini 2.5 Flash for the unresolved remainder ===
         model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
+        llm_start = time.perf_counter()
+        with timed("llm_call"):
+            response = model.generate_content(
+                plan.prompt,
+                generation_config={"response_mime_type": "application/json"}
+            )
+        llm_ms = (time.perf_counter() - llm_start) * 1000
 
-        try:
-            parsed_result = json.loads(response.text)
-        except:
-            parsed_result = {"raw_text": response.text.strip()}
+        llm_result, parse_status = parse_model_output(response.text)
+        parsed_result = assemble_analysis(plan, llm_result)
+        if parse_status == PARSE_FAILED:
+            parsed_result["raw_text"] = response.text.strip()
 
-        # Create patient_analysis_data folder if it doesn't exist
-        analysis_folder = "patient_analysis_data"
-        if not os.path.exists(analysis_folder):
-            os.makedirs(analysis_folder)
-        
-        # Save analysis to file with patient name in filename
-        patient_name_clean = patient["patient_name"].replace(" ", "_").replace("/", "_").replace("\\", "_")
-        analysis_file = f"{analysis_folder}/ai_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{patient_name_clean}.json"
-        with open(analysis_file, "w", encoding="utf-8") as f:
-            json.dump({
-                "patient_name": patient["patient_name"],
-                "analysis": parsed_result,
-                "timestamp": datetime.now().isoformat()
-            }, f, indent=2, ensure_ascii=False)
+        prompt_stats = plan.stats()
+        prompt_stats.update({
+            "local_resolution_ms": round(local_ms, 1),
+            "llm_latency_ms": round(llm_ms, 1),
+            "total_latency_ms": round((time.perf_counter() - request_start) * 1000, 1)
+        })
+        # Latencies are already recorded by timed("prompt_build") / timed("llm_call")
+        PROMPT_TOKENS.observe(plan.prompt_tokens, prompt="compact")
+        PROMPT_TOKENS.observe(plan.baseline_prompt_tokens, prompt="legacy_estimate")
+
+        # Save analysis into the date-sharded store and append it to the manifest
+        record = normalize_analysis_record(
+            patient["patient_name"],
+            parsed_result,
+            patient=patient,
+            parse_status=parse_status,
+            extra={"prompt_stats": prompt_stats, "user_id": user_id}
+        )
+        entry = analysis_store.write_analysis(record)
+        # Fold the new analysis into the materialized dashboard analytics
+        analytics.refresh()
+        analysis_file = f"{analysis_store.folder}/{entry['rel_path']}"
 
         return {
             "status": "success",
             "patient_name": patient["patient_name"],
             "analysis": parsed_result,
-            "timestamp": datetime.now().isoformat(),
+            "risk_score": record["risk_score"],
+            "risk_level": record["risk_level"],
+            "parse_status": parse_status,
+            "prompt_stats": prompt_stats,
+            "timestamp": record["timestamp"],
             "analysis_file": analysis_file
         }
 
@@ -278,50 +211,46 @@ async def analyze_patient():
 # 📁 Patient Analysis Data Management
 # ==========================================================
 @app.get("/api/analysis-files")
-async def get_analysis_files():
-    """Get all patient analysis files from the patient_analysis_data folder"""
+async def get_analysis_files(page: int = 1, page_size: int = 50, sort: str = "created",
+                             order: str = "desc", patient: str = None, user_id: str = None):
+    """List patient analysis files from the manifest (paginated, newest first by default)"""
+    check_user_id(user_id)
     try:
-        analysis_folder = "patient_analysis_data"
-        if not os.path.exists(analysis_folder):
-            return {"status": "success", "files": [], "message": "No analysis folder found"}
-        
-        files = []
-        for filename in os.listdir(analysis_folder):
-            if filename.endswith('.json'):
-                file_path = os.path.join(analysis_folder, filename)
-                file_stats = os.stat(file_path)
-                files.append({
-                    "filename": filename,
-                    "size": file_stats.st_size,
-                    "created": datetime.fromtimestamp(file_stats.st_ctime).isoformat(),
-                    "modified": datetime.fromtimestamp(file_stats.st_mtime).isoformat()
-                })
-        
-        # Sort by creation time (newest first)
-        files.sort(key=lambda x: x['created'], reverse=True)
+        page_size = max(1, min(page_size, 500))
+        entries, total = analysis_store.list_analyses(page, page_size, sort, order, patient, user_id)
+        files = [{
+            "filename": entry["filename"],
+            "patient_name": entry["patient_name"],
+            "size": entry["size"],
+            "created": entry["created_at"],
+            "modified": entry["created_at"],
+            "risk_score": entry["risk_score"],
+            "risk_level": entry["risk_level"],
+            "age": entry["age"],
+            "drug_count": entry["drug_count"],
+            "interaction_count": entry["interaction_count"],
+            "user_id": entry["user_id"]
+        } for entry in entries]
         
         return {
             "status": "success",
             "files": files,
-            "total_count": len(files),
-            "folder": analysis_folder
+            "total_count": total,
+            "page": page,
+            "page_size": page_size,
+            "folder": analysis_store.folder
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading analysis files: {str(e)}")
 
 @app.get("/api/analysis-files/{filename}")
 async def get_analysis_file(filename: str):
-    """Get a specific patient analysis file"""
+    """Get a specific patient analysis file (looked up through the manifest)"""
     try:
-        analysis_folder = "patient_analysis_data"
-        file_path = os.path.join(analysis_folder, filename)
-        
-        if not os.path.exists(file_path):
+        analysis_data = analysis_store.load_analysis(filename)
+        if analysis_data is None:
             raise HTTPException(status_code=404, detail="Analysis file not found")
         
-        with open(file_path, "r", encoding="utf-8") as f:
-            analysis_data = json.load(f)
-        
         return {
             "status": "success",
             "filename": filename,
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Opt-in Request Profiling
+Off unless POLYRISK_PROFILING=1. For requests that ask for it
+(X-PolyRisk-Profile header, honored only from localhost or with the
+POLYRISK_PROFILE_TOKEN in X-PolyRisk-Profile-Token) or are sampled, attach a
+Server-Timing breakdown (storage, parse, compute, llm, serialize) and
+optionally capture a cProfile dump kept for later download.
+
+    curl -H "X-PolyRisk-Profile: timing"  ...   # Server-Timing only
+    curl -H "X-PolyRisk-Profile: cprofile" ...  # plus a stored profile
+    GET /debug/profiles, GET /debug/profiles/{id}[?format=text]
+"""
+
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from instrumentation import PHASES_ENABLED, PHASE_TIMER, PhaseTimer
+
+PROFILE_HEADER = "x-polyrisk-profile"
+TOKEN_HEADER = "x-polyrisk-profile-token"
+# Required for the header and /debug/profiles from anywhere but localhost (unset: localhost only)
+PROFILE_TOKEN = os.getenv("POLYRISK_PROFILE_TOKEN", "")
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+SAMPLE_RATE = float(os.getenv("POLYRISK_PROFILE_SAMPLE_RATE", "0"))
+# Whether sampled requests (not only header-triggered ones) also capture a cProfile dump
+CAPTURE_SAMPLED = os.getenv("POLYRISK_PROFILE_CAPTURE", "0") == "1"
+PROFILE_DIR = os.getenv("POLYRISK_PROFILE_DIR", "profiles")
+MAX_PROFILES = int(os.getenv("POLYRISK_MAX_PROFILES", "20"))
+SERVER_TIMING_PHASES = ("storage", "parse", "compute", "llm", "serialize")
+
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Profilers of worker threads doing work for the request being profiled
+_THREAD_PROFILES: contextvars.ContextVar = contextvars.ContextVar("polyrisk_thread_profiles", default=None)
+
+
+def call_profiled(fn, *args, **kwargs):
+    """
+    Run fn, profiling it when the calling request is being profiled.
+    cProfile only sees the thread it was enabled in, so work handed to a
+    thread pool needs its own profiler; they are merged when the profile is saved.
+    """
+    profiles = _THREAD_PROFILES.get()
+    if profiles is None:
+        return fn(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # a process-wide profiler already covers this thread
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiles.append(profiler)
+
+
+class ProfileStore:
+    """cProfile dumps on disk, oldest deleted beyond max_profiles"""
+
+    def __init__(self, folder: str = PROFILE_DIR, max_profiles: int = MAX_PROFILES):
+        self.folder = folder
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def save(self, profilers: List[cProfile.Profile], service: str, path: str, duration_ms: float) -> str:
+        """Merge the request's profilers into one stored profile; returns its id"""
+        os.makedirs(self.folder, exist_ok=True)
+        route = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+        profile_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{service}_{route}"
+
+        summary = io.StringIO()
+        summary.write(f"{service} {path} {duration_ms:.1f} ms\n\n")
+        stats = pstats.Stats(*profilers, stream=summary)
+        stats.dump_stats(os.path.join(self.folder, f"{profile_id}.prof"))
+        stats.sort_stats("cumulative").print_stats(40)
+        with open(os.path.join(self.folder, f"{profile_id}.txt"), "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        with self._lock:
+            profiles = sorted(f for f in os.listdir(self.folder) if f.endswith(".prof"))
+            for filename in profiles[:max(len(profiles) - self.max_profiles, 0)]:
+                for ext in (".prof", ".txt"):
+                    try:
+                        os.remove(os.path.join(self.folder, filename[:-5] + ext))
+                    except OSError:
+                        pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.folder):
+            return []
+        profiles = []
+        for filename in sorted(os.listdir(self.folder), reverse=True):
+            if filename.endswith(".prof"):
+                stat = os.stat(os.path.join(self.folder, filename))
+                profiles.append({"id": filename[:-5], "size": stat.st_size,
+                                 "created": datetime.fromtimestamp(stat.st_mtime).isoformat()})
+        return profiles
+
+    def path_for(self, profile_id: str, ext: str = ".prof") -> Optional[str]:
+        """Path of a stored profile; ids are validated so no other file can be served"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.folder, profile_id + ext)
+        return path if os.path.exists(path) else None
+
+
+def server_timing(phases: Dict[str, float], total: float) -> str:
+    """Server-Timing header value (durations in ms)"""
+    parts = [f"{phase};dur={phases.get(phase, 0.0) * 1000:.1f}" for phase in SERVER_TIMING_PHASES]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _requested_mode(header_value: Optional[str]) -> Optional[str]:
+    """None (no profiling), "timing" or "cprofile" for this request"""
+    if header_value:
+        value = header_value.strip().lower()
+        if value in ("cprofile", "profile"):
+            return "cprofile"
+        if value not in ("0", "off", "false"):
+            return "timing"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "cprofile" if CAPTURE_SAMPLED else "timing"
+    return None
+
+
+def is_authorized(request) -> bool:
+    """Profiling header and debug routes: the configured token, or a request from localhost"""
+    token = request.headers.get(TOKEN_HEADER)
+    if PROFILE_TOKEN and token and hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")):
+        return True
+    return request.client is not None and request.client.host in LOCAL_HOSTS
+
+
+# cProfile can only profile one request at a time per process
+_profiler_lock = threading.Lock()
+
+
+def instrument_profiling(app, service: str, store: Optional[ProfileStore] = None):
+    """Opt-in Server-Timing / cProfile middleware plus /debug/profiles download routes"""
+    if not PHASES_ENABLED:
+        return
+    from fastapi import HTTPException, Request
+    from fastapi.responses import FileResponse, PlainTextResponse
+
+    store = store or ProfileStore()
+
+    @app.middleware("http")
+    async def profiling_middleware(request: Request, call_next):
+        header_value = request.headers.get(PROFILE_HEADER)
+        if header_value and not is_authorized(request):
+            header_value = None
+        mode = _requested_mode(header_value)
+        if mode is None:
+            return await call_next(request)
+
+        timer = PhaseTimer()
+        token = PHASE_TIMER.set(timer)
+        profiler, thread_profiles, profiles_token = None, [], None
+        if mode == "cprofile" and _profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                profiles_token = _THREAD_PROFILES.set(thread_profiles)
+            except ValueError:  # another profiler is active in this process
+                profiler = None
+                _profiler_lock.release()
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            total = time.perf_counter() - start
+            PHASE_TIMER.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                _THREAD_PROFILES.reset(profiles_token)
+                _profiler_lock.release()
+
+        response.headers["Server-Timing"] = server_timing(timer.phases, total)
+        if profiler is not None:
+            response.headers["X-PolyRisk-Profile-Id"] = store.save([profiler] + thread_profiles, service,
+                                                                   request.url.path, total * 1000)
+        return response
+
+    def require_authorized(request: Request):
+        if not is_authorized(request):
+            raise HTTPException(status_code=403, detail="Profiles are only available from localhost or with the profile token")
+
+    async def list_profiles(request: Request):
+        require_authorized(request)
+        return {"status": "success", "profiles": store.list(), "max_profiles": store.max_profiles}
+
+    async def get_profile(request: Request, profile_id: str, format: str = "prof"):
+        require_authorized(request)
+        path = store.path_for(profile_id, ".txt" if format == "text" else ".prof")
+        if path is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if format == "text":
+            with open(path, "r", encoding="utf-8") as f:
+                return PlainTextResponse(f.read())
+        return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
+    app.add_api_route("/debug/profiles", list_profiles, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/profiles/{profile_id}", get_profile, methods=["GET"], include_in_schema=False)
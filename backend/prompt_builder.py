@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Token-Budgeted Prompt Builder
+Pre-resolves known drug pairs and side effects from the local interaction
+index and only sends the unresolved part of a patient's regimen to Gemini
+"""
+
+import json
+import os
+from typing import Dict, List, Any, Optional, Tuple
+
+from instrumentation import timed
+from interaction_index import DrugInteractionIndex, get_interaction_index, infer_organs
+
+# Rough token estimate for Gemini/GPT style tokenizers (~4 characters per token)
+CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("POLYRISK_PROMPT_TOKEN_BUDGET", "1200"))
+
+ORGAN_FUNCTION_SCORES = {"normal": 0, "mild": 0.5, "moderate": 1.0, "severe": 1.5}
+
+COMPACT_SCHEMA = (
+    '{"drugs":[{"name":"","category":"","side_effects":[["effect","Mild|Moderate|Severe","Common|Uncommon|Rare"]],'
+    '"organs":[["organ","effect","Mild|Moderate|Severe"]]}],'
+    '"pairs":[["drug","other drug",risk_score_0_100,"interaction","clinical impact"]],'
+    '"alternatives":[{"drug":"","options":[["alternative","dose","why safer","labs to monitor"]]}],'
+    '"recommendations":[""]}'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of prompt tokens for a piece of text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def calculate_base_score(age: int, kidney: str, liver: str) -> Dict[str, float]:
+    """Age and organ-function contributions of the scoring rubric"""
+    age_score = 0.0
+    if 60 <= age < 70:
+        age_score = 0.5
+    elif 70 <= age < 80:
+        age_score = 1.0
+    elif age >= 80:
+        age_score = 1.5
+
+    kidney_score = ORGAN_FUNCTION_SCORES.get(kidney, 0)
+    liver_score = ORGAN_FUNCTION_SCORES.get(liver, 0)
+    return {
+        "age": age_score,
+        "kidney": kidney_score,
+        "liver": liver_score,
+        "base": age_score + kidney_score + liver_score
+    }
+
+
+def risk_level_for_score(score: float) -> str:
+    if score <= 3.0:
+        return "Low"
+    if score <= 6.0:
+        return "Moderate"
+    return "High"
+
+
+def interaction_points(risk_score: float) -> float:
+    if risk_score >= 80:
+        return 1.0
+    if risk_score >= 60:
+        return 0.5
+    return 0.0
+
+
+class AnalysisPromptPlan:
+    """Result of pre-resolving a patient locally and building the LLM prompt"""
+
+    def __init__(self, patient: Dict[str, Any]):
+        self.patient = patient
+        self.kidney = patient.get("kidney_function", "normal").lower()
+        self.liver = patient.get("liver_function", "normal").lower()
+        self.scores = calculate_base_score(patient.get("age", 0), self.kidney, self.liver)
+        self.medications: List[Dict[str, Any]] = patient.get("medications", [])
+        self.resolved_drugs: Dict[str, Dict[str, Any]] = {}
+        self.resolved_pairs: List[Dict[str, Any]] = []
+        self.unresolved_drugs: List[str] = []
+        self.unresolved_pairs: List[Tuple[str, str]] = []
+        self.dropped_drugs: List[str] = []
+        self.dropped_pairs: List[Tuple[str, str]] = []
+        self.prompt = ""
+        self.prompt_tokens = 0
+        self.baseline_prompt_tokens = 0
+        self.token_budget = DEFAULT_TOKEN_BUDGET
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Prompt size against the legacy prompt. Both token counts are
+        estimates (estimate_tokens); the legacy path is never run, so this
+        is not a measured latency reduction.
+        """
+        saved = self.baseline_prompt_tokens - self.prompt_tokens
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "baseline_prompt_tokens_estimate": self.baseline_prompt_tokens,
+            "prompt_tokens_saved_estimate": saved,
+            "prompt_token_reduction_pct_estimate": round(100.0 * saved / self.baseline_prompt_tokens, 1)
+            if self.baseline_prompt_tokens else 0.0,
+            "token_budget": self.token_budget,
+            "resolved_drugs": len(self.resolved_drugs),
+            "resolved_pairs": len(self.resolved_pairs),
+            "no_known_interaction_pairs": sum(1 for p in self.resolved_pairs if p["severity"] == "none"),
+            "unresolved_drugs": len(self.unresolved_drugs),
+            "unresolved_pairs": len(self.unresolved_pairs),
+            "dropped_drugs": len(self.dropped_drugs),
+            "dropped_pairs": len(self.dropped_pairs)
+        }
+
+
+@timed("prompt_build")
+def build_analysis_prompt(patient: Dict[str, Any], index: Optional[DrugInteractionIndex] = None,
+                          token_budget: Optional[int] = None) -> AnalysisPromptPlan:
+    """
+    Resolve what the local data already knows and build a compact prompt
+    for the rest. Unresolved drugs/pairs that do not fit in the token budget
+    are dropped and reported as not assessed.
+    """
+    index = index or get_interaction_index()
+    plan = AnalysisPromptPlan(patient)
+    plan.token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    names = [med.get("name", "") for med in plan.medications if med.get("name")]
+
+    for name in names:
+        side_effects = index.get_side_effects(name)
+        if side_effects:
+            plan.resolved_drugs[name] = {
+                "side_effects": side_effects,
+                "organs_affected": infer_organs([se["effect"] for se in side_effects])
+            }
+        else:
+            plan.unresolved_drugs.append(name)
+
+    plan.resolved_pairs, plan.unresolved_pairs = index.lookup_pairs(names)
+    plan.baseline_prompt_tokens = estimate_tokens(build_legacy_prompt(patient))
+
+    header = _prompt_header(plan)
+    footer = f"\nReply with JSON only, no prose or code fences, using this schema:\n{COMPACT_SCHEMA}\n"
+    used = estimate_tokens(header) + estimate_tokens(footer)
+
+    drug_lines, pair_lines = [], []
+    for name in plan.unresolved_drugs:
+        line = f"- {name}\n"
+        if used + estimate_tokens(line) > plan.token_budget:
+            plan.dropped_drugs.append(name)
+            continue
+        drug_lines.append(line)
+        used += estimate_tokens(line)
+
+    for drug_a, drug_b in plan.unresolved_pairs:
+        line = f"- {drug_a} + {drug_b}\n"
+        if used + estimate_tokens(line) > plan.token_budget:
+            plan.dropped_pairs.append((drug_a, drug_b))
+            continue
+        pair_lines.append(line)
+        used += estimate_tokens(line)
+
+    plan.unresolved_drugs = [d for d in plan.unresolved_drugs if d not in plan.dropped_drugs]
+    plan.unresolved_pairs = [p for p in plan.unresolved_pairs if p not in plan.dropped_pairs]
+
+    body = ""
+    if drug_lines:
+        body += "Evaluate side effects and organs affected ONLY for:\n" + "".join(drug_lines)
+    if pair_lines:
+        body += "Evaluate interactions ONLY for these pairs:\n" + "".join(pair_lines)
+    body += "Suggest safer alternatives for the riskiest drugs and key monitoring recommendations.\n"
+
+    plan.prompt = header + body + footer
+    plan.prompt_tokens = estimate_tokens(plan.prompt)
+    return plan
+
+
+def _prompt_header(plan: AnalysisPromptPlan) -> str:
+    patient = plan.patient
+    meds = "; ".join(
+        f"{m.get('name', '')} {m.get('dose', '')} {m.get('frequency', '')}".strip()
+        for m in plan.medications
+    )
+    header = (
+        "You are a clinical pharmacology assistant.\n"
+        f"Patient: {patient.get('age')}y {patient.get('gender', '')}, "
+        f"kidney {plan.kidney}, liver {plan.liver}.\n"
+        f"Medications: {meds}\n"
+    )
+    significant = [p for p in plan.resolved_pairs if p["risk_score"] >= 60]
+    if significant:
+        header += "Known significant interactions (already assessed): " + ", ".join(
+            f"{p['drug_a']}+{p['drug_b']} ({p['severity']})" for p in significant
+        ) + "\n"
+    return header
+
+
+def assemble_analysis(plan: AnalysisPromptPlan, llm_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge locally resolved data with the compact LLM answer into the full
+    report schema used by the frontend, scoring with the rubric locally.
+    """
+    patient = plan.patient
+    llm_drugs = {d.get("name", ""): d for d in llm_result.get("drugs", []) if isinstance(d, dict)}
+
+    interactions: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add_interaction(drug_a, drug_b, description, risk_score, impact):
+        for drug, other in ((drug_a, drug_b), (drug_b, drug_a)):
+            interactions.setdefault(drug, []).append({
+                "drug": other,
+                "interaction": description,
+                "risk_score": risk_score,
+                "clinical_impact": impact
+            })
+
+    for pair in plan.resolved_pairs:
+        if pair["risk_score"] > 0:
+            impact = "Side effects: " + ", ".join(pair["side_effects"]) if pair["side_effects"] else pair["severity"]
+            add_interaction(pair["drug_a"], pair["drug_b"], pair["interaction"], pair["risk_score"], impact)
+
+    for entry in llm_result.get("pairs", []):
+        if isinstance(entry, list) and len(entry) >= 3:
+            try:
+                risk_score = float(entry[2])
+            except (TypeError, ValueError):
+                risk_score = 0.0
+            add_interaction(entry[0], entry[1], entry[3] if len(entry) > 3 else "",
+                            risk_score, entry[4] if len(entry) > 4 else "")
+
+    interaction_total = 0.0
+    organ_total = 0.0
+    drug_analysis = []
+    for med in plan.medications:
+        name = med.get("name", "")
+        local = plan.resolved_drugs.get(name)
+        if local:
+            side_effects = [{"effect": se["effect"], "severity": "Unknown", "frequency": se["frequency"]}
+                            for se in local["side_effects"]]
+            organs = local["organs_affected"]
+            source = "local"
+        else:
+            llm_drug = llm_drugs.get(name, {})
+            side_effects = [{"effect": e[0], "severity": e[1] if len(e) > 1 else "Unknown",
+                             "frequency": e[2] if len(e) > 2 else "Unknown"}
+                            for e in llm_drug.get("side_effects", []) if isinstance(e, list) and e]
+            organs = [{"organ": o[0], "effect": o[1] if len(o) > 1 else "",
+                       "severity": o[2] if len(o) > 2 else "Unknown"}
+                      for o in llm_drug.get("organs", []) if isinstance(o, list) and o]
+            source = "llm" if llm_drug else "not_assessed"
+
+        organ_names = {o["organ"].lower() for o in organs}
+        organ_points = 0.0
+        if plan.kidney != "normal" and "kidney" in organ_names:
+            organ_points += 1.0
+        if plan.liver != "normal" and "liver" in organ_names:
+            organ_points += 1.0
+        drug_interactions = interactions.get(name, [])
+        # Each pair is listed under both drugs; count half per side
+        pair_points = sum(interaction_points(i["risk_score"]) for i in drug_interactions) / 2
+        organ_total += organ_points
+        interaction_total += pair_points
+
+        drug_analysis.append({
+            "name": name,
+            "category": med.get("category") or llm_drugs.get(name, {}).get("category", ""),
+            "interaction_risks": drug_interactions,
+            "side_effects": side_effects,
+            "organs_affected": organs,
+            "individual_risk_score": round(min(10.0, organ_points + pair_points), 1),
+            "risk_contribution": f"{organ_points + pair_points:.1f} points from organ effects and interactions",
+            "source": source
+        })
+
+    polypharmacy = 1.0 if len(plan.medications) >= 5 else 0.0
+    overall = min(10.0, plan.scores["base"] + organ_total + interaction_total + polypharmacy)
+
+    notes = "Scored locally from the PolyRisk rubric."
+    no_known = [f"{p['drug_a']}+{p['drug_b']}" for p in plan.resolved_pairs if p["severity"] == "none"]
+    if no_known:
+        notes += " No known interaction in local data: " + ", ".join(no_known) + "."
+    if plan.dropped_drugs or plan.dropped_pairs:
+        notes += (" Not assessed (prompt token budget): "
+                  + ", ".join(plan.dropped_drugs + [f"{a}+{b}" for a, b in plan.dropped_pairs]) + ".")
+
+    drug_alternatives = []
+    for alt in llm_result.get("alternatives", []):
+        if not isinstance(alt, dict):
+            continue
+        drug_alternatives.append({
+            "original_drug": alt.get("drug", ""),
+            "alternatives": [{
+                "alternative_name": o[0],
+                "advantages": [o[2]] if len(o) > 2 else [],
+                "disadvantages": [],
+                "dosing_recommendation": o[1] if len(o) > 1 else "",
+                "monitoring_parameters": [o[3]] if len(o) > 3 else [],
+                "risk_reduction": o[2] if len(o) > 2 else ""
+            } for o in alt.get("options", []) if isinstance(o, list) and o]
+        })
+
+    return {
+        "patient_name": patient.get("patient_name", "Unknown"),
+        "age": patient.get("age", 0),
+        "base_risk_score": round(plan.scores["base"], 1),
+        "risk_summary": {
+            "overall_risk_score": round(overall, 1),
+            "risk_level": risk_level_for_score(overall),
+            "scoring_breakdown": {
+                "age_contribution": plan.scores["age"],
+                "kidney_contribution": plan.scores["kidney"],
+                "liver_contribution": plan.scores["liver"],
+                "drug_interactions": round(interaction_total, 1),
+                "organ_effects": round(organ_total, 1),
+                "polypharmacy": polypharmacy
+            },
+            "notes": notes
+        },
+        "drug_analysis": drug_analysis,
+        "drug_alternatives": drug_alternatives,
+        "clinical_recommendations": [r for r in llm_result.get("recommendations", []) if isinstance(r, str) and r]
+    }
+
+
+def build_legacy_prompt(patient: Dict[str, Any]) -> str:
+    """
+    The original full-rubric prompt. Only used to measure the baseline
+    token count that the compact prompt is compared against.
+    """
+    kidney = patient.get("kidney_function", "normal").lower()
+    liver = patient.get("liver_function", "normal").lower()
+    scores = calculate_base_score(patient.get("age", 0), kidney, liver)
+    meds = patient.get("medications", [])
+    return f"""
+        You are a clinical pharmacology AI assistant with access to up-to-date medical literature.
+        Analyze this patient's data and medications for drug–drug interactions, organ toxicity, and risk.
+
+        Patient Details:
+        - Name: {patient.get('patient_name')}
+        - Age: {patient.get('age')}
+        - Gender: {patient.get('gender')}
+        - Kidney function: {kidney}
+        - Liver function: {liver}
+        - Medications: {json.dumps(meds, indent=2)}
+
+        BASE RISK SCORE CALCULATION:
+        - Age {patient.get('age')}: {scores['age']:.1f} points
+        - Kidney function ({kidney}): +{scores['kidney']:.1f} points
+        - Liver function ({liver}): +{scores['liver']:.1f} points
+        - BASE SCORE: {scores['base']:.1f}/10
+
+        For each medication, evaluate:
+        1. Drug-drug interaction risks with other medications
+        2. Side effects and their severity
+        3. Organs affected (kidney, liver, heart, etc.)
+        4. Individual risk contribution to overall score
+
+        ADDITIONAL SCORING RULES:
+        - For each drug that affects kidney function AND patient has kidney impairment: +1.0
+        - For each drug that affects liver function AND patient has liver impairment: +1.0
+        - For each drug-drug interaction with risk_score ≥60: +0.5
+        - For each drug-drug interaction with risk_score ≥80: +1.0
+        - For polypharmacy (≥5 medications): +1.0
+
+        Output a structured JSON report with:
+        {{
+          "patient_name": "{patient.get('patient_name')}",
+          "age": {patient.get('age')},
+          "base_risk_score": {scores['base']:.1f},
+          "risk_summary": {{
+            "overall_risk_score": "<calculated 0–10>",
+            "risk_level": "Low | Moderate | High",
+            "scoring_breakdown": {{
+              "age_contribution": "<age points>",
+              "kidney_contribution": "<kidney points>",
+              "liver_contribution": "<liver points>",
+              "drug_interactions": "<interaction points>",
+              "organ_effects": "<organ effect points>",
+              "polypharmacy": "<polypharmacy points>"
+            }},
+            "notes": "Detailed explanation of risk factors and scoring"
+          }},
+          "drug_analysis": [
+            {{
+              "name": "<Drug>",
+              "category": "<Drug category/class>",
+              "interaction_risks": [
+                {{
+                  "drug": "<Other drug>",
+                  "interaction": "<Detailed interaction description>",
+                  "risk_score": <0–100>,
+                  "clinical_impact": "<Severity and clinical implications>"
+                }}
+              ],
+              "side_effects": [
+                {{
+                  "effect": "<Side effect name>",
+                  "severity": "<Mild/Moderate/Severe>",
+                  "frequency": "<Common/Uncommon/Rare>"
+                }}
+              ],
+              "organs_affected": [
+                {{
+                  "organ": "<Organ name>",
+                  "effect": "<Type of effect>",
+                  "severity": "<Mild/Moderate/Severe>"
+                }}
+              ],
+              "individual_risk_score": "<calculated 0-10>",
+              "risk_contribution": "<How this drug contributes to overall risk>"
+            }}
+          ],
+          "drug_alternatives": [
+            {{
+              "original_drug": "<Drug>",
+              "alternatives": [
+                {{
+                  "alternative_name": "<Drug>",
+                  "advantages": ["Benefits"],
+                  "disadvantages": ["Drawbacks"],
+                  "dosing_recommendation": "<Suggested dose>",
+                  "monitoring_parameters": ["Labs to monitor"],
+                  "risk_reduction": "<How much this reduces overall risk>"
+                }}
+              ]
+            }}
+          ],
+          "clinical_recommendations": [
+            "List of key recommendations for safer prescribing and monitoring."
+          ]
+        }}
+
+        FINAL SCORING GUIDELINES:
+        - 0–3.0 = Low Risk
+        - 3.1–6.0 = Moderate Risk
+        - 6.1–10.0 = High Risk
+        - Provide detailed breakdown of how each factor contributes to the final score
+        """
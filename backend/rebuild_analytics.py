@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Parallel Cold Rebuild of Analytics
+Re-reads every ai_analysis_*.json file with a process pool, reduces the
+per-worker partial aggregates and rewrites the manifest and analytics state.
+
+Usage:
+    python rebuild_analytics.py [--folder patient_analysis_data] [--workers N]
+    python rebuild_analytics.py --benchmark      # files/sec for 1, 2, 4 ... N workers
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Tuple
+
+from analysis_store import AnalysisStore, ANALYSIS_FOLDER
+from analytics_state import AnalyticsState, MaterializedAnalytics
+from instrumentation import timed
+
+# Files per task; small enough to balance load, large enough to amortize IPC
+CHUNK_SIZE = 500
+
+
+def process_partition(args: Tuple[str, List[str]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int]:
+    """Worker: parse a slice of files into a partial state plus their manifest entries"""
+    folder, paths = args
+    store = AnalysisStore(folder)
+    state = AnalyticsState()
+    entries = []
+    failed = 0
+    for path in paths:
+        try:
+            entry = store.entry_for_file(path)
+        except Exception:
+            failed += 1
+            continue
+        state.apply(entry)
+        entries.append(entry)
+    return state.to_dict(), entries, failed
+
+
+def partition(paths: List[str], chunk_size: int = CHUNK_SIZE) -> List[List[str]]:
+    return [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+
+def _reduce(results) -> Tuple[AnalyticsState, List[Dict[str, Any]], int]:
+    merged = AnalyticsState()
+    entries: List[Dict[str, Any]] = []
+    failed = 0
+    for state_dict, chunk_entries, chunk_failed in results:
+        merged.merge(AnalyticsState.from_dict(state_dict))
+        entries.extend(chunk_entries)
+        failed += chunk_failed
+    return merged, entries, failed
+
+
+def aggregate(folder: str, paths: List[str], workers: int) -> Tuple[AnalyticsState, List[Dict[str, Any]], int]:
+    """Parse and reduce all files; chunk order is preserved so entries stay sorted"""
+    tasks = [(folder, chunk) for chunk in partition(paths)]
+    if workers <= 1:
+        return _reduce(map(process_partition, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _reduce(pool.map(process_partition, tasks))
+
+
+@timed("analytics_cold_rebuild")
+def rebuild(folder: str = ANALYSIS_FOLDER, workers: int = os.cpu_count() or 1) -> Dict[str, Any]:
+    """Rewrite the manifest and the materialized analytics state from the files on disk"""
+    store = AnalysisStore(folder)
+    start = time.perf_counter()
+    # Analyses saved from here on may be missed by the file listing; they are kept from the manifest
+    since_seq = store.last_seq()
+    paths = list(store.iter_analysis_files())
+    state, entries, failed = aggregate(folder, paths, workers)
+    parse_seconds = time.perf_counter() - start
+
+    # The same filename can exist twice (flat legacy copy and shard); keep the last one
+    unique = list({entry["filename"]: entry for entry in entries}.values())
+    if len(unique) != len(entries):
+        state = AnalyticsState()
+        for entry in unique:
+            state.apply(entry)
+
+    generation = store.replace_manifest(unique, keep_since=since_seq)
+    state.generation = generation
+    state.last_seq = unique[-1]["seq"] if unique else 0
+
+    analytics = MaterializedAnalytics(store)
+    analytics.install(state)
+    # Fold in the kept rows, appended after the rebuilt entries
+    analytics.refresh()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(paths),
+        "indexed": len(unique),
+        "failed": failed,
+        "workers": workers,
+        "parse_seconds": round(parse_seconds, 3),
+        "total_seconds": round(elapsed, 3),
+        "files_per_second": round(len(paths) / parse_seconds, 1) if parse_seconds else 0.0
+    }
+
+
+def benchmark(folder: str, max_workers: int) -> List[Dict[str, Any]]:
+    """Measure parse+reduce throughput for increasing worker counts (no writes)"""
+    paths = list(AnalysisStore(folder).iter_analysis_files())
+    results = []
+    worker_counts = []
+    count = 1
+    while count < max_workers:
+        worker_counts.append(count)
+        count *= 2
+    worker_counts.append(max_workers)
+
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        aggregate(folder, paths, workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        results.append({
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(len(paths) / elapsed, 1) if elapsed else 0.0,
+            "speedup": round(baseline / elapsed, 2) if elapsed else 0.0
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel cold rebuild of PolyRisk analytics")
+    parser.add_argument("--folder", default=ANALYSIS_FOLDER, help="analysis folder to rebuild")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--benchmark", action="store_true", help="measure scaling across worker counts")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(f"{'Workers':>8} {'Seconds':>10} {'Files/sec':>12} {'Speedup':>8}")
+        for row in benchmark(args.folder, args.workers):
+            print(f"{row['workers']:>8} {row['seconds']:>10} {row['files_per_second']:>12} {row['speedup']:>8}")
+        return
+
+    result = rebuild(args.folder, args.workers)
+    print(f"Rebuilt analytics from {result['indexed']} analyses "
+          f"({result['failed']} unreadable) with {result['workers']} workers")
+    print(f"Parse: {result['parse_seconds']}s ({result['files_per_second']} files/sec), "
+          f"total: {result['total_seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Local Retrieval Index
+BM25 index over drug names, categories, descriptions, side effects and FAQ
+text. The chatbot answers confident matches from it directly and passes
+the top snippets to Gemini otherwise.
+
+Usage:
+    python retrieval_index.py                      # build retrieval_index.json
+    python retrieval_index.py --query "side effects of warfarin"
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Any, Optional
+
+from interaction_index import DrugInteractionIndex, _find_data_file, _pick_column
+from keyword_matcher import Intent, load_faq_intents
+
+INDEX_FILE = "retrieval_index.json"
+INDEX_VERSION = 1
+CONFIDENCE_THRESHOLD = float(os.getenv("POLYRISK_RETRIEVAL_CONFIDENCE", "0.6"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+CATEGORY_COLUMNS = ["category", "drug_category", "Categories", "categories", "Category"]
+DESCRIPTION_COLUMNS = ["description", "Description", "indication", "Indication", "summary"]
+MAX_DESCRIPTION_CHARS = 600
+
+STOPWORDS = {
+    "a", "an", "and", "are", "about", "any", "be", "can", "could", "do", "does", "for", "from", "give",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "should", "tell", "that",
+    "the", "this", "to", "what", "whats", "when", "which", "with", "you", "your", "know", "information"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index with BM25 ranking; documents can be added after loading"""
+
+    def __init__(self):
+        self.documents: List[Dict[str, Any]] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+
+    def add(self, doc: Dict[str, Any]):
+        """doc: {"type", "title", "text", ...}; title and text are indexed"""
+        doc_id = len(self.documents)
+        tokens = tokenize(f"{doc.get('title', '')} {doc.get('text', '')}")
+        self.documents.append(doc)
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append([doc_id, tf])
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def idf(self, term: str) -> float:
+        n = len(self.documents)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Ranked matches with a confidence in [0, 1]: the top score relative to
+        a document of average length containing every query term once
+        (query terms missing from the index lower it)
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.documents:
+            return []
+        avgdl = self.total_length / len(self.documents) or 1.0
+        scores: Dict[int, float] = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ideal = sum(self.idf(term) for term in terms)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{
+            "score": round(score, 3),
+            "confidence": round(min(score / ideal, 1.0), 3) if ideal else 0.0,
+            "document": self.documents[doc_id]
+        } for doc_id, score in ranked]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": INDEX_VERSION, "documents": self.documents, "postings": self.postings,
+                "doc_lengths": self.doc_lengths, "total_length": self.total_length}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        index = cls()
+        if data.get("version") == INDEX_VERSION:
+            index.documents = data["documents"]
+            index.postings = data["postings"]
+            index.doc_lengths = data["doc_lengths"]
+            index.total_length = data["total_length"]
+        return index
+
+
+# ==========================================================
+# Building
+# ==========================================================
+def _drug_details() -> Dict[str, Dict[str, str]]:
+    """Category / description per DrugBank id from whichever processed files carry them"""
+    details: Dict[str, Dict[str, str]] = {}
+    for filename in ("drugbank_filtered.csv", "drug_features.csv"):
+        path = _find_data_file(filename)
+        if not path:
+            continue
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            id_col = _pick_column(fieldnames, ["DrugBank ID", "drugbank_id", "drug_id", "id"])
+            category_col = _pick_column(fieldnames, CATEGORY_COLUMNS)
+            description_col = _pick_column(fieldnames, DESCRIPTION_COLUMNS)
+            if not id_col or not (category_col or description_col):
+                continue
+            for row in reader:
+                entry = details.setdefault(row.get(id_col, "").strip(), {})
+                if category_col and row.get(category_col) and "category" not in entry:
+                    entry["category"] = row[category_col].strip()
+                if description_col and row.get(description_col) and "description" not in entry:
+                    entry["description"] = row[description_col].strip()[:MAX_DESCRIPTION_CHARS]
+    return details
+
+
+def drug_documents(index: Optional[DrugInteractionIndex] = None) -> List[Dict[str, Any]]:
+    index = index or DrugInteractionIndex().load(include_interactions=False)
+    details = _drug_details()
+    documents = []
+    for drug_id, name in index.id_to_name.items():
+        info = details.get(drug_id, {})
+        side_effects = [se["effect"] for se in index.side_effects.get(drug_id, [])]
+        text = " ".join(filter(None, [info.get("category", ""), info.get("description", ""),
+                                      "side effects " + ", ".join(side_effects) if side_effects else ""]))
+        documents.append({
+            "type": "drug",
+            "id": drug_id,
+            "title": name,
+            "text": text,
+            "category": info.get("category"),
+            "description": info.get("description"),
+            "side_effects": side_effects
+        })
+    return documents
+
+
+def faq_documents(intents: List[Intent]) -> List[Dict[str, Any]]:
+    return [{
+        "type": "faq",
+        "id": intent.name,
+        "title": " ".join(intent.keywords),
+        "text": intent.response,
+        "response": intent.response
+    } for intent in intents]
+
+
+def build_index(drug_index: Optional[DrugInteractionIndex] = None) -> BM25Index:
+    """Offline part of the index: one document per drug"""
+    index = BM25Index()
+    for doc in drug_documents(drug_index):
+        index.add(doc)
+    return index
+
+
+def save_index(index: BM25Index, path: str = INDEX_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_index(path: str = INDEX_FILE, intents: Optional[List[Intent]] = None,
+               drug_index: Optional[DrugInteractionIndex] = None) -> BM25Index:
+    """
+    Load the offline-built drug index (built in memory if missing) and add
+    the chatbot's current FAQ intents on top
+    """
+    index = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = BM25Index.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading retrieval index, rebuilding: {e}")
+    if index is None or not len(index):
+        index = build_index(drug_index)
+    # FAQ entries are added at startup so FAQ edits need no rebuild
+    for doc in faq_documents(intents or []):
+        index.add(doc)
+    return index
+
+
+# ==========================================================
+# Answers
+# ==========================================================
+def templated_answer(match: Dict[str, Any]) -> str:
+    doc = match["document"]
+    if doc["type"] == "faq":
+        return doc["response"]
+
+    lines = [f"**{doc['title']}** ({doc['id']})"]
+    if doc.get("category"):
+        lines.append(f"Category: {doc['category']}")
+    if doc.get("description"):
+        lines.append(doc["description"])
+    if doc.get("side_effects"):
+        lines.append("Commonly reported side effects: " + ", ".join(doc["side_effects"]) + ".")
+    lines.append("\nThis comes from PolyRisk's local drug database. Please confirm medication decisions "
+                 "with a healthcare professional.")
+    return "\n".join(lines)
+
+
+def snippet(match: Dict[str, Any], limit: int = 300) -> str:
+    doc = match["document"]
+    text = doc.get("response") if doc["type"] == "faq" else doc.get("text", "")
+    return f"{doc['title']}: {text[:limit]}"
+
+
+def answer_locally(index: BM25Index, question: str,
+                   threshold: float = CONFIDENCE_THRESHOLD) -> Dict[str, Any]:
+    """
+    {"answer": str or None, "matches": [...]}; answer is set only when the
+    best match is confident enough to skip the LLM
+    """
+    matches = index.search(question)
+    answer = None
+    if matches and matches[0]["confidence"] >= threshold:
+        answer = templated_answer(matches[0])
+    return {"answer": answer, "matches": matches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the PolyRisk chatbot retrieval index")
+    parser.add_argument("--output", default=INDEX_FILE, help="index file")
+    parser.add_argument("--faq", default=os.getenv("POLYRISK_FAQ_FILE", "chatbot_faq.json"),
+                        help="FAQ intents JSON to include when querying")
+    parser.add_argument("--query", help="query the existing index instead of building")
+    args = parser.parse_args()
+
+    if args.query:
+        index = load_index(args.output, load_faq_intents(args.faq))
+        start = time.perf_counter()
+        result = answer_locally(index, args.query)
+        elapsed = (time.perf_counter() - start) * 1000
+        for match in result["matches"]:
+            print(f"{match['confidence']:.2f}  {match['score']:7.2f}  {match['document']['title']}")
+        print(f"\n{result['answer'] or '(low confidence: would ask the LLM)'}\n\n{elapsed:.1f} ms")
+        return
+
+    start = time.perf_counter()
+    index = build_index()
+    save_index(index, args.output)
+    print(f"Retrieval index: {len(index)} documents, {len(index.postings)} terms -> {args.output} "
+          f"({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Time-Bucketed Rollups
+Daily, weekly and monthly pre-aggregated analysis counts, risk-level mix
+and score sums, so range queries sum a handful of buckets
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def bucket_key(day: date, granularity: str) -> str:
+    if granularity == "day":
+        return day.isoformat()
+    if granularity == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime("%Y-%m")
+
+
+def parse_day(value: Any) -> Optional[date]:
+    """Accept a date, datetime or ISO string (date or datetime)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _empty_bucket() -> Dict[str, float]:
+    return {"analyses": 0, "scored": 0, "score_sum": 0.0, "low": 0, "moderate": 0, "high": 0}
+
+
+def _add_bucket(target: Dict[str, float], source: Dict[str, float]):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+def _month_end(day: date) -> date:
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+class RollupStore:
+    """Mergeable per-day/week/month aggregates"""
+
+    def __init__(self):
+        self.buckets: Dict[str, Dict[str, Dict[str, float]]] = {g: {} for g in GRANULARITIES}
+
+    def add(self, timestamp: Any, score: Optional[float] = None, level: Optional[str] = None):
+        """Record one analysis; level is one of low/moderate/high when scored"""
+        day = parse_day(timestamp)
+        if day is None:
+            return
+        for granularity in GRANULARITIES:
+            bucket = self.buckets[granularity].setdefault(bucket_key(day, granularity), _empty_bucket())
+            bucket["analyses"] += 1
+            if score is not None:
+                bucket["scored"] += 1
+                bucket["score_sum"] += score
+                if level in ("low", "moderate", "high"):
+                    bucket[level] += 1
+
+    def merge(self, other: "RollupStore"):
+        for granularity in GRANULARITIES:
+            mine = self.buckets[granularity]
+            for key, bucket in other.buckets[granularity].items():
+                _add_bucket(mine.setdefault(key, _empty_bucket()), bucket)
+
+    def count(self, granularity: str, key: str) -> int:
+        return int(self.buckets[granularity].get(key, {}).get("analyses", 0))
+
+    def series(self, granularity: str = "month", start: Optional[date] = None,
+               end: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Buckets of one granularity overlapping [start, end], in time order"""
+        low = bucket_key(start, granularity) if start else None
+        high = bucket_key(end, granularity) if end else None
+        rows = []
+        for key in sorted(self.buckets[granularity]):
+            if (low and key < low) or (high and key > high):
+                continue
+            rows.append(_present(key, self.buckets[granularity][key]))
+        return rows
+
+    def totals(self, start: date, end: date) -> Dict[str, Any]:
+        """
+        Exact totals for [start, end], tiling the range with the coarsest
+        buckets that fit (whole months, then whole ISO weeks, then days)
+        """
+        total = _empty_bucket()
+        buckets_read = 0
+        cursor = start
+        while cursor <= end:
+            if cursor.day == 1 and _month_end(cursor) <= end:
+                granularity, step_end = "month", _month_end(cursor)
+            elif cursor.weekday() == 0 and cursor + timedelta(days=6) <= end:
+                granularity, step_end = "week", cursor + timedelta(days=6)
+            else:
+                granularity, step_end = "day", cursor
+            bucket = self.buckets[granularity].get(bucket_key(cursor, granularity))
+            if bucket:
+                _add_bucket(total, bucket)
+            buckets_read += 1
+            cursor = step_end + timedelta(days=1)
+        result = _present(f"{start.isoformat()}..{end.isoformat()}", total)
+        result["buckets_read"] = buckets_read
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.buckets
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RollupStore":
+        store = cls()
+        for granularity in GRANULARITIES:
+            store.buckets[granularity] = dict(data.get(granularity, {}))
+        return store
+
+
+def _present(period: str, bucket: Dict[str, float]) -> Dict[str, Any]:
+    scored = bucket.get("scored", 0)
+    return {
+        "period": period,
+        "analyses": int(bucket.get("analyses", 0)),
+        "avg_risk_score": round(bucket.get("score_sum", 0) / scored, 1) if scored else 0,
+        "risk_distribution": {
+            "low": int(bucket.get("low", 0)),
+            "moderate": int(bucket.get("moderate", 0)),
+            "high": int(bucket.get("high", 0))
+        }
+    }
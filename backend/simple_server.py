@@ -12,6 +12,8 @@ import json
 from pathlib import Path
 from datetime import datetime
 
+from summary_stats import PatientSummary
+
 # Create FastAPI app
 app = FastAPI(title="PolyRisk AI Simple Server", version="1.0.0")
 
@@ -126,25 +128,21 @@ def get_patients():
 def get_stats():
     try:
         all_data = load_data()
-        total_patients = len(all_data["patients"])
-        
-        # Calculate some basic stats
-        polypharmacy_count = 0
-        total_age = 0
         
+        # All patient stats in one pass
+        summary = PatientSummary()
         for patient in all_data["patients"]:
-            if patient["data"]["patient_data"]["polypharmacy_risk"]:
-                polypharmacy_count += 1
-            total_age += patient["data"]["patient_data"]["age"]
-        
-        avg_age = total_age / total_patients if total_patients > 0 else 0
+            summary.add_patient(patient["data"]["patient_data"])
         
         return {
             "status": "success",
             "statistics": {
-                "total_patients": total_patients,
-                "polypharmacy_cases": polypharmacy_count,
-                "average_age": round(avg_age, 1),
+                "total_patients": summary.total,
+                "polypharmacy_cases": summary.polypharmacy,
+                "average_age": round(summary.average_age, 1),
+                "age_groups": summary.age_groups.to_dict(),
+                "kidney_impairment": summary.kidney_impairment,
+                "liver_impairment": summary.liver_impairment,
                 "file_exists": FILE_PATH.exists(),
                 "file_size_kb": round(FILE_PATH.stat().st_size / 1024, 2) if FILE_PATH.exists() else 0
             }
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Single-Flight Request Coalescing
+Concurrent callers of the same expensive computation share one in-flight
+execution instead of each recomputing it
+"""
+
+import asyncio
+import contextvars
+import functools
+from typing import Dict, Any, Callable
+
+from profiling import call_profiled
+
+
+class SingleFlight:
+    """
+    Run a blocking function once per key at a time (in the default thread
+    pool) and hand its result, or its exception, to every concurrent caller
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.waiting = 0
+
+    async def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            # Run in the caller's context so per-request timers see the work
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(None, functools.partial(context.run, call_profiled, fn, *args, **kwargs))
+            self._inflight[key] = future
+            self.executions += 1
+            # Forget the key when the work finishes, even if every caller went away
+            future.add_done_callback(lambda _, key=key, future=future: self._forget(key, future))
+        else:
+            self.coalesced += 1
+
+        self.waiting += 1
+        try:
+            # shield: one caller disconnecting must not cancel the shared work
+            return await asyncio.shield(future)
+        finally:
+            self.waiting -= 1
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight(),
+            "waiting": self.waiting
+        }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Streaming Aggregation
+Constant-memory building blocks for analytics over an unbounded stream:
+a top-k heap, single-pass bucket counters and a mergeable quantile sketch
+"""
+
+import heapq
+import itertools
+import math
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+
+class TopK:
+    """The k largest items by key, kept in a fixed-size min-heap"""
+
+    def __init__(self, k: int, key: Callable[[Any], Any]):
+        self.k = k
+        self.key = key
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+
+    def push(self, item: Any):
+        # The counter breaks ties so items themselves are never compared
+        entry = (self.key(item), next(self._counter), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.push(item)
+
+    def merge(self, other: "TopK"):
+        self.extend(other.items())
+
+    def items(self) -> List[Any]:
+        """Items ordered from largest to smallest key"""
+        return [entry[2] for entry in sorted(self._heap, key=lambda e: (e[0], e[1]), reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class BucketCounter:
+    """Counts values into named buckets in a single pass"""
+
+    def __init__(self, labels: List[str], classify: Callable[[Any], Optional[str]]):
+        self.classify = classify
+        self.counts: Dict[str, int] = {label: 0 for label in labels}
+
+    def add(self, value: Any, count: int = 1):
+        label = self.classify(value)
+        if label is not None:
+            self.counts[label] = self.counts.get(label, 0) + count
+
+    def merge(self, other: "BucketCounter"):
+        for label, count in other.counts.items():
+            self.counts[label] = self.counts.get(label, 0) + count
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def load(self, counts: Dict[str, int]):
+        for label, count in counts.items():
+            self.counts[label] = count
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch style).
+    Positive values fall into logarithmic bins, so the number of bins depends
+    on the value range, not on how many values were added.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value is None:
+            return
+        self.count += count
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-quantile (0 <= q <= 1); None when empty"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Midpoint of the bin (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self.gamma ** index / (1 + self.gamma)
+        return 2 * self.gamma ** max(self.bins) / (1 + self.gamma)
+
+    def percentiles(self, points=(50, 90, 99), digits: int = 1) -> Dict[str, Optional[float]]:
+        result = {}
+        for point in points:
+            value = self.quantile(point / 100)
+            result[f"p{point}"] = round(value, digits) if value is not None else None
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "bins": {str(index): count for index, count in self.bins.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data.get("relative_accuracy", 0.01))
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.bins = {int(index): count for index, count in data.get("bins", {}).items()}
+        return sketch
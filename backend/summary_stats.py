@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+PolyRisk AI - Patient Summary Statistics
+One aggregator for the cohort summary (risk levels, polypharmacy, age groups,
+organ impairment, average age), filled in a single pass and mergeable across
+partitions. Shared by analyze_patients.py and the /stats endpoints.
+"""
+
+from typing import Dict, Any, Optional
+
+from streaming_stats import BucketCounter
+
+RISK_LEVELS = ["low", "moderate", "high"]
+AGE_GROUPS = ["Under 60", "60-69", "70-79", "80+"]
+POLYPHARMACY_THRESHOLD = 5
+
+
+def age_group(age: float) -> str:
+    if age < 60:
+        return "Under 60"
+    if age < 70:
+        return "60-69"
+    if age < 80:
+        return "70-79"
+    return "80+"
+
+
+def _risk_level(level: Optional[str]) -> Optional[str]:
+    return level
+
+
+def is_impaired(function: Optional[str]) -> bool:
+    return str(function or "normal").lower() != "normal"
+
+
+class PatientSummary:
+    """Counts and sums only, so memory stays constant however many patients are added"""
+
+    def __init__(self):
+        self.total = 0
+        self.age_sum = 0.0
+        self.polypharmacy = 0
+        self.kidney_impairment = 0
+        self.liver_impairment = 0
+        self.risk_levels = BucketCounter(RISK_LEVELS, _risk_level)
+        self.age_groups = BucketCounter(AGE_GROUPS, age_group)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def add(self, age: float, kidney_function: Optional[str], liver_function: Optional[str],
+            polypharmacy: bool, risk_level: Optional[str] = None):
+        self.total += 1
+        self.age_sum += age
+        self.age_groups.add(age)
+        self.risk_levels.add(risk_level)
+        self.polypharmacy += 1 if polypharmacy else 0
+        self.kidney_impairment += 1 if is_impaired(kidney_function) else 0
+        self.liver_impairment += 1 if is_impaired(liver_function) else 0
+
+    def add_result(self, result: Dict[str, Any]):
+        """A result entry from analyze_patients (scored, so the risk level is known)"""
+        risk_analysis = result['risk_analysis']
+        self.add(result['age'], result['kidney_function'], result['liver_function'],
+                 risk_analysis['polypharmacy_risk'], risk_analysis['risk_level'])
+
+    def add_patient(self, patient_data: Dict[str, Any]):
+        """Saved patient_data as the API stores it (polypharmacy flag as submitted)"""
+        polypharmacy = patient_data.get('polypharmacy_risk')
+        if polypharmacy is None:
+            polypharmacy = len(patient_data.get('medications', [])) >= POLYPHARMACY_THRESHOLD
+        self.add(patient_data.get('age', 0), patient_data.get('kidney_function'),
+                 patient_data.get('liver_function'), polypharmacy)
+
+    def merge(self, other: "PatientSummary"):
+        """Add another partition's summary (e.g. a worker's chunk) into this one"""
+        self.total += other.total
+        self.age_sum += other.age_sum
+        self.polypharmacy += other.polypharmacy
+        self.kidney_impairment += other.kidney_impairment
+        self.liver_impairment += other.liver_impairment
+        self.risk_levels.merge(other.risk_levels)
+        self.age_groups.merge(other.age_groups)
+
+    @property
+    def average_age(self) -> float:
+        return self.age_sum / self.total if self.total else 0
+
+    def percent(self, count: int) -> float:
+        return count / self.total * 100 if self.total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'total': self.total,
+            'risk_levels': self.risk_levels.to_dict(),
+            'polypharmacy': self.polypharmacy,
+            'age_groups': self.age_groups.to_dict(),
+            'kidney_impairment': self.kidney_impairment,
+            'liver_impairment': self.liver_impairment,
+            'average_age': round(self.average_age, 1)
+        }